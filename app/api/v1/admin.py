@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Query, status
+from app.db.session import db
+from app.db.queries import query_registry, statement_cache
+from app.db.slow_queries import slow_query_log
+from app.core.events import dispatcher
+from app.core.invalidation import invalidation_bus
+from app.core.scheduler import scheduler
+from app.core.message_stream import message_hub
+
+router = APIRouter(prefix="/admin", tags=["Администрирование"])
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=100, description="Количество отпечатков"),
+    order_by: str = Query(
+        "total",
+        pattern="^(total|max|p95|avg|count)$",
+        description="Сортировка: total, max, p95, avg, count"
+    ),
+):
+    """Топ запросов по отпечаткам SQL с примерами параметров худших выполнений"""
+    return {
+        **slow_query_log.summary(),
+        "queries": slow_query_log.top(limit, order_by)
+    }
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_slow_queries():
+    """Сброс накопленной статистики запросов"""
+    slow_query_log.reset()
+    return None
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    """Состояние пулов соединений: размер, занятые, ожидание и таймауты"""
+    return db.pool_stats()
+
+
+@router.get("/replica")
+async def get_replica_status():
+    """Состояние реплики для чтения: доступность и отставание"""
+    return db.replica_status()
+
+
+@router.get("/statements")
+async def get_statement_stats():
+    """Кэш подготовленных выражений: оценка попаданий и формы запросов"""
+    return {
+        "statement_cache": statement_cache.stats(),
+        "query_shapes": query_registry.stats()
+    }
+
+
+@router.get("/outbox")
+async def get_outbox_stats():
+    """Очередь outbox: необработанные события, отставание доставки и ошибки"""
+    return await dispatcher.stats()
+
+
+@router.get("/caches")
+async def get_cache_stats():
+    """Локальные кэши воркера и шина инвалидации: попадания, сброс, состояние LISTEN"""
+    return invalidation_bus.stats()
+
+
+@router.get("/jobs")
+async def get_jobs_status():
+    """Периодические задачи: расписание, последний запуск, длительность и ошибка"""
+    return {"runner": scheduler.runner, "jobs": await scheduler.status()}
+
+
+@router.get("/streams")
+async def get_stream_stats():
+    """Push-подключения этого воркера: пользователи, соединения, доставлено и переполнения очередей"""
+    return message_hub.stats()
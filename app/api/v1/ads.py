@@ -1,14 +1,73 @@
-from fastapi import APIRouter, HTTPException, status, Query, Path, Body
+from fastapi import APIRouter, HTTPException, status, Query, Path, Body, Depends
+from fastapi.responses import StreamingResponse
 from uuid import UUID
 from typing import List, Optional
-from app.db.session import db
+from app.db.session import (
+    db, get_transaction, get_read_connection, connection_scope, RequestConnection)
+from app.db.queries import QueryBuilder, json_array_query
+from app.config import settings
+from app.core.serialization import FastJSONResponse, dumps
+from app.core.invalidation import invalidation_bus
+from app.core.singleflight import SWRCache
 from app.schemas.ad import AdCreate, AdUpdate, AdOut, AdStatisticsResponse
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+import csv
+import io
 
 router = APIRouter(prefix="/ads", tags=["Объявления"])
 
 
+ad_statistics_cache = invalidation_bus.register(SWRCache(
+    "ad_statistics", settings.STATISTICS_FRESH_TTL, settings.STATISTICS_STALE_TTL,
+    entity="ad"))
+
+
+async def load_ad_statistics(ad_id: UUID) -> Optional[AdStatisticsResponse]:
+    query = """
+    SELECT
+        ad_id, title, price, currency, created_at, moderation_status, is_active,
+        views_count, total_views, unique_viewers, mobile_views, pc_views,
+        total_messages, unique_senders, unread_messages,
+        favorites_count,
+        total_reports, pending_reports, resolved_reports, rejected_reports,
+        category_name, city, owner_username, owner_is_banned
+    FROM ad_full_statistics
+    WHERE ad_id = $1
+    """
+
+    result = await db.fetchrow_read(query, ad_id)
+
+    if not result:
+        return None
+
+    return AdStatisticsResponse(
+        ad_id=result["ad_id"],
+        title=result["title"],
+        price=float(result["price"]),
+        currency=result["currency"],
+        created_at=str(result["created_at"]),
+        moderation_status=result["moderation_status"],
+        is_active=result["is_active"],
+        views_count=result["views_count"],
+        total_views=result["total_views"],
+        unique_viewers=result["unique_viewers"],
+        mobile_views=result["mobile_views"],
+        pc_views=result["pc_views"],
+        total_messages=result["total_messages"],
+        unique_senders=result["unique_senders"],
+        unread_messages=result["unread_messages"],
+        favorites_count=result["favorites_count"],
+        total_reports=result["total_reports"],
+        pending_reports=result["pending_reports"],
+        resolved_reports=result["resolved_reports"],
+        rejected_reports=result["rejected_reports"],
+        category_name=result["category_name"],
+        city=result["city"],
+        owner_username=result["owner_username"],
+        owner_is_banned=result["owner_is_banned"]
+    )
+
+
 @router.get("/{ad_id}/statistics", response_model=AdStatisticsResponse)
 async def get_ad_statistics(
     ad_id: UUID = Path(..., description="ID Объявления")
@@ -17,52 +76,14 @@ async def get_ad_statistics(
     Получение полной статистики по объявлению
     """
     try:
-        query = """
-        SELECT
-            ad_id, title, price, currency, created_at, moderation_status, is_active,
-            views_count, total_views, unique_viewers, mobile_views, pc_views,
-            total_messages, unique_senders, unread_messages,
-            favorites_count,
-            total_reports, pending_reports, resolved_reports, rejected_reports,
-            category_name, city, owner_username, owner_is_banned
-        FROM ad_full_statistics
-        WHERE ad_id = $1
-        """
-
-        result = await db.fetchrow(query, str(ad_id))
-
-        if not result:
+        statistics = await ad_statistics_cache.get(
+            str(ad_id), lambda: load_ad_statistics(ad_id))
+        if statistics is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Статистика для объявления не найдена"
             )
-
-        return AdStatisticsResponse(
-            ad_id=result["ad_id"],
-            title=result["title"],
-            price=float(result["price"]),
-            currency=result["currency"],
-            created_at=str(result["created_at"]),
-            moderation_status=result["moderation_status"],
-            is_active=result["is_active"],
-            views_count=result["views_count"],
-            total_views=result["total_views"],
-            unique_viewers=result["unique_viewers"],
-            mobile_views=result["mobile_views"],
-            pc_views=result["pc_views"],
-            total_messages=result["total_messages"],
-            unique_senders=result["unique_senders"],
-            unread_messages=result["unread_messages"],
-            favorites_count=result["favorites_count"],
-            total_reports=result["total_reports"],
-            pending_reports=result["pending_reports"],
-            resolved_reports=result["resolved_reports"],
-            rejected_reports=result["rejected_reports"],
-            category_name=result["category_name"],
-            city=result["city"],
-            owner_username=result["owner_username"],
-            owner_is_banned=result["owner_is_banned"]
-        )
+        return statistics
 
     except HTTPException:
         raise
@@ -80,12 +101,13 @@ async def get_ad_statistics(
 async def create_ad(
     ad: AdCreate = Body(..., description="Данные нового объявления"),
     user_id: UUID = Query(..., description="ID владельца объявления"),
+    conn: RequestConnection = Depends(get_transaction, scope="function"),
 ):
     """Создание нового объявления"""
 
-    user_exists = await db.fetchrow(
+    user_exists = await conn.fetchrow(
         "SELECT id FROM users WHERE id = $1",
-        str(user_id)
+        user_id
     )
     if not user_exists:
         raise HTTPException(
@@ -93,7 +115,7 @@ async def create_ad(
             detail="Пользователь не найден"
         )
 
-    category_exists = await db.fetchrow(
+    category_exists = await conn.fetchrow(
         "SELECT id FROM categories WHERE id = $1",
         ad.category_id
     )
@@ -103,7 +125,7 @@ async def create_ad(
             detail="Категория не найдена"
         )
 
-    location_exists = await db.fetchrow(
+    location_exists = await conn.fetchrow(
         "SELECT id FROM locations WHERE id = $1",
         ad.location_id
     )
@@ -125,7 +147,7 @@ async def create_ad(
     """
 
     params = (
-        str(user_id),
+        user_id,
         ad.category_id,
         ad.location_id,
         ad.title,
@@ -138,17 +160,18 @@ async def create_ad(
     )
 
     try:
-        new_ad = await db.fetchrow(query, *params)
+        new_ad = await conn.fetchrow(query, *params)
 
         if ad.tag_ids:
-            for tag_id in ad.tag_ids:
-                await db.execute(
-                    "INSERT INTO ad_tags (ad_id, tag_id) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-                    str(new_ad["id"]), tag_id
-                )
+            await conn.execute(
+                "INSERT INTO ad_tags (ad_id, tag_id) SELECT $1, unnest($2::int[]) ON CONFLICT DO NOTHING",
+                new_ad["id"], ad.tag_ids
+            )
 
-        full_ad = await get_full_ad_info(new_ad["id"])
+        full_ad = await get_full_ad_info(new_ad["id"], conn)
         return full_ad
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -156,7 +179,7 @@ async def create_ad(
         )
 
 
-async def get_full_ad_info(ad_id: UUID):
+async def get_full_ad_info(ad_id: UUID, conn=db):
     """Получение полной информации об объявлении"""
 
     query = """
@@ -179,51 +202,166 @@ async def get_full_ad_info(ad_id: UUID):
     GROUP BY a.id, c.id, l.id, u.id
     """
 
-    result = await db.fetchrow(query, str(ad_id))
+    result = await conn.fetchrow(query, ad_id)
     if not result:
         return None
 
-    return await build_ad_from_row(result)
+    return build_ad_from_row(result)
 
 
-async def build_ad_from_row(row):
-    """Преобразование строки из БД в формат AdOut"""
-    ad_data = dict(row)
-
-    # Категория
-    ad_data["category"] = {
-        "id": row["category_id"],
-        "name": row["category_name"],
-        "slug": row["category_slug"]
+def build_ad_from_row(row) -> dict:
+    """
+    Преобразование строки из БД в формат AdOut.
+    Ключи и типы совпадают с тем, что отдаёт сама схема AdOut,
+    поэтому результат можно сериализовать без повторной валидации.
+    """
+    return {
+        "title": row["title"],
+        "description": row["description"],
+        "price": float(row["price"]),
+        "currency": row["currency"],
+        "category_id": row["category_id"],
+        "location_id": row["location_id"],
+        "moderation_status": row["moderation_status"],
+        "is_active": row["is_active"],
+        "image_urls": row["image_urls"],
+        "id": row["id"],
+        "user_id": row["user_id"],
+        "created_at": row["created_at"],
+        "views_count": row["views_count"],
+        "category": {
+            "id": row["category_id"],
+            "name": row["category_name"],
+            "slug": row["category_slug"]
+        },
+        "location": {
+            "id": row["location_id"],
+            "city": row["city"],
+            "district": row["district"],
+            "street": row["street"],
+            "building": row["building"]
+        },
+        "tags": row["tags"] or [],
+        "owner": {
+            "id": row["user_id"],
+            "username": row["owner_username"],
+            "avatar_url": row["owner_avatar"]
+        },
     }
 
-    # Локация
-    ad_data["location"] = {
-        "id": row["location_id"],
-        "city": row["city"],
-        "district": row["district"],
-        "street": row["street"],
-        "building": row["building"]
-    }
 
-    # Владелец
-    ad_data["owner"] = {
-        "id": row["user_id"],
-        "username": row["owner_username"],
-        "avatar_url": row["owner_avatar"]
-    }
+ADS_LIST_QUERY = """
+SELECT
+    a.id, a.user_id, a.category_id, a.location_id, a.title, a.description,
+    a.price, a.currency, a.created_at, a.moderation_status, a.is_active,
+    a.views_count, a.image_urls,
+    c.name as category_name, c.slug as category_slug,
+    l.city, l.district, l.street, l.building,
+    u.username as owner_username, u.avatar_url as owner_avatar,
+    COALESCE(array_to_json(array_agg(DISTINCT jsonb_build_object('id', t.id, 'name', t.name, 'slug', t.slug))
+        FILTER (WHERE t.id IS NOT NULL)), '[]'::json) as tags
+FROM ads a
+JOIN categories c ON c.id = a.category_id
+JOIN locations l ON l.id = a.location_id
+JOIN users u ON u.id = a.user_id
+LEFT JOIN ad_tags at ON at.ad_id = a.id
+LEFT JOIN tags t ON t.id = at.tag_id"""
+
+# Документ AdOut, собираемый в базе (тот же порядок и форма ключей, что у build_ad_from_row)
+AD_JSON_DOCUMENT = """json_build_object(
+    'title', q.title, 'description', q.description, 'price', api_float(q.price),
+    'currency', q.currency, 'category_id', q.category_id, 'location_id', q.location_id,
+    'moderation_status', q.moderation_status, 'is_active', q.is_active,
+    'image_urls', q.image_urls, 'id', q.id, 'user_id', q.user_id,
+    'created_at', api_timestamp(q.created_at), 'views_count', q.views_count,
+    'category', json_build_object('id', q.category_id, 'name', q.category_name, 'slug', q.category_slug),
+    'location', json_build_object('id', q.location_id, 'city', q.city, 'district', q.district,
+                                  'street', q.street, 'building', q.building),
+    'tags', q.tags,
+    'owner', json_build_object('id', q.user_id, 'username', q.owner_username, 'avatar_url', q.owner_avatar)
+)"""
+
+ADS_SORT_MAPPING = {
+    "price_asc": "ORDER BY a.price ASC",
+    "price_desc": "ORDER BY a.price DESC",
+    "newest": "ORDER BY a.created_at DESC",
+    "oldest": "ORDER BY a.created_at ASC",
+    "views": "ORDER BY a.views_count DESC",
+    "favorites": "ORDER BY a.favorites_count DESC, a.created_at DESC"
+}
+
+
+def apply_ads_filters(
+    qb: QueryBuilder,
+    is_active: bool,
+    moderation_status: str,
+    search: Optional[str] = None,
+    category_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_views: Optional[int] = None,
+    owner_id: Optional[UUID] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    city: Optional[str] = None,
+    has_images: Optional[bool] = None,
+    tag_ids: Optional[List[int]] = None,
+):
+    """Фильтры списка объявлений в фиксированном порядке"""
+    qb.where("a.is_active = {}", is_active)
+    qb.where("a.moderation_status = {}", moderation_status)
+
+    if search and len(search.strip()) >= 3:
+        qb.where(
+            "(a.title % {0} OR a.description % {0} OR EXISTS ("
+            "  SELECT 1 FROM ad_tags at2 "
+            "  JOIN tags t2 ON t2.id = at2.tag_id "
+            "  WHERE at2.ad_id = a.id AND t2.name % {0}"
+            "))",
+            f"%{search.strip()}%"
+        )
 
-    # Теги
-    tags_json = row["tags"]
-    try:
-        ad_data["tags"] = json.loads(tags_json) if tags_json else []
-    except (json.JSONDecodeError, TypeError):
-        ad_data["tags"] = []
+    if category_id is not None:
+        qb.where("a.category_id = {}", category_id)
 
-    return ad_data
+    if min_price is not None:
+        qb.where("a.price >= {}::numeric", float(min_price))
 
+    if max_price is not None:
+        qb.where("a.price <= {}::numeric", float(max_price))
 
-@router.get("/", response_model=List[AdOut])
+    if min_views is not None:
+        qb.where("a.views_count >= {}", min_views)
+
+    if owner_id is not None:
+        qb.where("a.user_id = {}::uuid", owner_id)
+
+    if created_after:
+        qb.where("a.created_at >= {}", created_after)
+
+    if created_before:
+        qb.where("a.created_at <= {}", created_before)
+
+    if city:
+        qb.where("LOWER(l.city) % {}", city.strip().lower())
+
+    if has_images is not None:
+        if has_images:
+            qb.where(
+                "(a.image_urls IS NOT NULL AND a.image_urls != '' AND a.image_urls != '[]')")
+        else:
+            qb.where(
+                "(a.image_urls IS NULL OR a.image_urls = '' OR a.image_urls = '[]')")
+
+    if tag_ids:
+        qb.where(
+            "a.id IN (SELECT ad_id FROM ad_tags WHERE tag_id = ANY({}) "
+            "GROUP BY ad_id HAVING COUNT(DISTINCT tag_id) = {})",
+            tag_ids, len(tag_ids)
+        )
+
+
+@router.get("/", response_model=List[AdOut], response_class=FastJSONResponse)
 async def get_ads(
     skip: int = Query(0, ge=0, alias="skip",
                       description="Пропустить N записей"),
@@ -248,8 +386,8 @@ async def get_ads(
         None, description="Поиск по заголовку/описанию"),
     sort_by: str = Query(
         "newest",
-        regex="^(price_asc|price_desc|newest|oldest|views)$",
-        description="Сортировка: price_asc, price_desc, newest, oldest, views"
+        regex="^(price_asc|price_desc|newest|oldest|views|favorites)$",
+        description="Сортировка: price_asc, price_desc, newest, oldest, views, favorites"
     ),
     moderation_status: str = Query(
         "APPROVED",
@@ -261,126 +399,254 @@ async def get_ads(
     """Получение списка объявлений с фильтрацией и поиском"""
 
     try:
-        query = """
-        SELECT
-            a.id, a.user_id, a.category_id, a.location_id, a.title, a.description,
-            a.price, a.currency, a.created_at, a.moderation_status, a.is_active,
-            a.views_count, a.image_urls,
-            c.name as category_name, c.slug as category_slug,
-            l.city, l.district, l.street, l.building,
-            u.username as owner_username, u.avatar_url as owner_avatar,
-            COALESCE(array_to_json(array_agg(DISTINCT jsonb_build_object('id', t.id, 'name', t.name, 'slug', t.slug))
-                FILTER (WHERE t.id IS NOT NULL)), '[]'::json) as tags
-        FROM ads a
-        JOIN categories c ON c.id = a.category_id
-        JOIN locations l ON l.id = a.location_id
-        JOIN users u ON u.id = a.user_id
-        LEFT JOIN ad_tags at ON at.ad_id = a.id
-        LEFT JOIN tags t ON t.id = at.tag_id
-        """
-
-        where_conditions = []
-        params = []
-
-        where_conditions.append("a.is_active = $1")
-        params.append(is_active)
-
-        where_conditions.append("a.moderation_status = $2")
-        params.append(moderation_status)
-
-        if search and len(search.strip()) >= 3:
-            search_pattern = f"%{search.strip()}%"
-            pattern_param_index = len(params) + 1
-            params.append(search_pattern)
-
-            search_condition = (
-                f"(a.title % ${pattern_param_index} OR "
-                f"a.description % ${pattern_param_index} OR "
-                f"EXISTS ("
-                f"  SELECT 1 FROM ad_tags at2 "
-                f"  JOIN tags t2 ON t2.id = at2.tag_id "
-                f"  WHERE at2.ad_id = a.id AND t2.name % ${pattern_param_index}"
-                f"))"
-            )
-            where_conditions.append(search_condition)
+        qb = QueryBuilder("ads.list", ADS_LIST_QUERY)
+        apply_ads_filters(
+            qb,
+            is_active=is_active,
+            moderation_status=moderation_status,
+            search=search,
+            category_id=category_id,
+            min_price=min_price,
+            max_price=max_price,
+            min_views=min_views,
+            owner_id=owner_id,
+            created_after=created_after,
+            created_before=created_before,
+            city=city,
+            has_images=has_images,
+            tag_ids=tag_ids,
+        )
+        query, params = qb.select(
+            "GROUP BY a.id, c.id, l.id, u.id\n"
+            + ADS_SORT_MAPPING.get(sort_by, ADS_SORT_MAPPING["newest"])
+            + "\nLIMIT {} OFFSET {}",
+            limit, skip
+        )
 
-        if category_id is not None:
-            where_conditions.append(f"a.category_id = ${len(params) + 1}")
-            params.append(category_id)
+        if settings.DB_JSON_RENDERING:
+            body = await db.fetchval_read(
+                json_array_query(query, AD_JSON_DOCUMENT), *params)
+            return FastJSONResponse(body)
 
-        if min_price is not None:
-            where_conditions.append(f"a.price >= ${len(params) + 1}::numeric")
-            params.append(float(min_price))
+        ads = await db.fetch_read(query, *params)
+        return FastJSONResponse([build_ad_from_row(ad) for ad in ads])
 
-        if max_price is not None:
-            where_conditions.append(f"a.price <= ${len(params) + 1}::numeric")
-            params.append(float(max_price))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Ошибка при получении объявлений: {str(e)}"
+        )
 
-        if min_views is not None:
-            where_conditions.append(f"a.views_count >= ${len(params) + 1}")
-            params.append(min_views)
 
-        if owner_id is not None:
-            where_conditions.append(f"a.user_id = ${len(params) + 1}::uuid")
-            params.append(str(owner_id))
+EXPORT_CSV_COLUMNS = (
+    "id", "user_id", "title", "description", "price", "currency",
+    "category_id", "category_slug", "location_id", "city", "district",
+    "moderation_status", "is_active", "views_count", "image_urls",
+    "created_at", "owner_username", "tags"
+)
 
-        if created_after:
-            where_conditions.append(f"a.created_at >= ${len(params) + 1}")
-            params.append(created_after)
 
-        if created_before:
-            where_conditions.append(f"a.created_at <= ${len(params) + 1}")
-            params.append(created_before)
+def ad_csv_row(row) -> list:
+    """Плоская строка CSV для выгрузки"""
+    return [
+        row["id"], row["user_id"], row["title"], row["description"],
+        row["price"], row["currency"], row["category_id"], row["category_slug"],
+        row["location_id"], row["city"], row["district"],
+        row["moderation_status"], "true" if row["is_active"] else "false", row["views_count"],
+        row["image_urls"], row["created_at"].isoformat(), row["owner_username"],
+        ";".join(tag["slug"] for tag in row["tags"] or [])
+    ]
 
-        if city:
-            where_conditions.append(f"LOWER(l.city) % ${len(params) + 1}")
-            params.append(city.strip().lower())
 
-        if has_images is not None:
-            if has_images:
-                where_conditions.append(
-                    "(a.image_urls IS NOT NULL AND a.image_urls != '' AND a.image_urls != '[]')")
+async def stream_ads_export(query: str, params: list, export_format: str):
+    """
+    Выгрузка через серверный курсор в read-only транзакции (реплика, если
+    доступна): строки читаются порциями по EXPORT_CURSOR_PREFETCH и сразу
+    отправляются клиенту, поэтому память не растёт с размером каталога.
+    """
+    batch_size = settings.EXPORT_CURSOR_PREFETCH
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    chunk = []
+
+    if export_format == "csv":
+        writer.writerow(EXPORT_CSV_COLUMNS)
+
+    async with connection_scope(transaction=True, read_only=True) as conn:
+        async for row in conn.iterate(query, *params, prefetch=batch_size):
+            if export_format == "csv":
+                writer.writerow(ad_csv_row(row))
             else:
-                where_conditions.append(
-                    "(a.image_urls IS NULL OR a.image_urls = '' OR a.image_urls = '[]')")
-
-        if tag_ids:
-            where_conditions.append(
-                f"a.id IN (SELECT ad_id FROM ad_tags WHERE tag_id = ANY(${len(params) + 1}) "
-                f"GROUP BY ad_id HAVING COUNT(DISTINCT tag_id) = ${len(params) + 2})"
-            )
-            params.append(tag_ids)
-            params.append(len(tag_ids))
-
-        if where_conditions:
-            query += "\nWHERE " + " AND ".join(where_conditions)
+                chunk.append(dumps(build_ad_from_row(row)))
+
+            if len(chunk) >= batch_size or buffer.tell() >= 1 << 16:
+                yield b"\n".join(chunk) + b"\n" if chunk else buffer.getvalue().encode()
+                chunk.clear()
+                buffer.seek(0)
+                buffer.truncate()
+
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+    elif buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+@router.get("/export")
+async def export_ads(
+    export_format: str = Query(
+        "ndjson", alias="format", pattern="^(ndjson|csv)$",
+        description="Формат выгрузки: ndjson или csv"),
+    since: Optional[datetime] = Query(
+        None, description="Только объявления, созданные или изменённые после этого момента"),
+    category_id: Optional[int] = Query(
+        None, description="Фильтр по ID категории"),
+    min_price: Optional[float] = Query(None, ge=0, description="Мин. цена"),
+    max_price: Optional[float] = Query(None, ge=0, description="Макс. цена"),
+    city: Optional[str] = Query(None, description="Фильтр по городу"),
+    tag_ids: Optional[List[int]] = Query(None, description="Список ID тегов"),
+    min_views: Optional[int] = Query(
+        None, ge=0, description="Мин. число просмотров"),
+    created_after: Optional[datetime] = Query(
+        None, description="Создано после"),
+    created_before: Optional[datetime] = Query(
+        None, description="Создано до"),
+    has_images: Optional[bool] = Query(None, description="Только с фото"),
+    owner_id: Optional[UUID] = Query(
+        None, description="Фильтр по ID владельца"),
+    search: Optional[str] = Query(
+        None, description="Поиск по заголовку/описанию"),
+    moderation_status: str = Query(
+        "APPROVED",
+        regex="^(PENDING|APPROVED|REJECTED)$",
+        description="Статус модерации"
+    ),
+    is_active: bool = Query(True, description="Только активные объявления"),
+):
+    """
+    Потоковая выгрузка всех объявлений по фильтрам GET /ads в NDJSON или CSV.
+    Для инкрементальной выгрузки передайте since — время предыдущей выгрузки.
+    """
+    qb = QueryBuilder("ads.export", ADS_LIST_QUERY)
+    apply_ads_filters(
+        qb,
+        is_active=is_active,
+        moderation_status=moderation_status,
+        search=search,
+        category_id=category_id,
+        min_price=min_price,
+        max_price=max_price,
+        min_views=min_views,
+        owner_id=owner_id,
+        created_after=created_after,
+        created_before=created_before,
+        city=city,
+        has_images=has_images,
+        tag_ids=tag_ids,
+    )
+    if since is not None:
+        qb.where(
+            "(a.created_at > {0} OR EXISTS ("
+            "SELECT 1 FROM ad_audit_log al WHERE al.ad_id = a.id "
+            "AND al.changed_at > {0} AND al.action <> 'VIEWS_INCREMENTED'))",
+            since
+        )
+    query, params = qb.select(
+        "GROUP BY a.id, c.id, l.id, u.id\nORDER BY a.created_at, a.id")
+
+    media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+    filename = f"ads-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{export_format}"
+    return StreamingResponse(
+        stream_ads_export(query, params, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-        query += "\nGROUP BY a.id, c.id, l.id, u.id"
 
-        sort_mapping = {
-            "price_asc": "ORDER BY a.price ASC",
-            "price_desc": "ORDER BY a.price DESC",
-            "newest": "ORDER BY a.created_at DESC",
-            "oldest": "ORDER BY a.created_at ASC",
-            "views": "ORDER BY a.views_count DESC"
-        }
-        query += "\n" + sort_mapping.get(sort_by, "ORDER BY a.created_at DESC")
+CHANGES_QUERY = """
+SELECT l.id, l.txid::text AS txid, l.ad_id, l.action, l.changed_at
+FROM ad_audit_log l
+WHERE (l.txid, l.id) > ($1::text::xid8, $2::int)
+  AND l.txid < pg_snapshot_xmin(pg_current_snapshot())
+  AND l.action <> 'VIEWS_INCREMENTED'
+ORDER BY l.txid, l.id
+LIMIT $3
+"""
 
-        query += f"\nLIMIT ${len(params) + 1} OFFSET ${len(params) + 2}"
-        params.extend([limit, skip])
 
-        ads = await db.fetch(query, *params)
+def parse_change_cursor(cursor: Optional[str]) -> tuple:
+    """Курсор ленты изменений: "<txid>-<id>" последней выданной записи журнала"""
+    if not cursor:
+        return "0", 0
+    txid, _, log_id = cursor.partition("-")
+    if not (txid.isdigit() and log_id.isdigit()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
+    return txid, int(log_id)
 
-        result = []
-        for ad in ads:
-            result.append(await build_ad_from_row(ad))
 
-        return result
+@router.get("/changes")
+async def get_ad_changes(
+    cursor: Optional[str] = Query(
+        None, description="Курсор из next_cursor предыдущего ответа; без него — с начала журнала"),
+    limit: int = Query(500, ge=1, le=1000,
+                       description="Макс. число записей журнала за запрос"),
+    conn: RequestConnection = Depends(get_read_connection, scope="function"),
+):
+    """
+    Лента изменений объявлений в порядке фиксации транзакций.
+    Записи выдаются только из транзакций старше самой старой активной,
+    поэтому курсор не перепрыгивает через ещё не зафиксированные изменения.
+    Несколько изменений одного объявления в пачке сворачиваются в одно:
+    upsert с текущим состоянием или delete (tombstone), если объявления уже нет.
+    """
+    txid, log_id = parse_change_cursor(cursor)
 
+    try:
+        entries = await conn.fetch(CHANGES_QUERY, txid, log_id, limit)
+        if not entries:
+            return FastJSONResponse({"changes": [], "next_cursor": cursor, "has_more": False})
+
+        # Последняя запись журнала по каждому объявлению
+        latest = {}
+        for entry in entries:
+            latest.pop(entry["ad_id"], None)
+            latest[entry["ad_id"]] = entry
+
+        rows = await conn.fetch(
+            ADS_LIST_QUERY + "\nWHERE a.id = ANY($1::uuid[])\nGROUP BY a.id, c.id, l.id, u.id",
+            list(latest)
+        )
+        ads_by_id = {row["id"]: row for row in rows}
+
+        changes = []
+        for ad_id, entry in latest.items():
+            row = ads_by_id.get(ad_id)
+            changes.append({
+                "op": "upsert" if row is not None else "delete",
+                "action": entry["action"],
+                "ad_id": ad_id,
+                "changed_at": entry["changed_at"],
+                "ad": build_ad_from_row(row) if row is not None else None,
+            })
+
+        last = entries[-1]
+        return FastJSONResponse({
+            "changes": changes,
+            "next_cursor": f"{last['txid']}-{last['id']}",
+            "has_more": len(entries) == limit,
+        })
+    except HTTPException:
+        raise
     except Exception as e:
+        import logging
+        logging.error(f"Ошибка при получении ленты изменений: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Ошибка при получении объявлений: {str(e)}"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при получении ленты изменений"
         )
 
 
@@ -409,7 +675,7 @@ async def get_ad(ad_id: UUID = Path(..., description="ID объявления"))
         GROUP BY a.id, c.id, l.id, u.id
         """
 
-        ad = await db.fetchrow(query, str(ad_id))
+        ad = await db.fetchrow_read(query, ad_id)
 
         if not ad:
             raise HTTPException(
@@ -417,13 +683,14 @@ async def get_ad(ad_id: UUID = Path(..., description="ID объявления"))
                 detail="Объявление не найдено"
             )
 
-        # счетчик просмотров
+        # счетчик просмотров (не закрепляет чтения клиента за мастером)
         await db.execute(
             "INSERT INTO views (ad_id, user_id) VALUES ($1, $2)",
-            str(ad_id), None
+            ad_id, None,
+            pin_reads=False
         )
 
-        return await build_ad_from_row(ad)
+        return build_ad_from_row(ad)
 
     except HTTPException:
         raise
@@ -439,12 +706,13 @@ async def update_ad(
     ad_id: UUID = Path(..., description="ID объявления"),
     ad: AdUpdate = Body(..., description="Данные для обновления объявления"),
     user_id: UUID = Query(..., description="ID пользователя (владельца)"),
+    conn: RequestConnection = Depends(get_transaction, scope="function"),
 ):
     """Обновление объявления"""
 
-    existing_ad = await db.fetchrow(
+    existing_ad = await conn.fetchrow(
         "SELECT id, user_id FROM ads WHERE id = $1",
-        str(ad_id)
+        ad_id
     )
     if not existing_ad:
         raise HTTPException(
@@ -452,32 +720,22 @@ async def update_ad(
             detail="Объявление не найдено"
         )
 
-    update_fields = []
-    params = []
-    param_count = 1
+    qb = QueryBuilder("ads.update")
 
     if ad.title:
-        update_fields.append(f"title = ${param_count}")
-        params.append(ad.title)
-        param_count += 1
+        qb.set("title", ad.title)
 
     if ad.description:
-        update_fields.append(f"description = ${param_count}")
-        params.append(ad.description)
-        param_count += 1
+        qb.set("description", ad.description)
 
     if ad.price:
-        update_fields.append(f"price = ${param_count}")
-        params.append(ad.price)
-        param_count += 1
+        qb.set("price", ad.price)
 
     if ad.currency:
-        update_fields.append(f"currency = ${param_count}")
-        params.append(ad.currency)
-        param_count += 1
+        qb.set("currency", ad.currency)
 
     if ad.category_id:
-        category_exists = await db.fetchrow(
+        category_exists = await conn.fetchrow(
             "SELECT id FROM categories WHERE id = $1",
             ad.category_id
         )
@@ -486,12 +744,10 @@ async def update_ad(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Категория не найдена"
             )
-        update_fields.append(f"category_id = ${param_count}")
-        params.append(ad.category_id)
-        param_count += 1
+        qb.set("category_id", ad.category_id)
 
     if ad.location_id:
-        location_exists = await db.fetchrow(
+        location_exists = await conn.fetchrow(
             "SELECT id FROM locations WHERE id = $1",
             ad.location_id
         )
@@ -500,41 +756,27 @@ async def update_ad(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Локация не найдена"
             )
-        update_fields.append(f"location_id = ${param_count}")
-        params.append(ad.location_id)
-        param_count += 1
+        qb.set("location_id", ad.location_id)
 
     if ad.moderation_status:
-        update_fields.append(f"moderation_status = ${param_count}")
-        params.append(ad.moderation_status)
-        param_count += 1
+        qb.set("moderation_status", ad.moderation_status)
 
     if ad.is_active is not None:
-        update_fields.append(f"is_active = ${param_count}")
-        params.append(ad.is_active)
-        param_count += 1
+        qb.set("is_active", ad.is_active)
 
     if ad.image_urls is not None:
-        update_fields.append(f"image_urls = ${param_count}")
-        params.append(ad.image_urls)
-        param_count += 1
+        qb.set("image_urls", ad.image_urls)
 
-    if not update_fields:
+    if not qb.has_assignments:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нет полей для обновления"
         )
 
-    params.append(str(ad_id))
-    query = f"""
-    UPDATE ads
-    SET {', '.join(update_fields)}
-    WHERE id = ${param_count}
-    RETURNING id
-    """
+    query, params = qb.update("ads", "id", ad_id, "id")
 
     try:
-        updated_ad = await db.fetchrow(query, *params)
+        updated_ad = await conn.fetchrow(query, *params)
         if not updated_ad:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -542,18 +784,20 @@ async def update_ad(
             )
 
         if ad.tag_ids is not None:
-            await db.execute(
+            await conn.execute(
                 "DELETE FROM ad_tags WHERE ad_id = $1",
-                str(ad_id)
+                ad_id
             )
-            for tag_id in ad.tag_ids:
-                await db.execute(
-                    "INSERT INTO ad_tags (ad_id, tag_id) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-                    str(ad_id), tag_id
+            if ad.tag_ids:
+                await conn.execute(
+                    "INSERT INTO ad_tags (ad_id, tag_id) SELECT $1, unnest($2::int[]) ON CONFLICT DO NOTHING",
+                    ad_id, ad.tag_ids
                 )
 
-        full_ad = await get_full_ad_info(ad_id)
+        full_ad = await get_full_ad_info(ad_id, conn)
         return full_ad
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -569,7 +813,7 @@ async def delete_ad(
     """Удаление объявления (только для владельца или администратора)"""
     existing_ad = await db.fetchrow(
         "SELECT id, user_id FROM ads WHERE id = $1",
-        str(ad_id)
+        ad_id
     )
     if not existing_ad:
         raise HTTPException(
@@ -580,8 +824,10 @@ async def delete_ad(
     query = "DELETE FROM ads WHERE id = $1"
 
     try:
-        await db.execute(query, str(ad_id))
+        await db.execute(query, ad_id)
         return None
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
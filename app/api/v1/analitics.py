@@ -3,13 +3,80 @@ from typing import List, Optional
 from uuid import UUID
 from pydantic import BaseModel, Field
 from app.db.session import db
+from app.core.serialization import FastJSONResponse
+from app.core.invalidation import invalidation_bus
+from app.core.shared_cache import SharedSnapshot
+from app.core.singleflight import SWRCache
+from app.config import settings
 from app.schemas.analitics import (
     TrendingAdResponse, OptimalPriceResponse, UserStatsResponse, CategoryMarketInsightsResponse)
 
 router = APIRouter(prefix="/analitics", tags=["Аналитика"])
 
 
-@router.get("/trending", response_model=List[TrendingAdResponse])
+def build_trending_from_row(row) -> dict:
+    """Преобразование строки get_trending_ads в формат TrendingAdResponse"""
+    return {
+        "ad_id": row["ad_id"],
+        "title": row["title"],
+        "price": float(row["price"]),
+        "currency": row["currency"],
+        "city": row["city"],
+        "category_name": row["category_name"],
+        "views_last_period": row["views_last_period"],
+        "messages_last_period": row["messages_last_period"],
+        "favorites_last_period": row["favorites_last_period"],
+        "trending_score": float(row["trending_score"]),
+        "created_at": row["created_at"].isoformat() if row["created_at"] else None
+    }
+
+
+TRENDING_QUERY = """
+SELECT
+    ad_id,
+    title,
+    price,
+    currency,
+    city,
+    category_name,
+    views_last_period,
+    messages_last_period,
+    favorites_last_period,
+    trending_score,
+    created_at
+FROM get_trending_ads($1, $2, $3, $4, $5)
+"""
+
+TRENDING_SNAPSHOT_DAYS = 7
+TRENDING_SNAPSHOT_SIZE = 50
+
+
+async def load_trending(days: int, category_id: Optional[int], city: Optional[str],
+                        limit: int, offset: int) -> list:
+    rows = await db.fetch_read(TRENDING_QUERY, days, category_id, city, limit, offset)
+    return [build_trending_from_row(row) for row in rows]
+
+
+async def load_default_trending() -> list:
+    """Тренды за период по умолчанию без фильтров, максимальная страница"""
+    return await load_trending(TRENDING_SNAPSHOT_DAYS, None, None, TRENDING_SNAPSHOT_SIZE, 0)
+
+
+trending_snapshot = invalidation_bus.register(SharedSnapshot(
+    "trending", load_default_trending,
+    ttl=settings.SHARED_CACHE_ANALYTICS_TTL
+))
+trending_cache = invalidation_bus.register(SWRCache(
+    "trending", settings.ANALYTICS_FRESH_TTL, settings.ANALYTICS_STALE_TTL))
+optimal_price_cache = invalidation_bus.register(SWRCache(
+    "optimal_price", settings.ANALYTICS_FRESH_TTL, settings.ANALYTICS_STALE_TTL,
+    entity="ad"))
+user_performance_cache = invalidation_bus.register(SWRCache(
+    "user_performance", settings.ANALYTICS_FRESH_TTL, settings.ANALYTICS_STALE_TTL,
+    entity="user"))
+
+
+@router.get("/trending", response_model=List[TrendingAdResponse], response_class=FastJSONResponse)
 async def get_trending_ads(
     days: int = Query(
         7, ge=1, le=30, description="Период в днях для расчёта трендов"),
@@ -30,52 +97,21 @@ async def get_trending_ads(
         else:
             city_param = None
 
-        query = """
-        SELECT
-            ad_id,
-            title,
-            price,
-            currency,
-            city,
-            category_name,
-            views_last_period,
-            messages_last_period,
-            favorites_last_period,
-            trending_score,
-            created_at
-        FROM get_trending_ads($1, $2, $3, $4, $5)
-        """
+        if (days == TRENDING_SNAPSHOT_DAYS and category_param is None
+                and city_param is None and offset + limit <= TRENDING_SNAPSHOT_SIZE):
+            # Страница по умолчанию одинакова для всех: берётся из общего снимка
+            trending = await trending_snapshot.get()
+            return FastJSONResponse(trending[offset:offset + limit])
 
-        results = await db.fetch(
-            query,
-            days,
-            category_param,
-            city_param,
-            limit,
-            offset
+        # Ключ — параметры после нормализации: одинаковые запросы ждут одно вычисление
+        trending = await trending_cache.get(
+            (days, category_param, city_param, limit, offset),
+            lambda: load_trending(days, category_param, city_param, limit, offset)
         )
+        return FastJSONResponse(trending)
 
-        if not results:
-            return []
-
-        return [
-            TrendingAdResponse(
-                ad_id=row["ad_id"],
-                title=row["title"],
-                price=float(row["price"]),
-                currency=row["currency"],
-                city=row["city"],
-                category_name=row["category_name"],
-                views_last_period=row["views_last_period"],
-                messages_last_period=row["messages_last_period"],
-                favorites_last_period=row["favorites_last_period"],
-                trending_score=float(row["trending_score"]),
-                created_at=row["created_at"].isoformat(
-                ) if row["created_at"] else None
-            )
-            for row in results
-        ]
-
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -83,6 +119,24 @@ async def get_trending_ads(
         )
 
 
+async def load_optimal_price(ad_id: UUID) -> OptimalPriceResponse:
+    result = await db.fetchrow_read(
+        "SELECT get_optimal_price_suggestion($1) AS suggested_price",
+        ad_id
+    )
+
+    suggested_price = float(
+        result["suggested_price"]) if result and result["suggested_price"] else 0.0
+
+    message = "Рекомендуемая цена установлена на основе средней цены аналогичных объявлений." if suggested_price > 0 else "Недостаточно данных для расчёта рекомендуемой цены."
+
+    return OptimalPriceResponse(
+        ad_id=ad_id,
+        suggested_price=suggested_price,
+        message=message
+    )
+
+
 @router.get("/ads/{ad_id}/optimal-price", response_model=OptimalPriceResponse)
 async def get_optimal_price(
     ad_id: UUID = Path(..., description="ID объявления")
@@ -91,21 +145,8 @@ async def get_optimal_price(
     Получение рекомендуемой цены на основе средней цены в категории
     """
     try:
-        result = await db.fetchrow(
-            "SELECT get_optimal_price_suggestion($1) AS suggested_price",
-            str(ad_id)
-        )
-
-        suggested_price = float(
-            result["suggested_price"]) if result and result["suggested_price"] else 0.0
-
-        message = "Рекомендуемая цена установлена на основе средней цены аналогичных объявлений." if suggested_price > 0 else "Недостаточно данных для расчёта рекомендуемой цены."
-
-        return OptimalPriceResponse(
-            ad_id=ad_id,
-            suggested_price=suggested_price,
-            message=message
-        )
+        return await optimal_price_cache.get(
+            str(ad_id), lambda: load_optimal_price(ad_id))
 
     except HTTPException:
         raise
@@ -119,6 +160,67 @@ async def get_optimal_price(
         )
 
 
+async def load_user_performance(user_id: UUID) -> Optional[UserStatsResponse]:
+    user_data = await db.fetchrow_read(
+        """
+        SELECT id, username, role, created_at, is_banned
+        FROM users
+        WHERE id = $1
+        """,
+        user_id
+    )
+
+    if not user_data:
+        return None
+
+    result = await db.fetchrow_read(
+        "SELECT * FROM user_performance_dashboard WHERE user_id = $1",
+        user_id
+    )
+
+    if not result:
+        return UserStatsResponse(
+            user_id=user_data["id"],
+            username=user_data["username"],
+            role=user_data["role"],
+            registration_date=str(user_data["created_at"]),
+            is_banned=user_data["is_banned"],
+            total_ads=0,
+            active_ads=0,
+            rejected_ads=0,
+            total_views=0,
+            avg_views_per_ad=0.0,
+            total_messages_received=0,
+            avg_messages_per_ad=0.0,
+            total_favorites=0,
+            total_reports_received=0,
+            resolved_reports=0,
+            last_ad_created=None,
+            ads_last_7_days=0
+        )
+
+    return UserStatsResponse(
+        user_id=result["user_id"],
+        username=result["username"],
+        role=result["role"],
+        registration_date=str(result["registration_date"]),
+        is_banned=result["is_banned"],
+        total_ads=result["total_ads"],
+        active_ads=result["active_ads"],
+        rejected_ads=result["rejected_ads"],
+        total_views=result["total_views"],
+        avg_views_per_ad=float(result["avg_views_per_ad"]),
+        total_messages_received=result["total_messages_received"],
+        avg_messages_per_ad=float(result["avg_messages_per_ad"]),
+        total_favorites=result["total_favorites"],
+        total_reports_received=result["total_reports_received"],
+        resolved_reports=result["resolved_reports"],
+        last_ad_created=str(
+            result["last_ad_created"]) if result["last_ad_created"] else None,
+        ads_last_7_days=result["ads_last_7_days"]
+    )
+
+
 @router.get("/users/{user_id}", response_model=UserStatsResponse)
 async def get_user_performance(
     user_id: UUID = Path(..., description="ID пользователя")
@@ -127,67 +229,14 @@ async def get_user_performance(
     Получение персонального дашборда производительности пользователя.
     """
     try:
-        user_data = await db.fetchrow(
-            """
-            SELECT id, username, role, created_at, is_banned
-            FROM users
-            WHERE id = $1
-            """,
-            str(user_id)
-        )
-
-        if not user_data:
+        result = await user_performance_cache.get(
+            str(user_id), lambda: load_user_performance(user_id))
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Пользователь не найден"
             )
-
-        result = await db.fetchrow(
-            "SELECT * FROM user_performance_dashboard WHERE user_id = $1",
-            str(user_id)
-        )
-
-        if not result:
-            return UserStatsResponse(
-                user_id=user_data["id"],
-                username=user_data["username"],
-                role=user_data["role"],
-                registration_date=str(user_data["created_at"]),
-                is_banned=user_data["is_banned"],
-                total_ads=0,
-                active_ads=0,
-                rejected_ads=0,
-                total_views=0,
-                avg_views_per_ad=0.0,
-                total_messages_received=0,
-                avg_messages_per_ad=0.0,
-                total_favorites=0,
-                total_reports_received=0,
-                resolved_reports=0,
-                last_ad_created=None,
-                ads_last_7_days=0
-            )
-
-        return UserStatsResponse(
-            user_id=result["user_id"],
-            username=result["username"],
-            role=result["role"],
-            registration_date=str(result["registration_date"]),
-            is_banned=result["is_banned"],
-            total_ads=result["total_ads"],
-            active_ads=result["active_ads"],
-            rejected_ads=result["rejected_ads"],
-            total_views=result["total_views"],
-            avg_views_per_ad=float(result["avg_views_per_ad"]),
-            total_messages_received=result["total_messages_received"],
-            avg_messages_per_ad=float(result["avg_messages_per_ad"]),
-            total_favorites=result["total_favorites"],
-            total_reports_received=result["total_reports_received"],
-            resolved_reports=result["resolved_reports"],
-            last_ad_created=str(
-                result["last_ad_created"]) if result["last_ad_created"] else None,
-            ads_last_7_days=result["ads_last_7_days"]
-        )
+        return result
 
     except HTTPException:
         raise
@@ -198,6 +247,37 @@ async def get_user_performance(
         )
 
 
+def build_insights_from_row(row) -> dict:
+    """Преобразование строки category_market_insights в формат CategoryMarketInsightsResponse"""
+    return {
+        "category_id": row["category_id"],
+        "category_name": row["category_name"],
+        "category_slug": row["category_slug"],
+        "total_active_ads": row["total_active_ads"],
+        "new_ads_last_7_days": row["new_ads_last_7_days"],
+        "new_ads_last_24h": row["new_ads_last_24h"],
+        "avg_price": float(row["avg_price"]) if row["avg_price"] else 0.0,
+        "min_price": float(row["min_price"]) if row["min_price"] else 0.0,
+        "max_price": float(row["max_price"]) if row["max_price"] else 0.0,
+        "total_views": row["total_views"],
+        "avg_views_per_ad": float(row["avg_views_per_ad"]) if row["avg_views_per_ad"] else 0.0
+    }
+
+
+async def load_category_insights() -> list:
+    """Аналитика по всем категориям; фильтр и лимит запроса применяются к снимку"""
+    rows = await db.fetch_read(
+        "SELECT * FROM category_market_insights ORDER BY total_active_ads DESC")
+    return [build_insights_from_row(row) for row in rows]
+
+
+category_insights_snapshot = invalidation_bus.register(SharedSnapshot(
+    "category_insights", load_category_insights,
+    ttl=settings.SHARED_CACHE_ANALYTICS_TTL,
+    entities=("category",)
+))
+
+
 @router.get("/categories/insights", response_model=List[CategoryMarketInsightsResponse])
 async def get_category_insights(
     limit: int = Query(
@@ -210,36 +290,13 @@ async def get_category_insights(
     Доступно всем авторизованным пользователям.
     """
     try:
-        query = """
-        SELECT * FROM category_market_insights
-        WHERE total_active_ads >= $1
-        ORDER BY total_active_ads DESC
-        LIMIT $2
-        """
-
-        results = await db.fetch(query, min_ads, limit)
-
-        if not results:
-            return []
-
+        insights = await category_insights_snapshot.get()
         return [
-            CategoryMarketInsightsResponse(
-                category_id=row["category_id"],
-                category_name=row["category_name"],
-                category_slug=row["category_slug"],
-                total_active_ads=row["total_active_ads"],
-                new_ads_last_7_days=row["new_ads_last_7_days"],
-                new_ads_last_24h=row["new_ads_last_24h"],
-                avg_price=float(row["avg_price"]) if row["avg_price"] else 0.0,
-                min_price=float(row["min_price"]) if row["min_price"] else 0.0,
-                max_price=float(row["max_price"]) if row["max_price"] else 0.0,
-                total_views=row["total_views"],
-                avg_views_per_ad=float(
-                    row["avg_views_per_ad"]) if row["avg_views_per_ad"] else 0.0
-            )
-            for row in results
-        ]
+            row for row in insights if row["total_active_ads"] >= min_ads
+        ][:limit]
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -2,20 +2,15 @@ from typing import List
 from fastapi import APIRouter, Body, HTTPException, status
 from typing import List
 from app.db.session import db
+from app.core.jobs import job_queue
 import asyncpg
 from app.schemas.ad import AdCreate2
 
 router = APIRouter(prefix="/batch-import", tags=["Батчевая загрузка данных"])
 
 
-@router.post("/ads", status_code=status.HTTP_201_CREATED)
-async def batch_create_ads(
-    ads: List[AdCreate2] = Body(...,
-                                description="Список объявлений для массовой загрузки"),
-):
-    """
-    Массовая загрузка объявлений
-    """
+async def validate_batch(ads: List[AdCreate2]):
+    """Проверка ссылок пачки: пользователи, категории, локации и теги должны существовать"""
     if not ads:
         raise HTTPException(
             status_code=400, detail="Список объявлений со всеми полями")
@@ -83,82 +78,98 @@ async def batch_create_ads(
                 status_code=400,
                 detail=f"Теги не найдены: {sorted(missing_tags)}"
             )
+
+
+async def insert_ads(conn, ads: List[AdCreate2]) -> list:
+    """Вставка пачки объявлений и их тегов; возвращает id в порядке пачки"""
+    ad_values = []
+    ad_tag_values = []
+
+    for ad in ads:
+        ad_values.append((
+            ad.user_id,
+            ad.category_id,
+            ad.location_id,
+            ad.title,
+            ad.description,
+            ad.price,
+            ad.currency,
+            ad.moderation_status,
+            ad.is_active,
+            ad.image_urls
+        ))
+
+    insert_query = """
+    INSERT INTO ads (
+        user_id, category_id, location_id, title, description,
+        price, currency, moderation_status, is_active, image_urls
+    )
+    SELECT * FROM UNNEST($1::uuid[], $2::int[], $3::int[], $4::text[], 
+                      $5::text[], $6::numeric[], $7::text[],
+                      $8::text[], $9::boolean[], $10::text[])
+    RETURNING id
+    """
+
+    user_ids_arr = [ad.user_id for ad in ads]
+    category_ids_arr = [ad.category_id for ad in ads]
+    location_ids_arr = [ad.location_id for ad in ads]
+    titles_arr = [ad.title for ad in ads]
+    descriptions_arr = [ad.description for ad in ads]
+    prices_arr = [ad.price for ad in ads]
+    currencies_arr = [ad.currency for ad in ads]
+    statuses_arr = [ad.moderation_status for ad in ads]
+    actives_arr = [ad.is_active for ad in ads]
+    images_arr = [ad.image_urls for ad in ads]
+
+    ad_results = await conn.fetch(
+        insert_query,
+        user_ids_arr,
+        category_ids_arr,
+        location_ids_arr,
+        titles_arr,
+        descriptions_arr,
+        prices_arr,
+        currencies_arr,
+        statuses_arr,
+        actives_arr,
+        images_arr
+    )
+
+    for idx, ad in enumerate(ads):
+        if ad.tag_ids:
+            ad_id = ad_results[idx]["id"]
+            for tag_id in ad.tag_ids:
+                ad_tag_values.append((ad_id, tag_id))
+
+    if ad_tag_values:
+        tag_ad_ids = [row[0] for row in ad_tag_values]
+        tag_tag_ids = [row[1] for row in ad_tag_values]
+
+        await conn.execute(
+            """
+            INSERT INTO ad_tags (ad_id, tag_id)
+            SELECT * FROM UNNEST($1::uuid[], $2::int[])
+            """,
+            tag_ad_ids, tag_tag_ids
+        )
+
+    return [row["id"] for row in ad_results]
+
+
+@router.post("/ads", status_code=status.HTTP_201_CREATED)
+async def batch_create_ads(
+    ads: List[AdCreate2] = Body(...,
+                                description="Список объявлений для массовой загрузки"),
+):
+    """
+    Массовая загрузка объявлений
+    """
+    await validate_batch(ads)
     # загрузка
     try:
-        async with db.pool.acquire() as conn:
+        async with db.acquire() as conn:
             async with conn.transaction():
-                ad_values = []
-                ad_tag_values = []
-
-                for ad in ads:
-                    ad_values.append((
-                        ad.user_id,
-                        ad.category_id,
-                        ad.location_id,
-                        ad.title,
-                        ad.description,
-                        ad.price,
-                        ad.currency,
-                        ad.moderation_status,
-                        ad.is_active,
-                        ad.image_urls
-                    ))
-
-                insert_query = """
-                INSERT INTO ads (
-                    user_id, category_id, location_id, title, description,
-                    price, currency, moderation_status, is_active, image_urls
-                )
-                SELECT * FROM UNNEST($1::uuid[], $2::int[], $3::int[], $4::text[], 
-                                  $5::text[], $6::numeric[], $7::text[],
-                                  $8::text[], $9::boolean[], $10::text[])
-                RETURNING id
-                """
-
-                user_ids_arr = [ad.user_id for ad in ads]
-                category_ids_arr = [ad.category_id for ad in ads]
-                location_ids_arr = [ad.location_id for ad in ads]
-                titles_arr = [ad.title for ad in ads]
-                descriptions_arr = [ad.description for ad in ads]
-                prices_arr = [ad.price for ad in ads]
-                currencies_arr = [ad.currency for ad in ads]
-                statuses_arr = [ad.moderation_status for ad in ads]
-                actives_arr = [ad.is_active for ad in ads]
-                images_arr = [ad.image_urls for ad in ads]
-
-                ad_results = await conn.fetch(
-                    insert_query,
-                    user_ids_arr,
-                    category_ids_arr,
-                    location_ids_arr,
-                    titles_arr,
-                    descriptions_arr,
-                    prices_arr,
-                    currencies_arr,
-                    statuses_arr,
-                    actives_arr,
-                    images_arr
-                )
-
-                for idx, ad in enumerate(ads):
-                    if ad.tag_ids:
-                        ad_id = ad_results[idx]["id"]
-                        for tag_id in ad.tag_ids:
-                            ad_tag_values.append((ad_id, tag_id))
-
-                if ad_tag_values:
-                    tag_ad_ids = [row[0] for row in ad_tag_values]
-                    tag_tag_ids = [row[1] for row in ad_tag_values]
-
-                    await conn.execute(
-                        """
-                        INSERT INTO ad_tags (ad_id, tag_id)
-                        SELECT * FROM UNNEST($1::uuid[], $2::int[])
-                        """,
-                        tag_ad_ids, tag_tag_ids
-                    )
-
-                ad_ids = [row["id"] for row in ad_results]
+                ad_ids = await insert_ads(conn, ads)
 
                 return {
                     "success": True,
@@ -172,8 +183,30 @@ async def batch_create_ads(
             status_code=400,
             detail=f"Ошибка при массовой вставке: {str(e)}"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Внутренняя ошибка сервера: {str(e)}"
         )
+
+
+@router.post("/ads/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_batch_create_ads(
+    ads: List[AdCreate2] = Body(...,
+                                description="Список объявлений для фоновой загрузки"),
+):
+    """
+    Фоновая массовая загрузка: пачка ставится в очередь заданий,
+    результат — GET /jobs/{job_id}
+    """
+    if not ads:
+        raise HTTPException(
+            status_code=400, detail="Список объявлений со всеми полями")
+
+    job = await job_queue.enqueue(
+        "ads.batch_import",
+        {"ads": [ad.model_dump(mode="json") for ad in ads]}
+    )
+    return {"job_id": job["id"], "status": job["status"]}
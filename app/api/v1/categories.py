@@ -1,12 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Path, Body
 from typing import List, Optional
 from app.db.session import db
+from app.db.queries import QueryBuilder
+from app.core.invalidation import invalidation_bus, invalidation_key
+from app.core.shared_cache import SharedSnapshot
+from app.config import settings
 from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryOut
 from uuid import UUID
 import re
 
 router = APIRouter(prefix="/categories", tags=["Категории"])
 
+category_cache = invalidation_bus.cache("categories", ("category",))
+
+
+async def load_categories() -> list:
+    """Полный справочник для общего снимка (с мастера, чтобы не закэшировать отставание реплики)"""
+    rows = await db.fetch("""
+    SELECT id, name, slug, icon_url, description
+    FROM categories
+    ORDER BY name ASC
+    """)
+    return [dict(row) for row in rows]
+
+
+categories_snapshot = invalidation_bus.register(SharedSnapshot(
+    "categories", load_categories,
+    ttl=settings.SHARED_CACHE_REFERENCE_TTL,
+    entities=("category",)
+))
+
 
 @router.post("/", response_model=CategoryOut, status_code=status.HTTP_201_CREATED)
 async def create_category(category: CategoryCreate):
@@ -45,7 +68,10 @@ async def create_category(category: CategoryCreate):
             category.icon_url,
             category.description
         )
+        invalidation_bus.publish(invalidation_key("category", new_category["id"]))
         return dict(new_category)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -62,6 +88,13 @@ async def get_category(category_id: int = Path(..., description="ID катего
     WHERE id = $1
     """
 
+    cached = category_cache.get(category_id)
+    if cached is not None:
+        return cached
+
+    # Промах читается с мастера: значение с отстающей реплики
+    # попало бы в кэш уже после инвалидации
+    generation = category_cache.generation
     category = await db.fetchrow(query, category_id)
     if not category:
         raise HTTPException(
@@ -69,7 +102,9 @@ async def get_category(category_id: int = Path(..., description="ID катего
             detail="Категория не найдена"
         )
 
-    return dict(category)
+    category_data = dict(category)
+    category_cache.set(category_id, category_data, generation)
+    return category_data
 
 
 @router.get("/", response_model=List[CategoryOut])
@@ -80,13 +115,10 @@ async def get_categories(
         None, min_length=3, description="Поиск по названию (мин. 3 символа)"),
 ):
     """Получение списка категорий с поиском по name и slug"""
-    base_query = """
-    SELECT id, name, slug, icon_url, description
-    FROM categories
-    """
-    where_clauses = []
-    params = []
-    param_index = 1
+    qb = QueryBuilder(
+        "categories.list",
+        "SELECT id, name, slug, icon_url, description FROM categories"
+    )
 
     if search is not None:
         clean_search = search.strip()
@@ -96,26 +128,20 @@ async def get_categories(
 
         if len(clean_search) >= 3:
             pattern = f"%{clean_search}%"
-            where_clauses.append(
-                f"(name % ${param_index} OR slug % ${param_index})"
-            )
-            params.append(pattern)
-            param_index += 1
-
-    query_parts = [base_query]
-
-    if where_clauses:
-        query_parts.append("WHERE " + " AND ".join(where_clauses))
+            qb.where("(name % {0} OR slug % {0})", pattern)
 
-    query_parts.append("ORDER BY name ASC")
-    query_parts.append(f"LIMIT ${param_index} OFFSET ${param_index + 1}")
-    params.extend([limit, skip])
-
-    query = " ".join(query_parts)
+    query, params = qb.select(
+        "ORDER BY name ASC LIMIT {} OFFSET {}", limit, skip)
 
     try:
-        categories = await db.fetch(query, *params)
+        if qb.has_conditions:
+            categories = await db.fetch_read(query, *params)
+        else:
+            # Без фильтров страница вырезается из общего для воркеров снимка
+            categories = (await categories_snapshot.get())[skip:skip + limit]
         return [dict(category) for category in categories]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -139,9 +165,7 @@ async def update_category(
             detail="Категория не найдена"
         )
 
-    update_clauses = []
-    params = []
-    param_index = 1
+    qb = QueryBuilder("categories.update")
 
     if category.name is not None:
         existing_name = await db.fetchrow(
@@ -153,9 +177,7 @@ async def update_category(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Категория с таким названием уже существует"
             )
-        update_clauses.append("name = $" + str(param_index))
-        params.append(category.name)
-        param_index += 1
+        qb.set("name", category.name)
 
     if category.slug is not None:
         existing_slug = await db.fetchrow(
@@ -167,35 +189,24 @@ async def update_category(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Категория с таким slug уже существует"
             )
-        update_clauses.append("slug = $" + str(param_index))
-        params.append(category.slug)
-        param_index += 1
+        qb.set("slug", category.slug)
 
     if category.icon_url is not None:
-        update_clauses.append("icon_url = $" + str(param_index))
-        params.append(category.icon_url)
-        param_index += 1
+        qb.set("icon_url", category.icon_url)
 
     if category.description is not None:
-        update_clauses.append("description = $" + str(param_index))
-        params.append(category.description)
-        param_index += 1
+        qb.set("description", category.description)
 
-    if not update_clauses:
+    if not qb.has_assignments:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нет полей для обновления"
         )
 
-    set_clause = ", ".join(update_clauses)
-    params.append(category_id)
-
-    query = f"""
-    UPDATE categories
-    SET {set_clause}
-    WHERE id = ${param_index}
-    RETURNING id, name, slug, icon_url, description
-    """
+    query, params = qb.update(
+        "categories", "id", category_id,
+        "id, name, slug, icon_url, description"
+    )
 
     try:
         updated_category = await db.fetchrow(query, *params)
@@ -204,7 +215,10 @@ async def update_category(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Категория не найдена"
             )
+        invalidation_bus.publish(invalidation_key("category", category_id))
         return dict(updated_category)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -229,7 +243,10 @@ async def delete_category(category_id: int = Path(..., description="ID кате
 
     try:
         await db.execute(query, category_id)
+        invalidation_bus.publish(invalidation_key("category", category_id))
         return None
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -1,12 +1,54 @@
 from fastapi import (APIRouter, HTTPException, status, Query, Path)
 from uuid import UUID
-from typing import List
+from typing import List, Optional
 from app.db.session import db
-from app.schemas.favorites import FavoriteAdOut
+from app.db.queries import json_array_query
+from app.config import settings
+from app.schemas.favorites import (FavoriteAdOut, FavoritesContains, FavoritesContainsOut,
+                                   FavoritesBulk)
+from app.core.cursors import encode_cursor, decode_cursor
+from datetime import datetime, timedelta, timezone
+import asyncpg
+from app.core.serialization import FastJSONResponse
+from app.core.invalidation import invalidation_bus, invalidation_key
 import json
 
 router = APIRouter(prefix="/favorites", tags=["Избранное"])
 
+# Множество id избранных объявлений по user_id. Ключ инвалидации
+# "favorite:<user_id>" публикует и outbox-событие избранного (entity_id — user_id)
+favorite_sets_cache = invalidation_bus.cache(
+    "favorite_sets", ("favorite",), ttl=settings.FAVORITES_SET_CACHE_TTL)
+
+FAVORITE_SET_QUERY = """
+SELECT array_agg(ad_id) FROM (
+    SELECT ad_id FROM favorites WHERE user_id = $1 LIMIT $2
+) f
+"""
+
+FAVORITES_AMONG_QUERY = """
+SELECT ad_id FROM favorites WHERE user_id = $1 AND ad_id = ANY($2::uuid[])
+"""
+
+
+async def load_favorite_set(user_id: UUID):
+    """
+    Множество id (строками) из кэша или одним запросом; None, если избранного
+    больше FAVORITES_SET_MAX_IDS — такой набор не кэшируется
+    """
+    cached = favorite_sets_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    generation = favorite_sets_cache.generation
+    ad_ids = await db.fetchval(
+        FAVORITE_SET_QUERY, user_id, settings.FAVORITES_SET_MAX_IDS + 1) or []
+    if len(ad_ids) > settings.FAVORITES_SET_MAX_IDS:
+        return None
+    favorite_set = frozenset(str(ad_id) for ad_id in ad_ids)
+    favorite_sets_cache.set(user_id, favorite_set, generation)
+    return favorite_set
+
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def add_to_favorites(
@@ -17,7 +59,7 @@ async def add_to_favorites(
 
     ad_exists = await db.fetchrow(
         "SELECT id FROM ads WHERE id = $1 AND is_active = true AND moderation_status = 'APPROVED'",
-        str(ad_id)
+        ad_id
     )
     if not ad_exists:
         raise HTTPException(
@@ -27,7 +69,7 @@ async def add_to_favorites(
 
     user_exists = await db.fetchrow(
         "SELECT id FROM users WHERE id = $1",
-        str(user_id)
+        user_id
     )
     if not user_exists:
         raise HTTPException(
@@ -37,7 +79,7 @@ async def add_to_favorites(
 
     existing_favorite = await db.fetchrow(
         "SELECT 1 FROM favorites WHERE user_id = $1 AND ad_id = $2",
-        str(user_id), str(ad_id)
+        user_id, ad_id
     )
     if existing_favorite:
         return {"message": "Объявление уже в избранном", "ad_id": str(ad_id)}
@@ -49,9 +91,12 @@ async def add_to_favorites(
             VALUES ($1, $2, NOW())
             ON CONFLICT (user_id, ad_id) DO NOTHING
             """,
-            str(user_id), str(ad_id)
+            user_id, ad_id
         )
+        invalidation_bus.publish(invalidation_key("favorite", user_id))
         return {"message": "Объявление добавлено в избранное", "ad_id": str(ad_id)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -59,6 +104,191 @@ async def add_to_favorites(
         )
 
 
+@router.post("/contains", response_model=FavoritesContainsOut)
+async def favorites_contains(request: FavoritesContains):
+    """
+    Какие из объявлений страницы в избранном у пользователя: in_favorites[i]
+    относится к ad_ids[i]. Ответ строится по кэшированному множеству id
+    избранного, без запроса к базе на каждую страницу
+    """
+    favorite_set = await load_favorite_set(request.user_id)
+    if favorite_set is None:
+        rows = await db.fetch_read(FAVORITES_AMONG_QUERY, request.user_id, request.ad_ids)
+        favorite_set = {str(row["ad_id"]) for row in rows}
+
+    return {
+        "user_id": request.user_id,
+        "ad_ids": request.ad_ids,
+        "in_favorites": [str(ad_id) in favorite_set for ad_id in request.ad_ids],
+    }
+
+
+# Пакет операций одним оператором: удаление и вставка — CTE одного запроса,
+# поэтому применяются атомарно и одной транзакцией
+BULK_FAVORITES_QUERY = """
+WITH ops AS (
+    SELECT * FROM unnest($2::uuid[], $3::bool[]) AS o(ad_id, is_add)
+),
+removed AS (
+    DELETE FROM favorites f
+    USING ops
+    WHERE f.user_id = $1 AND f.ad_id = ops.ad_id AND NOT ops.is_add
+    RETURNING f.ad_id
+),
+available AS (
+    SELECT ops.ad_id
+    FROM ops
+    JOIN ads a ON a.id = ops.ad_id
+    WHERE ops.is_add AND a.is_active = true AND a.moderation_status = 'APPROVED'
+),
+added AS (
+    INSERT INTO favorites (user_id, ad_id, added_at)
+    SELECT $1, ad_id, NOW() FROM available
+    ON CONFLICT (user_id, ad_id) DO NOTHING
+    RETURNING ad_id
+)
+SELECT
+    COALESCE((SELECT array_agg(ad_id) FROM added), '{}') AS added,
+    COALESCE((SELECT array_agg(ad_id) FROM removed), '{}') AS removed,
+    COALESCE((SELECT array_agg(ad_id) FROM available), '{}') AS available
+"""
+
+
+@router.post("/bulk", status_code=status.HTTP_200_OK)
+async def bulk_update_favorites(bulk: FavoritesBulk):
+    """
+    Применение пачки добавлений и удалений (например, накопленных офлайн).
+    Для одного объявления действует последняя операция пачки. В ответе:
+    added и removed — что реально изменилось, rejected — объявления,
+    которые нельзя добавить (нет, неактивно или не прошло модерацию)
+    """
+    last_ops = {}
+    for operation in bulk.operations:
+        last_ops.pop(operation.ad_id, None)
+        last_ops[operation.ad_id] = operation.op == "add"
+
+    try:
+        result = await db.fetchrow(
+            BULK_FAVORITES_QUERY, bulk.user_id, list(last_ops), list(last_ops.values()))
+    except asyncpg.ForeignKeyViolationError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logging.error(f"Ошибка при пакетном изменении избранного: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при изменении избранного"
+        )
+
+    if result["added"] or result["removed"]:
+        invalidation_bus.publish(invalidation_key("favorite", bulk.user_id))
+    available = {str(ad_id) for ad_id in result["available"]}
+    return {
+        "added": result["added"],
+        "removed": result["removed"],
+        "rejected": [
+            ad_id for ad_id, is_add in last_ops.items()
+            if is_add and str(ad_id) not in available
+        ],
+    }
+
+
+# Текущее избранное и позиция журнала в одном снимке
+FAVORITES_SNAPSHOT_QUERY = """
+SELECT
+    pg_snapshot_xmin(pg_current_snapshot())::text AS txid,
+    COALESCE(
+        (SELECT array_agg(ad_id ORDER BY added_at DESC) FROM favorites WHERE user_id = $1),
+        '{}'
+    ) AS ad_ids
+"""
+
+# Только зафиксированные транзакции старше самой старой активной:
+# курсор не перепрыгнет через ещё не видимые изменения
+FAVORITE_CHANGES_QUERY = """
+SELECT id, txid::text AS txid, ad_id, action, changed_at
+FROM favorite_changes
+WHERE user_id = $1
+  AND (txid, id) > ($2::text::xid8, $3::bigint)
+  AND txid < pg_snapshot_xmin(pg_current_snapshot())
+ORDER BY txid, id
+LIMIT $4
+"""
+
+
+@router.get("/changes")
+async def get_favorite_changes(
+    user_id: UUID = Query(..., description="Идентификатор пользователя"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор из next_cursor предыдущего ответа; без него — полный список"),
+    limit: int = Query(500, ge=1, le=1000, description="Макс. число записей журнала"),
+):
+    """
+    Дельта-синхронизация избранного. Без курсора (или с курсором старше
+    срока хранения журнала) возвращается полный список ad_ids и reset=true;
+    дальше — только добавления и удаления после курсора, по одному
+    последнему изменению на объявление
+    """
+    now = datetime.now(timezone.utc)
+    position = decode_cursor(cursor, str, int, datetime)
+    if position is not None and not position[0].isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
+    expired = position is not None and (
+        position[2] < now - timedelta(days=settings.FAVORITE_CHANGES_RETENTION_DAYS))
+
+    try:
+        if position is None or expired:
+            snapshot = await db.fetchrow(FAVORITES_SNAPSHOT_QUERY, user_id)
+            return {
+                "reset": True,
+                "ad_ids": snapshot["ad_ids"],
+                "changes": [],
+                "next_cursor": encode_cursor(snapshot["txid"], 0, now),
+                "has_more": False,
+            }
+
+        txid, change_id, _ = position
+        entries = await db.fetch(FAVORITE_CHANGES_QUERY, user_id, txid, change_id, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logging.error(f"Ошибка при получении изменений избранного: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при получении изменений избранного"
+        )
+
+    latest = {}
+    for entry in entries:
+        latest.pop(entry["ad_id"], None)
+        latest[entry["ad_id"]] = entry
+    if entries:
+        txid, change_id = entries[-1]["txid"], entries[-1]["id"]
+
+    return {
+        "reset": False,
+        "changes": [
+            {
+                "ad_id": ad_id,
+                "op": "add" if entry["action"] == "ADDED" else "remove",
+                "changed_at": entry["changed_at"],
+            }
+            for ad_id, entry in latest.items()
+        ],
+        "next_cursor": encode_cursor(txid, change_id, now),
+        "has_more": len(entries) == limit,
+    }
+
+
 @router.delete("/{ad_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_from_favorites(
     ad_id: UUID = Path(..., description="Идентификатор объявления"),
@@ -72,7 +302,7 @@ async def remove_from_favorites(
             SELECT 1 FROM favorites
             WHERE user_id = $1 AND ad_id = $2
             """,
-            str(user_id), str(ad_id)
+            user_id, ad_id
         )
 
         if existing is None:
@@ -86,7 +316,7 @@ async def remove_from_favorites(
             DELETE FROM favorites
             WHERE user_id = $1 AND ad_id = $2
             """,
-            str(user_id), str(ad_id)
+            user_id, ad_id
         )
 
         if result == "DELETE 0":
@@ -95,6 +325,7 @@ async def remove_from_favorites(
                 detail="Объявление не найдено в избранном"
             )
 
+        invalidation_bus.publish(invalidation_key("favorite", user_id))
         return None
     except HTTPException:
         raise
@@ -107,9 +338,67 @@ async def remove_from_favorites(
         )
 
 
-@router.get("/", response_model=List[FavoriteAdOut])
+# Документ FavoriteAdOut, собираемый в базе (та же форма, что у build_favorite_from_row)
+FAVORITE_JSON_DOCUMENT = """json_build_object(
+    'id', q.id, 'title', q.title, 'description', truncate_description(q.description),
+    'price', api_float(q.price), 'currency', q.currency,
+    'created_at', api_timestamp(q.created_at), 'views_count', q.views_count,
+    'image_urls', image_urls_json(q.image_urls),
+    'category', json_build_object('name', q.category_name),
+    'location', json_build_object('city', q.city, 'district', NULLIF(q.district, '')),
+    'owner', json_build_object('username', q.owner_username, 'avatar_url', NULLIF(q.owner_avatar, ''))
+)"""
+
+
+def build_favorite_from_row(fav) -> dict:
+    """Преобразование строки из БД в формат FavoriteAdOut"""
+    image_urls = []
+    try:
+        if fav["image_urls"]:
+            if isinstance(fav["image_urls"], str):
+                parsed = json.loads(fav["image_urls"])
+                if isinstance(parsed, list):
+                    image_urls = [str(item)
+                                  for item in parsed if item is not None]
+            elif isinstance(fav["image_urls"], list):
+                image_urls = [
+                    str(item) for item in fav["image_urls"] if item is not None]
+    except (TypeError, ValueError, json.JSONDecodeError):
+        image_urls = []
+
+    description = str(fav["description"]) if fav["description"] else ""
+    if len(description) > 150:
+        cut_pos = description.rfind(' ', 0, 150)
+        if cut_pos == -1 or cut_pos < 100:
+            cut_pos = 150
+        description = description[:cut_pos].strip() + "..."
+
+    return {
+        "id": fav["id"],
+        "title": fav["title"],
+        "description": description,
+        "price": float(fav["price"]),
+        "currency": fav["currency"],
+        "created_at": fav["created_at"],
+        "views_count": fav["views_count"],
+        "image_urls": image_urls,
+        "category": {
+            "name": fav["category_name"]
+        },
+        "location": {
+            "city": fav["city"],
+            "district": fav["district"] if fav["district"] else None
+        },
+        "owner": {
+            "username": fav["owner_username"],
+            "avatar_url": fav["owner_avatar"] if fav["owner_avatar"] else None
+        }
+    }
+
+
+@router.get("/", response_model=List[FavoriteAdOut], response_class=FastJSONResponse)
 async def get_user_favorites(
-    user_id: UUID = Path(..., description="Идентификатор объявления"),
+    user_id: UUID = Query(..., description="Идентификатор пользователя"),
     skip: int = Query(0, ge=0, description="Количество записей для пропуска"),
     limit: int = Query(
         20, ge=1, le=100, description="Количество записей для возврата")
@@ -139,54 +428,16 @@ async def get_user_favorites(
     """
 
     try:
-        favorites = await db.fetch(query, str(user_id), limit, skip)
-
-        result = []
-        for fav in favorites:
-            image_urls = []
-            try:
-                if fav["image_urls"]:
-                    if isinstance(fav["image_urls"], str):
-                        parsed = json.loads(fav["image_urls"])
-                        if isinstance(parsed, list):
-                            image_urls = [str(item)
-                                          for item in parsed if item is not None]
-                    elif isinstance(fav["image_urls"], list):
-                        image_urls = [
-                            str(item) for item in fav["image_urls"] if item is not None]
-            except (TypeError, ValueError, json.JSONDecodeError):
-                image_urls = []
-
-            description = str(fav["description"]) if fav["description"] else ""
-            if len(description) > 150:
-                cut_pos = description.rfind(' ', 0, 150)
-                if cut_pos == -1 or cut_pos < 100:
-                    cut_pos = 150
-                description = description[:cut_pos].strip() + "..."
-
-            result.append({
-                "id": fav["id"],
-                "title": fav["title"],
-                "description": description,
-                "price": float(fav["price"]),
-                "currency": fav["currency"],
-                "created_at": fav["created_at"],
-                "views_count": fav["views_count"],
-                "image_urls": image_urls,
-                "category": {
-                    "name": fav["category_name"]
-                },
-                "location": {
-                    "city": fav["city"],
-                    "district": fav["district"] if fav["district"] else None
-                },
-                "owner": {
-                    "username": fav["owner_username"],
-                    "avatar_url": fav["owner_avatar"] if fav["owner_avatar"] else None
-                }
-            })
-
-        return result
+        if settings.DB_JSON_RENDERING:
+            body = await db.fetchval_read(
+                json_array_query(query, FAVORITE_JSON_DOCUMENT), user_id, limit, skip)
+            return FastJSONResponse(body)
+
+        favorites = await db.fetch_read(query, user_id, limit, skip)
+
+        return FastJSONResponse([build_favorite_from_row(fav) for fav in favorites])
+    except HTTPException:
+        raise
     except Exception as e:
         import logging
         logging.error(f"Ошибка при получении избранного: {str(e)}")
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, HTTPException, status, Query, Path
+from typing import List, Optional
+from app.core import job_handlers  # noqa: F401 (регистрация типов заданий)
+from app.core.jobs import JOB_COLUMNS, job_queue
+from app.db.queries import QueryBuilder
+from app.db.session import db
+from app.schemas.job import JobCreate, JobOut
+
+router = APIRouter(prefix="/jobs", tags=["Фоновые задания"])
+
+
+@router.post("/", response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_job(job: JobCreate):
+    """Постановка задания в очередь; выполняет его воркер (python -m app.worker)"""
+    if job.job_type not in job_queue.types:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Неизвестный тип задания. Доступны: {', '.join(sorted(job_queue.types))}"
+        )
+
+    created = await job_queue.enqueue(
+        job.job_type, job.payload,
+        priority=job.priority,
+        delay=job.delay_seconds,
+        max_attempts=job.max_attempts
+    )
+    return dict(created)
+
+
+@router.get("/stats")
+async def get_jobs_stats():
+    """Число заданий по типам и статусам и возраст самого старого готового к выдаче"""
+    return await job_queue.stats()
+
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(job_id: int = Path(..., description="ID задания")):
+    """Состояние задания, результат или последняя ошибка"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Задание не найдено"
+        )
+    return dict(job)
+
+
+@router.get("/", response_model=List[JobOut])
+async def get_jobs(
+    job_status: Optional[str] = Query(
+        None, alias="status", regex="^(QUEUED|RUNNING|DONE|DEAD)$",
+        description="Фильтр по статусу"),
+    job_type: Optional[str] = Query(None, description="Фильтр по типу задания"),
+    before_id: Optional[int] = Query(
+        None, description="Курсор: задания с id меньше указанного"),
+    limit: int = Query(50, ge=1, le=200, description="Количество заданий"),
+):
+    """Список заданий от новых к старым"""
+    qb = QueryBuilder("jobs.list", f"SELECT {JOB_COLUMNS} FROM background_jobs")
+    if job_status:
+        qb.where("status = {}", job_status)
+    if job_type:
+        qb.where("job_type = {}", job_type)
+    if before_id is not None:
+        qb.where("id < {}", before_id)
+
+    query, params = qb.select("ORDER BY id DESC LIMIT {}", limit)
+    jobs = await db.fetch(query, *params, pin_reads=False)
+    return [dict(job) for job in jobs]
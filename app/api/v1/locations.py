@@ -1,11 +1,40 @@
 from fastapi import APIRouter, HTTPException, status, Query, Path, Body
 from typing import List, Optional
 from app.db.session import db
+from app.db.queries import QueryBuilder
+from app.core.invalidation import invalidation_bus, invalidation_key
+from app.core.shared_cache import SharedSnapshot
+from app.config import settings
 from app.schemas.location import LocationCreate, LocationUpdate, LocationOut
 import re
 
 router = APIRouter(prefix="/locations", tags=["Локации"])
 
+location_cache = invalidation_bus.cache("locations", ("location",))
+
+
+async def load_locations() -> list:
+    """Все локации для общего снимка"""
+    rows = await db.fetch("""
+    SELECT id, city, district, street, building, latitude, longitude, postal_code
+    FROM locations
+    ORDER BY city, district, street
+    """)
+    # Координаты строкой: Decimal через JSON-снимок потерял бы нули в дробной части
+    return [
+        {**dict(row),
+         "latitude": str(row["latitude"]) if row["latitude"] is not None else None,
+         "longitude": str(row["longitude"]) if row["longitude"] is not None else None}
+        for row in rows
+    ]
+
+
+locations_snapshot = invalidation_bus.register(SharedSnapshot(
+    "locations", load_locations,
+    ttl=settings.SHARED_CACHE_REFERENCE_TTL,
+    entities=("location",)
+))
+
 
 @router.post("/", response_model=LocationOut, status_code=status.HTTP_201_CREATED)
 async def create_location(location: LocationCreate):
@@ -41,7 +70,10 @@ async def create_location(location: LocationCreate):
             location.longitude,
             location.postal_code
         )
+        invalidation_bus.publish(invalidation_key("location", new_location["id"]))
         return dict(new_location)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -59,6 +91,13 @@ async def get_location(location_id: int = Path(..., description="ID локаци
     WHERE id = $1
     """
 
+    cached = location_cache.get(location_id)
+    if cached is not None:
+        return cached
+
+    # Промах читается с мастера: значение с отстающей реплики
+    # попало бы в кэш уже после инвалидации
+    generation = location_cache.generation
     location = await db.fetchrow(query, location_id)
     if not location:
         raise HTTPException(
@@ -66,7 +105,9 @@ async def get_location(location_id: int = Path(..., description="ID локаци
             detail="Локация не найдена"
         )
 
-    return dict(location)
+    location_data = dict(location)
+    location_cache.set(location_id, location_data, generation)
+    return location_data
 
 
 @router.get("/", response_model=List[LocationOut])
@@ -80,13 +121,10 @@ async def get_locations(
 ):
     """Получение списка локаций с подстроковым поиском по городу и району"""
 
-    base_query = """
-    SELECT id, city, district, street, building, latitude, longitude, postal_code 
-    FROM locations
-    """
-    where_clauses = []
-    params = []
-    param_index = 1
+    qb = QueryBuilder(
+        "locations.list",
+        "SELECT id, city, district, street, building, latitude, longitude, postal_code FROM locations"
+    )
 
     if city is not None:
         clean_city = city.strip()
@@ -94,9 +132,7 @@ async def get_locations(
             clean_city = re.sub(r'[^а-яА-Яa-zA-Z0-9\s\-_]',
                                 ' ', clean_city).strip()
         if len(clean_city) >= 3:
-            where_clauses.append(f"city % ${param_index}")
-            params.append(clean_city)
-            param_index += 1
+            qb.where("city % {}", clean_city)
 
     if district is not None:
         clean_district = district.strip()
@@ -104,23 +140,20 @@ async def get_locations(
             clean_district = re.sub(
                 r'[^а-яА-Яa-zA-Z0-9\s\-_]', ' ', clean_district).strip()
         if len(clean_district) >= 3:
-            where_clauses.append(f"LOWER(district) % ${param_index}")
-            params.append(clean_district.lower())
-            param_index += 1
-
-    query_parts = [base_query]
-    if where_clauses:
-        query_parts.append("WHERE " + " AND ".join(where_clauses))
-
-    query_parts.append("ORDER BY city, district, street")
-    query_parts.append(f"LIMIT ${param_index} OFFSET ${param_index + 1}")
-    params.extend([limit, skip])
+            qb.where("LOWER(district) % {}", clean_district.lower())
 
-    query = " ".join(query_parts)
+    query, params = qb.select(
+        "ORDER BY city, district, street LIMIT {} OFFSET {}", limit, skip)
 
     try:
-        locations = await db.fetch(query, *params)
+        if qb.has_conditions:
+            locations = await db.fetch_read(query, *params)
+        else:
+            # Без фильтров страница вырезается из общего для воркеров снимка
+            locations = (await locations_snapshot.get())[skip:skip + limit]
         return [dict(location) for location in locations]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -145,29 +178,19 @@ async def update_location(
             detail="Локация не найдена"
         )
 
-    update_clauses = []
-    params = []
-    param_index = 1
+    qb = QueryBuilder("locations.update")
 
     if location.city is not None:
-        update_clauses.append("city = $" + str(param_index))
-        params.append(location.city)
-        param_index += 1
+        qb.set("city", location.city)
 
     if location.district is not None:
-        update_clauses.append("district = $" + str(param_index))
-        params.append(location.district)
-        param_index += 1
+        qb.set("district", location.district)
 
     if location.street is not None:
-        update_clauses.append("street = $" + str(param_index))
-        params.append(location.street)
-        param_index += 1
+        qb.set("street", location.street)
 
     if location.building is not None:
-        update_clauses.append("building = $" + str(param_index))
-        params.append(location.building)
-        param_index += 1
+        qb.set("building", location.building)
 
     if location.latitude is not None:
         if not (-90 <= location.latitude <= 90):
@@ -175,9 +198,7 @@ async def update_location(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Широта должна быть в диапазоне от -90 до 90"
             )
-        update_clauses.append("latitude = $" + str(param_index))
-        params.append(location.latitude)
-        param_index += 1
+        qb.set("latitude", location.latitude)
 
     if location.longitude is not None:
         if not (-180 <= location.longitude <= 180):
@@ -185,30 +206,21 @@ async def update_location(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Долгота должна быть в диапазоне от -180 до 180"
             )
-        update_clauses.append("longitude = $" + str(param_index))
-        params.append(location.longitude)
-        param_index += 1
+        qb.set("longitude", location.longitude)
 
     if location.postal_code is not None:
-        update_clauses.append("postal_code = $" + str(param_index))
-        params.append(location.postal_code)
-        param_index += 1
+        qb.set("postal_code", location.postal_code)
 
-    if not update_clauses:
+    if not qb.has_assignments:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нет полей для обновления"
         )
 
-    set_clause = ", ".join(update_clauses)
-    params.append(location_id)
-
-    query = f"""
-    UPDATE locations
-    SET {set_clause}
-    WHERE id = ${param_index}
-    RETURNING id, city, district, street, building, latitude, longitude, postal_code
-    """
+    query, params = qb.update(
+        "locations", "id", location_id,
+        "id, city, district, street, building, latitude, longitude, postal_code"
+    )
 
     try:
         updated_location = await db.fetchrow(query, *params)
@@ -217,7 +229,10 @@ async def update_location(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Локация не найдена"
             )
+        invalidation_bus.publish(invalidation_key("location", location_id))
         return dict(updated_location)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -242,7 +257,10 @@ async def delete_location(location_id: int = Path(..., description="Иденти
 
     try:
         await db.execute(query, location_id)
+        invalidation_bus.publish(invalidation_key("location", location_id))
         return None
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
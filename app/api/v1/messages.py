@@ -1,92 +1,461 @@
-from fastapi import APIRouter, HTTPException, status, Query, Path
+from fastapi import APIRouter, HTTPException, status, Query, Path, Header, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from app.db.session import db
-from app.schemas.message import MessageCreate, MessageOut
+from app.db.queries import QueryBuilder
+from app.schemas.message import MessageCreate, MessageOut, ConversationPage, MessagesMarkRead
+from app.core.serialization import FastJSONResponse, dumps
+from app.core.message_stream import RESYNC, message_hub
+from app.core.invalidation import invalidation_bus, invalidation_key
+from app.core.events import dispatcher
+from app.config import settings
+from app.core.cursors import encode_cursor, decode_cursor
+from collections import deque
+from datetime import datetime
 from uuid import UUID
+import asyncio
+import asyncpg
 import re
 
 router = APIRouter(prefix="/messages", tags=["Сообщения"])
 
+# Непрочитанные по user_id; ключ инвалидации "unread:<user_id>"
+unread_cache = invalidation_bus.cache(
+    "unread_counts", ("unread",), ttl=settings.UNREAD_CACHE_TTL, max_size=50000)
+
+
+@dispatcher.subscribe("message")
+def invalidate_unread_on_event(event):
+    """Изменения сообщений не через этот API (задания, каскадное удаление)"""
+    if event.payload and event.payload.get("recipient_id"):
+        invalidation_bus.publish(invalidation_key("unread", event.payload["recipient_id"]))
+
+
+SEND_MESSAGE_QUERY = """
+INSERT INTO messages (sender_id, recipient_id, ad_id, text, sent_at, is_read)
+VALUES ($1, $2, $3, $4, NOW(), false)
+RETURNING id, conversation_id, sender_id, recipient_id, ad_id, text, sent_at, is_read
+"""
+
+# Ошибки ограничений и триггеров на messages -> ответ API
+SEND_MESSAGE_ERRORS = {
+    "messages_sender_id_fkey": (status.HTTP_404_NOT_FOUND, "Отправитель не найден"),
+    "messages_recipient_id_fkey": (status.HTTP_404_NOT_FOUND, "Получатель не найден"),
+    "messages_check": (status.HTTP_400_BAD_REQUEST, "Нельзя отправить сообщение самому себе"),
+    "messages_ad_id_fkey": (status.HTTP_404_NOT_FOUND, "Объявление не найдено"),
+    "messages_ad_active": (status.HTTP_400_BAD_REQUEST,
+                           "Нельзя отправить сообщение к неактивному объявлению"),
+    "messages_text_check": (status.HTTP_400_BAD_REQUEST,
+                            "Текст сообщения должен быть от 1 до 2000 символов"),
+}
+
+
+def send_message_error(error: asyncpg.IntegrityConstraintViolationError,
+                       sender_id: UUID, recipient_id: UUID) -> Optional[HTTPException]:
+    constraint = error.constraint_name
+    if constraint in ("conversations_user_a_id_fkey", "conversations_user_b_id_fkey"):
+        # Новый диалог хранит пару упорядоченно: user_a — меньший из id
+        missing = min(sender_id, recipient_id)
+        if constraint == "conversations_user_b_id_fkey":
+            missing = max(sender_id, recipient_id)
+        constraint = "messages_sender_id_fkey" if missing == sender_id else "messages_recipient_id_fkey"
+    if constraint not in SEND_MESSAGE_ERRORS:
+        return None
+    status_code, detail = SEND_MESSAGE_ERRORS[constraint]
+    return HTTPException(status_code=status_code, detail=detail)
+
 
 @router.post("/", response_model=MessageOut, status_code=status.HTTP_201_CREATED)
 async def create_message(message: MessageCreate, sender_id: UUID):
-    """Создание нового сообщения"""
-
-    sender_exists = await db.fetchrow(
-        "SELECT id FROM users WHERE id = $1",
-        str(sender_id)
-    )
-    if not sender_exists:
+    """
+    Создание нового сообщения одним запросом: существование участников
+    и объявления проверяют внешние ключи и триггер, а диалог и счётчики
+    непрочитанных обновляются триггерами в той же транзакции
+    """
+    if sender_id == message.recipient_id:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Отправитель не найден"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Нельзя отправить сообщение самому себе"
         )
 
-    recipient_exists = await db.fetchrow(
-        "SELECT id FROM users WHERE id = $1",
-        str(message.recipient_id)
-    )
-    if not recipient_exists:
+    try:
+        new_message = await db.fetchrow(
+            SEND_MESSAGE_QUERY,
+            sender_id,
+            message.recipient_id,
+            message.ad_id,
+            message.text
+        )
+    except asyncpg.IntegrityConstraintViolationError as e:
+        error = send_message_error(e, sender_id, message.recipient_id)
+        if error is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Ошибка при создании сообщения"
+            )
+        raise error
+    except HTTPException:
+        raise
+    except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Получатель не найден"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при создании сообщения"
         )
 
-    if str(sender_id) == str(message.recipient_id):
+    invalidation_bus.publish(invalidation_key("unread", message.recipient_id))
+    return dict(new_message)
+
+
+# Диалоги пользователя: по индексу на каждую сторону пары, затем слияние.
+# {cursor} — условие keyset-курсора (last_message_at, id) или пусто
+CONVERSATIONS_QUERY = """
+WITH page AS (
+    (SELECT c.id, c.ad_id, c.user_b_id AS other_user_id, c.unread_a AS unread_count,
+            c.last_message_id, c.last_message_at
+     FROM conversations c
+     WHERE c.user_a_id = $1 {cursor}
+     ORDER BY c.last_message_at DESC, c.id DESC
+     LIMIT $2)
+    UNION ALL
+    (SELECT c.id, c.ad_id, c.user_a_id, c.unread_b,
+            c.last_message_id, c.last_message_at
+     FROM conversations c
+     WHERE c.user_b_id = $1 {cursor}
+     ORDER BY c.last_message_at DESC, c.id DESC
+     LIMIT $2)
+    ORDER BY last_message_at DESC, id DESC
+    LIMIT $2
+)
+SELECT p.id, p.ad_id, p.other_user_id, p.unread_count, p.last_message_at,
+       a.title AS ad_title, u.username AS other_username,
+       m.id AS message_id, m.sender_id, m.text, m.sent_at, m.is_read
+FROM page p
+JOIN ads a ON a.id = p.ad_id
+JOIN users u ON u.id = p.other_user_id
+LEFT JOIN messages m ON m.id = p.last_message_id
+ORDER BY p.last_message_at DESC, p.id DESC
+"""
+
+CONVERSATIONS_CURSOR = "AND (c.last_message_at, c.id) < ($3, $4)"
+
+
+def build_conversation_from_row(row) -> dict:
+    """Преобразование строки из БД в формат ConversationOut"""
+    last_message = None
+    if row["message_id"] is not None:
+        last_message = {
+            "id": row["message_id"],
+            "sender_id": row["sender_id"],
+            "text": row["text"],
+            "sent_at": row["sent_at"],
+            "is_read": row["is_read"],
+        }
+    return {
+        "id": row["id"],
+        "ad_id": row["ad_id"],
+        "ad_title": row["ad_title"],
+        "other_user": {"id": row["other_user_id"], "username": row["other_username"]},
+        "last_message": last_message,
+        "last_message_at": row["last_message_at"],
+        "unread_count": row["unread_count"],
+    }
+
+
+@router.get("/conversations", response_model=ConversationPage, response_class=FastJSONResponse)
+async def get_conversations(
+    user_id: UUID = Query(..., description="ID пользователя"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор из next_cursor предыдущего ответа"),
+    limit: int = Query(20, ge=1, le=100, description="Лимит диалогов"),
+):
+    """
+    Диалоги пользователя (объявление + собеседник) от последней активности:
+    последнее сообщение и число непрочитанных берутся из conversations,
+    а не считаются по сообщениям
+    """
+    position = decode_cursor(cursor, datetime, int)
+    if position is None:
+        query = CONVERSATIONS_QUERY.format(cursor="")
+        params = (user_id, limit + 1)
+    else:
+        query = CONVERSATIONS_QUERY.format(cursor=CONVERSATIONS_CURSOR)
+        params = (user_id, limit + 1, *position)
+
+    try:
+        rows = await db.fetch_read(query, *params)
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logging.error(f"Ошибка при получении диалогов: {str(e)}")
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Нельзя отправить сообщение самому себе"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при получении диалогов"
         )
 
-    ad_exists = await db.fetchrow(
-        "SELECT id, is_active FROM ads WHERE id = $1",
-        str(message.ad_id)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last["last_message_at"], last["id"])
+    return FastJSONResponse({
+        "conversations": [build_conversation_from_row(row) for row in rows],
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    })
+
+
+def format_message_event(message: dict, horizon: int) -> bytes:
+    """
+    Событие SSE. id — курсор для переподключения: горизонт транзакций
+    и последнее отданное сообщение (sent_at, id)
+    """
+    event_id = encode_cursor(horizon, message["sent_at"], message["id"])
+    data = {key: value for key, value in message.items() if key not in ("txid", "horizon")}
+    return b"id: " + event_id.encode() + b"\nevent: message\ndata: " + dumps(data) + b"\n\n"
+
+
+async def message_events(request: Request, user_id: UUID, position: Optional[tuple]):
+    """
+    Поток событий: догрузка из базы, затем новые сообщения из очереди
+    подписки. Позиция — горизонт транзакций (все младше него завершены
+    и отданы), а не sent_at: время начала транзакции не совпадает
+    с порядком фиксации. Догрузка идёт от горизонта, поэтому после
+    переподключения сообщения незавершённых тогда транзакций могут прийти
+    повторно (клиент отбрасывает их по id); в одном подключении
+    сообщение отдаётся один раз
+    """
+    recent = deque(maxlen=settings.MESSAGE_STREAM_QUEUE_SIZE * 10)
+    delivered = set()
+
+    def remember(message_id) -> bool:
+        message_id = str(message_id)
+        if message_id in delivered:
+            return False
+        if len(recent) == recent.maxlen:
+            delivered.discard(recent[0])
+        recent.append(message_id)
+        delivered.add(message_id)
+        return True
+
+    # Подписка до чтения горизонта: сообщение между ними придёт уведомлением
+    subscription = message_hub.subscribe(user_id)
+    try:
+        if position is None:
+            horizon = int(await db.fetchval(
+                "SELECT pg_snapshot_xmin(pg_current_snapshot())::text", pin_reads=False))
+        else:
+            horizon, _, last_message_id = position
+            remember(last_message_id)
+        yield f"retry: {int(settings.MESSAGE_STREAM_KEEPALIVE * 1000)}\n\n".encode()
+        catch_up = True
+        while True:
+            after = (horizon, UUID(int=0))
+            while catch_up:
+                rows = await message_hub.catch_up(
+                    user_id, *after, settings.MESSAGE_STREAM_CATCH_UP_LIMIT)
+                for message in rows:
+                    after = (message["txid"], UUID(str(message["id"])))
+                    # Младше min(txid, xmin снимка) всё видно и уже отдано этой догрузкой
+                    horizon = max(horizon, min(message["txid"], message["horizon"]))
+                    if remember(message["id"]):
+                        yield format_message_event(message, horizon)
+                catch_up = len(rows) == settings.MESSAGE_STREAM_CATCH_UP_LIMIT
+
+            try:
+                item = await asyncio.wait_for(
+                    subscription.queue.get(), settings.MESSAGE_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield b": ping\n\n"
+                continue
+
+            if item is RESYNC:
+                catch_up = True
+            elif remember(item["id"]):
+                # Уведомления идут в порядке фиксации: транзакции младше горизонта
+                # сообщения пришли раньше этого (или очередь сбрасывалась в RESYNC)
+                horizon = max(horizon, item["horizon"])
+                yield format_message_event(item, horizon)
+    finally:
+        message_hub.unsubscribe(subscription)
+
+
+@router.get("/stream")
+async def stream_messages(
+    request: Request,
+    user_id: UUID = Query(..., description="ID пользователя"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор (id последнего полученного события) для продолжения"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Новые входящие и исходящие сообщения пользователя (Server-Sent Events)
+    вместо опроса GET /messages/user/{user_id}. Браузер при переподключении
+    сам передаёт Last-Event-ID, и пропущенное догружается из базы; без
+    курсора поток начинается с текущего момента
+    """
+    position = decode_cursor(last_event_id or cursor, int, datetime, UUID)
+    return StreamingResponse(
+        message_events(request, user_id, position),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    if not ad_exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Объявление не найдено"
-        )
 
-    if not ad_exists["is_active"]:
+
+UNREAD_COUNTS_QUERY = "SELECT user_id, unread FROM user_unread_counts WHERE user_id = ANY($1::uuid[])"
+
+
+async def load_unread_counts(user_ids: list) -> dict:
+    """Счётчики из кэша, промахи одним запросом к основной базе"""
+    counts = {}
+    missing = []
+    for user_id in user_ids:
+        cached = unread_cache.get(user_id)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            counts[user_id] = cached
+
+    if missing:
+        generation = unread_cache.generation
+        rows = await db.fetch(UNREAD_COUNTS_QUERY, missing)
+        found = {row["user_id"]: row["unread"] for row in rows}
+        for user_id in missing:
+            counts[user_id] = found.get(user_id, 0)
+            unread_cache.set(user_id, counts[user_id], generation)
+    return counts
+
+
+@router.get("/unread-count")
+async def get_unread_count(user_id: UUID = Query(..., description="ID пользователя")):
+    """Число непрочитанных входящих (счётчик user_unread_counts, а не подсчёт сообщений)"""
+    counts = await load_unread_counts([user_id])
+    return {"user_id": user_id, "unread_count": counts[user_id]}
+
+
+@router.get("/unread-counts")
+async def get_unread_counts(
+    user_ids: List[UUID] = Query(..., description="ID пользователей (до 200)"),
+):
+    """Непрочитанные для нескольких пользователей за один запрос"""
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > 200:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Нельзя отправить сообщение к неактивному объявлению"
+            detail="Не более 200 пользователей за запрос"
         )
-
-    query = """
-    INSERT INTO messages (sender_id, recipient_id, ad_id, text, sent_at, is_read)
-    VALUES ($1, $2, $3, $4, NOW(), false)
-    RETURNING id, sender_id, recipient_id, ad_id, text, sent_at, is_read
+    counts = await load_unread_counts(user_ids)
+    return {"counts": {str(user_id): count for user_id, count in counts.items()}}
+
+
+# Поиск по сообщениям пользователя: каждая сторона (получатель, отправитель)
+# идёт по своему индексу GIN (участник, search_vector), ранжируются только
+# совпадения этого пользователя. {cursor} — условие keyset-курсора или пусто
+SEARCH_SIDE_QUERY = """
+    SELECT m.id, m.conversation_id, m.sender_id, m.recipient_id, m.ad_id, m.text,
+           m.sent_at, m.is_read, ts_rank(m.search_vector, q.query)::float8 AS rank
+    FROM messages m, q
+    WHERE m.{column} = $1 AND m.search_vector @@ q.query
+"""
+
+SEARCH_QUERY = """
+WITH q AS (SELECT websearch_to_tsquery('russian', $2) AS query),
+found AS ({sides}),
+page AS (
+    SELECT * FROM found
+    {cursor}
+    ORDER BY rank DESC, sent_at DESC, id DESC
+    LIMIT $3
+)
+SELECT p.*, s.username AS sender_username, r.username AS recipient_username,
+       a.title AS ad_title
+FROM page p
+JOIN users s ON s.id = p.sender_id
+JOIN users r ON r.id = p.recipient_id
+JOIN ads a ON a.id = p.ad_id
+ORDER BY p.rank DESC, p.sent_at DESC, p.id DESC
+"""
+
+SEARCH_CURSOR = "WHERE (rank, sent_at, id) < ($4, $5, $6)"
+
+SEARCH_COLUMNS = {
+    "received": ("recipient_id",),
+    "sent": ("sender_id",),
+    "all": ("recipient_id", "sender_id"),
+}
+
+
+@router.get("/search", response_class=FastJSONResponse)
+async def search_messages(
+    user_id: UUID = Query(..., description="ID пользователя"),
+    q: str = Query(..., min_length=1, max_length=200,
+                   description="Запрос: слова, \"фраза\", -исключение, or"),
+    direction: str = Query("all", regex="^(sent|received|all)$",
+                           description="Направление сообщений"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор из next_cursor предыдущего ответа"),
+    limit: int = Query(20, ge=1, le=100, description="Лимит сообщений"),
+):
+    """
+    Полнотекстовый поиск по сообщениям пользователя (морфология русского
+    языка), по убыванию релевантности, затем от новых к старым
     """
+    sides = "\n    UNION ALL\n".join(
+        f"({SEARCH_SIDE_QUERY.format(column=column)})"
+        for column in SEARCH_COLUMNS[direction]
+    )
+    position = decode_cursor(cursor, float, datetime, UUID)
+    params = [user_id, q, limit + 1]
+    if position is not None:
+        params.extend(position)
+    query = SEARCH_QUERY.format(
+        sides=sides, cursor=SEARCH_CURSOR if position is not None else "")
 
     try:
-        new_message = await db.fetchrow(
-            query,
-            str(sender_id),
-            str(message.recipient_id),
-            str(message.ad_id),
-            message.text
-        )
-        return dict(new_message)
+        rows = await db.fetch_read(query, *params)
+    except HTTPException:
+        raise
     except Exception as e:
+        import logging
+        logging.error(f"Ошибка при поиске сообщений: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Ошибка при создании сообщения"
+            detail="Ошибка при поиске сообщений"
         )
 
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    messages = []
+    for row in rows:
+        message = build_message_from_row(row)
+        message["rank"] = row["rank"]
+        messages.append(message)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last["rank"], last["sent_at"], last["id"])
+    return FastJSONResponse({
+        "messages": messages,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    })
+
 
 @router.get("/{message_id}", response_model=MessageOut)
 async def get_message(message_id: UUID = Path(..., description="Идентификатор сообщения")):
     """Получение сообщения по ID"""
 
     query = """
-    SELECT id, sender_id, recipient_id, ad_id, text, sent_at, is_read
+    SELECT id, conversation_id, sender_id, recipient_id, ad_id, text, sent_at, is_read
     FROM messages
     WHERE id = $1
     """
 
-    message = await db.fetchrow(query, str(message_id))
+    message = await db.fetchrow_read(query, message_id)
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -96,7 +465,24 @@ async def get_message(message_id: UUID = Path(..., description="Идентифи
     return dict(message)
 
 
-@router.get("/user/{user_id}", response_model=List[MessageOut])
+def build_message_from_row(msg) -> dict:
+    """Преобразование строки из БД в формат MessageOut"""
+    return {
+        "recipient_id": msg["recipient_id"],
+        "ad_id": msg["ad_id"],
+        "text": msg["text"],
+        "id": msg["id"],
+        "conversation_id": msg["conversation_id"],
+        "sender_id": msg["sender_id"],
+        "sent_at": msg["sent_at"],
+        "is_read": msg["is_read"],
+        "sender": {"username": msg["sender_username"]},
+        "recipient": {"username": msg["recipient_username"]},
+        "ad": {"title": msg["ad_title"]}
+    }
+
+
+@router.get("/user/{user_id}", response_model=List[MessageOut], response_class=FastJSONResponse)
 async def get_user_messages(
     user_id: UUID = Path(..., description="ID пользователя"),
     skip: int = Query(0, ge=0, description="Пропустить записей"),
@@ -111,44 +497,29 @@ async def get_user_messages(
 ):
     """Получение сообщений с поиском по тексту и username"""
 
-    base_query = """
+    qb = QueryBuilder("messages.user", """
     SELECT
-        m.id, m.sender_id, m.recipient_id, m.ad_id, m.text, m.sent_at, m.is_read,
+        m.id, m.conversation_id, m.sender_id, m.recipient_id, m.ad_id, m.text,
+        m.sent_at, m.is_read,
         s.username as sender_username, r.username as recipient_username,
         a.title as ad_title
     FROM messages m
     JOIN users s ON s.id = m.sender_id
     JOIN users r ON r.id = m.recipient_id
-    JOIN ads a ON a.id = m.ad_id
-    """
-
-    where_clauses = []
-    params = []
-    param_index = 1
+    JOIN ads a ON a.id = m.ad_id""")
 
     if direction == "sent":
-        where_clauses.append(f"m.sender_id = ${param_index}")
-        params.append(str(user_id))
-        param_index += 1
+        qb.where("m.sender_id = {}", user_id)
     elif direction == "received":
-        where_clauses.append(f"m.recipient_id = ${param_index}")
-        params.append(str(user_id))
-        param_index += 1
+        qb.where("m.recipient_id = {}", user_id)
     else:
-        where_clauses.append(
-            f"(m.sender_id = ${param_index} OR m.recipient_id = ${param_index})")
-        params.append(str(user_id))
-        param_index += 1
+        qb.where("(m.sender_id = {0} OR m.recipient_id = {0})", user_id)
 
     if ad_id is not None:
-        where_clauses.append(f"m.ad_id = ${param_index}")
-        params.append(str(ad_id))
-        param_index += 1
+        qb.where("m.ad_id = {}", ad_id)
 
     if is_read is not None:
-        where_clauses.append(f"m.is_read = ${param_index}")
-        params.append(is_read)
-        param_index += 1
+        qb.where("m.is_read = {}", is_read)
 
     if search is not None:
         clean_search = search.strip()
@@ -156,37 +527,17 @@ async def get_user_messages(
             clean_search = re.sub(r'[^а-яА-Яa-zA-Z0-9\s\-_]', ' ', clean_search).strip()
 
         if len(clean_search) >= 1:
-            where_clauses.append(
-                f"(LOWER(m.text) % ${param_index}"
-            )
-            params.append(clean_search.lower())
-            param_index += 1
+            # pg_trgm сам приводит регистр; LOWER() не дал бы использовать индекс по text
+            qb.where("m.text % {}", clean_search)
 
-    query_parts = [base_query]
-    if where_clauses:
-        query_parts.append("WHERE " + " AND ".join(where_clauses))
-    query_parts.append("ORDER BY m.sent_at DESC")
-    query_parts.append(f"LIMIT ${param_index} OFFSET ${param_index + 1}")
-    params.extend([limit, skip])
-    query = " ".join(query_parts)
+    query, params = qb.select(
+        "ORDER BY m.sent_at DESC LIMIT {} OFFSET {}", limit, skip)
 
     try:
-        messages = await db.fetch(query, *params)
-        return [
-            {
-                "id": msg["id"],
-                "sender_id": msg["sender_id"],
-                "recipient_id": msg["recipient_id"],
-                "ad_id": msg["ad_id"],
-                "text": msg["text"],
-                "sent_at": msg["sent_at"],
-                "is_read": msg["is_read"],
-                "sender": {"username": msg["sender_username"]},
-                "recipient": {"username": msg["recipient_username"]},
-                "ad": {"title": msg["ad_title"]}
-            }
-            for msg in messages
-        ]
+        messages = await db.fetch_read(query, *params)
+        return FastJSONResponse([build_message_from_row(msg) for msg in messages])
+    except HTTPException:
+        raise
     except Exception as e:
         import logging
         logging.error(f"Ошибка при поиске сообщений: {str(e)}")
@@ -196,6 +547,121 @@ async def get_user_messages(
         )
 
 
+# Отметка прочтения одним оператором: счётчики диалога и пользователя
+# меняет триггер на тот же оператор, в той же транзакции
+MARK_READ_QUERY = """
+UPDATE messages
+SET is_read = true
+WHERE id = $1 AND recipient_id = $2 AND NOT is_read
+RETURNING id, is_read
+"""
+
+MARK_IDS_READ_QUERY = """
+UPDATE messages
+SET is_read = true
+WHERE id = ANY($1::uuid[]) AND recipient_id = $2 AND NOT is_read
+RETURNING id
+"""
+
+# {bound} — верхняя граница по позиции (sent_at, id) в диалоге или пусто
+MARK_CONVERSATION_READ_QUERY = """
+UPDATE messages
+SET is_read = true
+WHERE conversation_id = $1 AND recipient_id = $2 AND NOT is_read {bound}
+RETURNING id
+"""
+
+CONVERSATION_BOUND_CURSOR = "AND (sent_at, id) <= ($3, $4)"
+
+CONVERSATION_BOUND_MESSAGE = """AND (sent_at, id) <= (
+    SELECT b.sent_at, b.id FROM messages b WHERE b.id = $3 AND b.conversation_id = $1
+)"""
+
+
+@router.put("/read", status_code=status.HTTP_200_OK)
+async def mark_messages_as_read(
+    read: MessagesMarkRead,
+    user_id: UUID = Query(..., description="Идентификатор получателя"),
+):
+    """
+    Отметить прочитанными сообщения из списка. Чужие и уже прочитанные
+    пропускаются; в ответе — id действительно отмеченных
+    """
+    message_ids = list(dict.fromkeys(read.message_ids))
+    try:
+        rows = await db.fetch(MARK_IDS_READ_QUERY, message_ids, user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logging.error(f"Ошибка при массовой отметке прочтения: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при обновлении статуса сообщений"
+        )
+
+    if rows:
+        invalidation_bus.publish(invalidation_key("unread", user_id))
+    return {"marked": len(rows), "ids": [row["id"] for row in rows]}
+
+
+@router.put("/conversations/{conversation_id}/read", status_code=status.HTTP_200_OK)
+async def mark_conversation_as_read(
+    conversation_id: int = Path(..., description="ID диалога"),
+    user_id: UUID = Query(..., description="Идентификатор получателя"),
+    cursor: Optional[str] = Query(
+        None, description="Прочитано до курсора включительно (id события потока сообщений)"),
+    up_to_message_id: Optional[UUID] = Query(
+        None, description="Прочитано до сообщения диалога включительно"),
+):
+    """
+    Отметить прочитанными входящие сообщения диалога — все или до позиции.
+    Один UPDATE по индексу диалога вместо запроса на каждое сообщение
+    """
+    if cursor is not None and up_to_message_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите либо cursor, либо up_to_message_id"
+        )
+
+    params = [conversation_id, user_id]
+    bound = ""
+    position = decode_cursor(cursor, int, datetime, UUID)
+    if position is not None:
+        bound = CONVERSATION_BOUND_CURSOR
+        params.extend(position[1:])
+    elif up_to_message_id is not None:
+        bound = CONVERSATION_BOUND_MESSAGE
+        params.append(up_to_message_id)
+
+    try:
+        rows = await db.fetch(MARK_CONVERSATION_READ_QUERY.format(bound=bound), *params)
+    except HTTPException:
+        raise
+    except Exception as e:
+        import logging
+        logging.error(f"Ошибка при отметке прочтения диалога: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при обновлении статуса сообщений"
+        )
+
+    if rows:
+        invalidation_bus.publish(invalidation_key("unread", user_id))
+    elif up_to_message_id is not None:
+        # Ничего не отмечено: граница могла не найтись в диалоге
+        message = await db.fetchrow(
+            "SELECT id FROM messages WHERE id = $1 AND conversation_id = $2",
+            up_to_message_id, conversation_id
+        )
+        if not message:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Сообщение не найдено в диалоге"
+            )
+    return {"marked": len(rows)}
+
+
 @router.put("/{message_id}/read", status_code=status.HTTP_200_OK)
 async def mark_message_as_read(
     message_id: UUID = Path(..., description="Идентификатор сообщения"),
@@ -203,38 +669,31 @@ async def mark_message_as_read(
 ):
     """Отметить сообщение как прочитанное"""
 
+    try:
+        updated_message = await db.fetchrow(MARK_READ_QUERY, message_id, user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ошибка при обновлении статуса сообщения"
+        )
+
+    if updated_message:
+        invalidation_bus.publish(invalidation_key("unread", user_id))
+        return {"message": "Сообщение отмечено как прочитанное", "data": dict(updated_message)}
+
+    # Ничего не обновлено: сообщение уже прочитано или не принадлежит получателю
     message = await db.fetchrow(
-        """
-        SELECT id, recipient_id, is_read
-        FROM messages
-        WHERE id = $1 AND recipient_id = $2
-        """,
-        str(message_id), str(user_id)
+        "SELECT id FROM messages WHERE id = $1 AND recipient_id = $2",
+        message_id, user_id
     )
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Сообщение не найдено или вы не являетесь получателем"
         )
-
-    if message["is_read"]:
-        return {"message": "Сообщение уже прочитано"}
-
-    query = """
-    UPDATE messages
-    SET is_read = true
-    WHERE id = $1
-    RETURNING id, is_read
-    """
-
-    try:
-        updated_message = await db.fetchrow(query, str(message_id))
-        return {"message": "Сообщение отмечено как прочитанное", "data": dict(updated_message)}
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Ошибка при обновлении статуса сообщения"
-        )
+    return {"message": "Сообщение уже прочитано"}
 
 
 @router.delete("/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -246,11 +705,11 @@ async def delete_message(
 
     message = await db.fetchrow(
         """
-        SELECT id, sender_id, recipient_id
+        SELECT id, sender_id, recipient_id, is_read
         FROM messages
         WHERE id = $1 AND (sender_id = $2 OR recipient_id = $2)
         """,
-        str(message_id), str(user_id)
+        message_id, user_id
     )
     if not message:
         raise HTTPException(
@@ -261,8 +720,12 @@ async def delete_message(
     query = "DELETE FROM messages WHERE id = $1"
 
     try:
-        await db.execute(query, str(message_id))
+        await db.execute(query, message_id)
+        if not message["is_read"]:
+            invalidation_bus.publish(invalidation_key("unread", message["recipient_id"]))
         return None
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
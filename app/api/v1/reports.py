@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, status, Query, Path
+from fastapi import APIRouter, HTTPException, status, Query, Path, Depends
 from uuid import UUID
 from typing import List, Optional
-from app.db.session import db
+from app.db.session import db, get_transaction, RequestConnection
+from app.db.queries import QueryBuilder, json_array_query
+from app.core.serialization import FastJSONResponse
+from app.config import settings
 
 router = APIRouter(prefix="/reports", tags=["Жалобы"])
 
@@ -18,11 +21,12 @@ async def create_report(
     ),
     description: str = Query("without a description",
                              description="Описание жалобы"),
+    conn: RequestConnection = Depends(get_transaction, scope="function"),
 ):
     """Создание новой жалобы"""
-    ad_exists = await db.fetchrow(
+    ad_exists = await conn.fetchrow(
         "SELECT id, user_id FROM ads WHERE id = $1 AND is_active = true",
-        str(ad_id)
+        ad_id
     )
     if not ad_exists:
         raise HTTPException(
@@ -30,9 +34,9 @@ async def create_report(
             detail="Объявление не найдено или неактивно"
         )
 
-    user_exists = await db.fetchrow(
+    user_exists = await conn.fetchrow(
         "SELECT id FROM users WHERE id = $1",
-        str(complainant_id)
+        complainant_id
     )
     if not user_exists:
         raise HTTPException(
@@ -40,7 +44,7 @@ async def create_report(
             detail="Пользователь не найден"
         )
 
-    if str(complainant_id) == str(ad_exists["user_id"]):
+    if complainant_id == ad_exists["user_id"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нельзя пожаловаться на собственное объявление"
@@ -62,14 +66,16 @@ async def create_report(
     """
 
     try:
-        new_report = await db.fetchrow(
+        new_report = await conn.fetchrow(
             query,
-            str(ad_id),
-            str(complainant_id),
+            ad_id,
+            complainant_id,
             reason,
             description
         )
         return dict(new_report)
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e).lower()
         if "unique" in error_msg or "already has an active report" in error_msg:
@@ -90,31 +96,26 @@ async def get_user_reports(
         None, regex="^(PENDING|IN_PROGRESS|RESOLVED|REJECTED)$", description="статус жалобы")
 ):
     """Получение жалоб пользователя"""
-    base_query = """
+    qb = QueryBuilder("reports.user", """
     SELECT
         r.id, r.ad_id, r.reason, r.description, r.status, r.created_at,
         a.title as ad_title, a.price as ad_price,
         u.username as reported_username
     FROM reports r
     JOIN ads a ON a.id = r.ad_id
-    JOIN users u ON u.id = r.reported_user_id
-    WHERE r.complainant_id = $1
-    """
-
-    params = [str(user_id)]
-    param_index = 2
+    JOIN users u ON u.id = r.reported_user_id""")
+    qb.where("r.complainant_id = {}", user_id)
 
     if status:
-        base_query += " AND r.status = $" + str(param_index)
-        params.append(status)
-        param_index += 1
+        qb.where("r.status = {}", status)
 
-    base_query += " ORDER BY r.created_at DESC"
-    query = base_query
+    query, params = qb.select("ORDER BY r.created_at DESC")
 
     try:
-        reports = await db.fetch(query, *params)
+        reports = await db.fetch_read(query, *params)
         return [dict(report) for report in reports]
+    except HTTPException:
+        raise
     except Exception as e:
         import logging
         logging.error(f"Ошибка при получении жалоб: {str(e)}")
@@ -124,6 +125,17 @@ async def get_user_reports(
         )
 
 
+# Документ жалобы для модерации, собираемый в базе (цена — строкой, как у Decimal)
+MODERATION_REPORT_JSON_DOCUMENT = """json_build_object(
+    'id', q.id, 'ad_id', q.ad_id, 'complainant_id', q.complainant_id,
+    'reported_user_id', q.reported_user_id, 'reason', q.reason,
+    'description', q.description, 'status', q.status,
+    'created_at', api_timestamp(q.created_at),
+    'ad_title', q.ad_title, 'ad_description', q.ad_description, 'ad_price', q.ad_price::text,
+    'complainant_username', q.complainant_username, 'reported_username', q.reported_username
+)"""
+
+
 @router.get("/moderation", response_model=List[dict])
 async def get_reports_for_moderation(
     status: str = Query(
@@ -153,8 +165,15 @@ async def get_reports_for_moderation(
     """
 
     try:
-        reports = await db.fetch(query, status, limit, skip)
+        if settings.DB_JSON_RENDERING:
+            body = await db.fetchval_read(
+                json_array_query(query, MODERATION_REPORT_JSON_DOCUMENT), status, limit, skip)
+            return FastJSONResponse(body)
+
+        reports = await db.fetch_read(query, status, limit, skip)
         return [dict(report) for report in reports]
+    except HTTPException:
+        raise
     except Exception as e:
         import logging
         logging.error(f"Ошибка при получении жалоб для модерации: {str(e)}")
@@ -180,7 +199,7 @@ async def resolve_report(
 
     report_exists = await db.fetchrow(
         "SELECT id, status FROM reports WHERE id = $1",
-        str(report_id)
+        report_id
     )
     if not report_exists:
         raise HTTPException(
@@ -206,10 +225,12 @@ async def resolve_report(
             query,
             status,
             resolution_comment,
-            str(moderator_id),
-            str(report_id)
+            moderator_id,
+            report_id
         )
         return dict(updated_report)
+    except HTTPException:
+        raise
     except Exception as e:
         import logging
         logging.error(f"Ошибка при обновлении жалобы: {str(e)}")
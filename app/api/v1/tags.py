@@ -1,11 +1,34 @@
 from fastapi import APIRouter, HTTPException, status, Query, Path, Body
 from typing import List, Optional
 from app.db.session import db
+from app.db.queries import QueryBuilder
+from app.core.invalidation import invalidation_bus, invalidation_key
+from app.core.shared_cache import SharedSnapshot
+from app.config import settings
 from app.schemas.tag import TagCreate, TagUpdate, TagOut
 import re
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
+tag_cache = invalidation_bus.cache("tags", ("tag",))
+
+
+async def load_tags() -> list:
+    """Все теги для общего снимка, с мастера"""
+    rows = await db.fetch("""
+    SELECT id, name, slug
+    FROM tags
+    ORDER BY name ASC
+    """)
+    return [dict(row) for row in rows]
+
+
+tags_snapshot = invalidation_bus.register(SharedSnapshot(
+    "tags", load_tags,
+    ttl=settings.SHARED_CACHE_REFERENCE_TTL,
+    entities=("tag",)
+))
+
 
 @router.post("/", response_model=TagOut, status_code=status.HTTP_201_CREATED)
 async def create_tag(tag: TagCreate):
@@ -38,7 +61,10 @@ async def create_tag(tag: TagCreate):
 
     try:
         new_tag = await db.fetchrow(query, tag.name, tag.slug)
+        invalidation_bus.publish(invalidation_key("tag", new_tag["id"]))
         return dict(new_tag)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -55,6 +81,13 @@ async def get_tag(tag_id: int):
     WHERE id = $1
     """
 
+    cached = tag_cache.get(tag_id)
+    if cached is not None:
+        return cached
+
+    # Промах читается с мастера: значение с отстающей реплики
+    # попало бы в кэш уже после инвалидации
+    generation = tag_cache.generation
     tag = await db.fetchrow(query, tag_id)
     if not tag:
         raise HTTPException(
@@ -62,7 +95,9 @@ async def get_tag(tag_id: int):
             detail="Тег не найден"
         )
 
-    return dict(tag)
+    tag_data = dict(tag)
+    tag_cache.set(tag_id, tag_data, generation)
+    return tag_data
 
 
 @router.get("/", response_model=List[TagOut])
@@ -75,13 +110,10 @@ async def get_tags(
         None, min_length=3, description="Подстрока для фильтрации тегов по названию и slug"),
 ):
     """Получение списка тегов с подстроковым поиском по name и slug"""
-    base_query = """
-    SELECT id, name, slug
-    FROM tags
-    """
-    where_clauses = []
-    params = []
-    param_index = 1
+    qb = QueryBuilder(
+        "tags.list",
+        "SELECT id, name, slug FROM tags"
+    )
 
     if search is not None:
         clean_search = search.strip()
@@ -91,25 +123,20 @@ async def get_tags(
 
         if len(clean_search) >= 3:
             pattern = f"%{clean_search}%"
-            where_clauses.append(
-                f"(name ILIKE ${param_index} OR slug ILIKE ${param_index})"
-            )
-            params.append(pattern)
-            param_index += 1
-
-    query_parts = [base_query]
-    if where_clauses:
-        query_parts.append("WHERE " + " AND ".join(where_clauses))
-
-    query_parts.append("ORDER BY name ASC")
-    query_parts.append(f"LIMIT ${param_index} OFFSET ${param_index + 1}")
-    params.extend([limit, skip])
+            qb.where("(name ILIKE {0} OR slug ILIKE {0})", pattern)
 
-    query = " ".join(query_parts)
+    query, params = qb.select(
+        "ORDER BY name ASC LIMIT {} OFFSET {}", limit, skip)
 
     try:
-        tags = await db.fetch(query, *params)
+        if qb.has_conditions:
+            tags = await db.fetch_read(query, *params)
+        else:
+            # Без фильтров страница вырезается из общего для воркеров снимка
+            tags = (await tags_snapshot.get())[skip:skip + limit]
         return [dict(tag) for tag in tags]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -133,9 +160,7 @@ async def update_tag(
             detail="Тег не найден"
         )
 
-    update_clauses = []
-    params = []
-    param_index = 1
+    qb = QueryBuilder("tags.update")
 
     if tag.name is not None:
         existing_name = await db.fetchrow(
@@ -147,9 +172,7 @@ async def update_tag(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Тег с таким названием уже существует"
             )
-        update_clauses.append("name = $" + str(param_index))
-        params.append(tag.name)
-        param_index += 1
+        qb.set("name", tag.name)
 
     if tag.slug is not None:
         existing_slug = await db.fetchrow(
@@ -161,25 +184,18 @@ async def update_tag(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Тег с таким slug уже существует"
             )
-        update_clauses.append("slug = $" + str(param_index))
-        params.append(tag.slug)
-        param_index += 1
+        qb.set("slug", tag.slug)
 
-    if not update_clauses:
+    if not qb.has_assignments:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нет полей для обновления"
         )
 
-    set_clause = ", ".join(update_clauses)
-    params.append(tag_id)
-
-    query = f"""
-    UPDATE tags
-    SET {set_clause}
-    WHERE id = ${param_index}
-    RETURNING id, name, slug
-    """
+    query, params = qb.update(
+        "tags", "id", tag_id,
+        "id, name, slug"
+    )
 
     try:
         updated_tag = await db.fetchrow(query, *params)
@@ -188,7 +204,10 @@ async def update_tag(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Тег не найден"
             )
+        invalidation_bus.publish(invalidation_key("tag", tag_id))
         return dict(updated_tag)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -213,7 +232,10 @@ async def delete_tag(tag_id: int = Path(..., description="Идентификат
 
     try:
         await db.execute(query, tag_id)
+        invalidation_bus.publish(invalidation_key("tag", tag_id))
         return None
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
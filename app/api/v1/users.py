@@ -2,8 +2,10 @@ from fastapi import (APIRouter, HTTPException, status, Query, Path, Body)
 from uuid import UUID
 from typing import List, Optional
 from app.db.session import db
+from app.db.queries import QueryBuilder
 from app.schemas.user import UserCreate, UserUpdate, UserOut
 from app.core.security import get_password_hash
+from app.core.jobs import job_queue
 
 router = APIRouter(prefix="/users", tags=["Пользователи"])
 
@@ -58,6 +60,8 @@ async def create_user(user: UserCreate):
     try:
         new_user = await db.fetchrow(query, *params)
         return dict(new_user)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -78,7 +82,7 @@ async def get_user(
     WHERE id = $1
     """
 
-    user = await db.fetchrow(query, str(user_id))
+    user = await db.fetchrow_read(query, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -102,36 +106,26 @@ async def get_users(
         None, min_length=3, description="Строка для поиска"),
 ):
     """Получение списка пользователей"""
-    query_parts = [
-        "SELECT id, email, username, first_name, last_name, role, created_at, is_verified, is_banned, avatar_url FROM users WHERE 1=1"
-    ]
-    params = []
-    param_count = 1
+    qb = QueryBuilder(
+        "users.list",
+        "SELECT id, email, username, first_name, last_name, role, created_at, is_verified, is_banned, avatar_url FROM users"
+    )
 
     if search is not None:
-        query_parts.append(
-            f" AND (username || ' ' || COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')) % ${param_count}"
+        qb.where(
+            "(username || ' ' || COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')) % {}",
+            search
         )
-        params.append(search)
-        param_count += 1
 
     if role:
-        query_parts.append(f" AND role = ${param_count}")
-        params.append(role)
-        param_count += 1
+        qb.where("role = {}", role)
 
     if is_banned is not None:
-        query_parts.append(f" AND is_banned = ${param_count}")
-        params.append(is_banned)
-        param_count += 1
-
-    query_parts.append(
-        f" ORDER BY created_at DESC LIMIT ${param_count} OFFSET ${param_count + 1}"
-    )
-    params.extend([limit, skip])
+        qb.where("is_banned = {}", is_banned)
 
-    query = " ".join(query_parts)
-    users = await db.fetch(query, *params)
+    query, params = qb.select(
+        "ORDER BY created_at DESC LIMIT {} OFFSET {}", limit, skip)
+    users = await db.fetch_read(query, *params)
 
     return [dict(user) for user in users]
 
@@ -144,7 +138,7 @@ async def update_user(
     """Обновление информации о пользователе"""
     existing_user = await db.fetchrow(
         "SELECT id FROM users WHERE id = $1",
-        str(user_id)
+        user_id
     )
     if not existing_user:
         raise HTTPException(
@@ -152,93 +146,68 @@ async def update_user(
             detail="Пользователь не найден"
         )
 
-    update_fields = []
-    params = []
-    param_count = 1
+    qb = QueryBuilder("users.update")
 
     if user.email:
         existing_email = await db.fetchrow(
             "SELECT id FROM users WHERE email = $1 AND id != $2",
-            user.email, str(user_id)
+            user.email, user_id
         )
         if existing_email:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email уже используется другим пользователем"
             )
-        update_fields.append(f"email = ${param_count}")
-        params.append(user.email)
-        param_count += 1
+        qb.set("email", user.email)
 
     if user.phone:
         existing_phone = await db.fetchrow(
             "SELECT id FROM users WHERE phone = $1 AND id != $2",
-            user.phone, str(user_id)
+            user.phone, user_id
         )
         if existing_phone:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Телефон уже используется другим пользователем"
             )
-        update_fields.append(f"phone = ${param_count}")
-        params.append(user.phone)
-        param_count += 1
+        qb.set("phone", user.phone)
 
     if user.username:
-        update_fields.append(f"username = ${param_count}")
-        params.append(user.username)
-        param_count += 1
+        qb.set("username", user.username)
 
     if user.first_name:
-        update_fields.append(f"first_name = ${param_count}")
-        params.append(user.first_name)
-        param_count += 1
+        qb.set("first_name", user.first_name)
 
     if user.last_name:
-        update_fields.append(f"last_name = ${param_count}")
-        params.append(user.last_name)
-        param_count += 1
+        qb.set("last_name", user.last_name)
 
     if user.role:
-        update_fields.append(f"role = ${param_count}")
-        params.append(user.role)
-        param_count += 1
+        qb.set("role", user.role)
 
     if user.is_verified is not None:
-        update_fields.append(f"is_verified = ${param_count}")
-        params.append(user.is_verified)
-        param_count += 1
+        qb.set("is_verified", user.is_verified)
 
     if user.is_banned is not None:
-        update_fields.append(f"is_banned = ${param_count}")
-        params.append(user.is_banned)
-        param_count += 1
+        qb.set("is_banned", user.is_banned)
 
     if user.avatar_url is not None:
-        update_fields.append(f"avatar_url = ${param_count}")
-        params.append(user.avatar_url)
-        param_count += 1
+        qb.set("avatar_url", user.avatar_url)
 
     if user.password:
         hashed_password = get_password_hash(user.password)
-        update_fields.append(f"password_hash = ${param_count}")
-        params.append(hashed_password)
-        param_count += 1
+        qb.set("password_hash", hashed_password)
 
-    if not update_fields:
+    if not qb.has_assignments:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Нет полей для обновления"
         )
 
-    params.append(str(user_id))
-    query = f"""
-    UPDATE users
-    SET {', '.join(update_fields)}
-    WHERE id = ${param_count}
-    RETURNING id, email, username, first_name, last_name, role,
-              created_at, is_verified, is_banned, avatar_url
-    """
+    query, params = qb.update(
+        "users", "id", user_id,
+        "id, email, username, first_name, last_name, role, "
+        "created_at, is_verified, is_banned, avatar_url"
+    )
 
     try:
         updated_user = await db.fetchrow(query, *params)
@@ -248,6 +217,8 @@ async def update_user(
                 detail="Пользователь не найден"
             )
         return dict(updated_user)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -261,7 +232,7 @@ async def delete_user(user_id: UUID = Path(..., description="Идентифик
 
     existing_user = await db.fetchrow(
         "SELECT id FROM users WHERE id = $1",
-        str(user_id)
+        user_id
     )
     if not existing_user:
         raise HTTPException(
@@ -272,10 +243,33 @@ async def delete_user(user_id: UUID = Path(..., description="Идентифик
     query = "DELETE FROM users WHERE id = $1"
 
     try:
-        await db.execute(query, str(user_id))
+        await db.execute(query, user_id)
         return None
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Ошибка при удалении пользователя: {str(e)}"
         )
+
+
+@router.post("/{user_id}/purge", status_code=status.HTTP_202_ACCEPTED)
+async def purge_user(user_id: UUID = Path(..., description="Идентификатор пользователя")):
+    """
+    Фоновое удаление пользователя с объявлениями, сообщениями и избранным
+    пачками — для аккаунтов, которые DELETE /users/{user_id} удалял бы
+    одной долгой транзакцией. Ход выполнения — GET /jobs/{job_id}
+    """
+    existing_user = await db.fetchrow(
+        "SELECT id FROM users WHERE id = $1",
+        user_id
+    )
+    if not existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Пользователь не найден"
+        )
+
+    job = await job_queue.enqueue("users.purge", {"user_id": str(user_id)})
+    return {"job_id": job["id"], "status": job["status"]}
@@ -2,10 +2,17 @@ from fastapi import APIRouter, HTTPException, status, Query, Path
 from uuid import UUID
 from typing import Optional
 from app.db.session import db
+from app.config import settings
+from app.core.invalidation import invalidation_bus
+from app.core.singleflight import SWRCache
 
 
 router = APIRouter(prefix="/views", tags=["Просмотры"])
 
+views_stats_cache = invalidation_bus.register(SWRCache(
+    "views_stats", settings.STATISTICS_FRESH_TTL, settings.STATISTICS_STALE_TTL,
+    entity="ad"))
+
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def record_view(
@@ -17,7 +24,7 @@ async def record_view(
 
     ad_exists = await db.fetchrow(
         "SELECT id FROM ads WHERE id = $1 AND is_active = true",
-        str(ad_id)
+        ad_id
     )
     if not ad_exists:
         raise HTTPException(
@@ -28,7 +35,7 @@ async def record_view(
     if user_id:
         user_exists = await db.fetchrow(
             "SELECT id FROM users WHERE id = $1",
-            str(user_id)
+            user_id
         )
         if not user_exists:
             raise HTTPException(
@@ -42,8 +49,11 @@ async def record_view(
     """
 
     try:
-        await db.execute(query, str(ad_id), str(user_id) if user_id else None, device)
+        await db.execute(query, ad_id, user_id, device,
+                         pin_reads=False)
         return {"message": "Просмотр записан"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -51,18 +61,13 @@ async def record_view(
         )
 
 
-@router.get("/stats/{ad_id}")
-async def get_ad_views_stats(ad_id: UUID = Path(..., description="Уникальный идентификатор объявления")):
-    """Получение статистики просмотров для объявления"""
-    ad_exists = await db.fetchrow(
+async def load_views_stats(ad_id: UUID) -> Optional[dict]:
+    ad_exists = await db.fetchrow_read(
         "SELECT id, views_count FROM ads WHERE id = $1",
-        str(ad_id)
+        ad_id
     )
     if not ad_exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Объявление не найдено"
-        )
+        return None
 
     total_views_query = """
     SELECT
@@ -85,30 +90,43 @@ async def get_ad_views_stats(ad_id: UUID = Path(..., description="Уникаль
     ORDER BY date DESC
     """
 
+    total_stats = await db.fetchrow_read(total_views_query, ad_id)
+    daily_stats = await db.fetch_read(daily_stats_query, ad_id)
+
+    return {
+        "ad_id": str(ad_id),
+        "current_views_count": ad_exists["views_count"],
+        "total_views_recorded": total_stats["total_views"],
+        "unique_users": total_stats["unique_users"],
+        "device_breakdown": {
+            "mobile": total_stats["mobile_views"],
+            "pc": total_stats["pc_views"]
+        },
+        "daily_stats": [
+            {
+                "date": stat["date"].isoformat(),
+                "views_count": stat["views_count"],
+                "unique_users": stat["unique_users"]
+            }
+            for stat in daily_stats
+        ]
+    }
+
+
+@router.get("/stats/{ad_id}")
+async def get_ad_views_stats(ad_id: UUID = Path(..., description="Уникальный идентификатор объявления")):
+    """Получение статистики просмотров для объявления"""
     try:
-        total_stats = await db.fetchrow(total_views_query, str(ad_id))
-        daily_stats = await db.fetch(daily_stats_query, str(ad_id))
-
-        return {
-            "ad_id": str(ad_id),
-            "current_views_count": ad_exists["views_count"],
-            "total_views_recorded": total_stats["total_views"],
-            "unique_users": total_stats["unique_users"],
-            "device_breakdown": {
-                "mobile": total_stats["mobile_views"],
-                "pc": total_stats["pc_views"]
-            },
-            "daily_stats": [
-                {
-                    "date": stat["date"].isoformat(),
-                    "views_count": stat["views_count"],
-                    "unique_users": stat["unique_users"]
-                }
-                for stat in daily_stats
-            ]
-        }
+        stats = await views_stats_cache.get(str(ad_id), lambda: load_views_stats(ad_id))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Ошибка при получении статистики: {str(e)}"
         )
+
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Объявление не найдено"
+        )
+    return stats
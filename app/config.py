@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import ClassVar
+from typing import ClassVar, Optional
 
 
 class Settings(BaseSettings):
@@ -9,6 +9,75 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str
     POSTGRES_PORT: int = 5432
     DATABASE_URL: str
+    DATABASE_REPLICA_URL: Optional[str] = None
+
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 10
+    DB_POOL_MAX_QUERIES: int = 50000
+    DB_POOL_MAX_INACTIVE_LIFETIME: float = 300.0
+    DB_ACQUIRE_TIMEOUT: float = 2.0
+    DB_COMMAND_TIMEOUT: Optional[float] = None
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_MAX_CACHED_STATEMENT_LIFETIME: int = 300
+    DB_MAX_CACHEABLE_STATEMENT_SIZE: int = 15360
+    DB_APPLICATION_NAME: str = "advertisements-api"
+    DB_JSON_RENDERING: bool = True
+    EXPORT_CURSOR_PREFETCH: int = 500
+
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_HEALTHCHECK_INTERVAL: float = 5.0
+    REPLICA_HEALTHCHECK_TIMEOUT: float = 2.0
+    READ_YOUR_WRITES_WINDOW: float = 5.0
+
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0
+    SLOW_QUERY_MAX_FINGERPRINTS: int = 500
+    SLOW_QUERY_LOG_INTERVAL: int = 300
+    SLOW_QUERY_LOG_TOP_N: int = 10
+
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 10
+
+    LISTENER_KEEPALIVE_INTERVAL: float = 30.0
+    LISTENER_RECONNECT_MAX_DELAY: float = 30.0
+    CACHE_TTL: float = 300.0
+    CACHE_MAX_SIZE: int = 1024
+    CACHE_INVALIDATION_CHANNEL: str = "cache_invalidation"
+    CACHE_INVALIDATION_WINDOW: float = 0.05
+    CACHE_INVALIDATION_MAX_KEYS: int = 50
+    SHARED_CACHE_NAMESPACE: str = "adsapi"
+    SHARED_CACHE_CAPACITY: int = 4 * 1024 * 1024
+    SHARED_CACHE_REFERENCE_TTL: float = 300.0
+    SHARED_CACHE_ANALYTICS_TTL: float = 60.0
+    ANALYTICS_FRESH_TTL: float = 60.0
+    ANALYTICS_STALE_TTL: float = 600.0
+    STATISTICS_FRESH_TTL: float = 10.0
+    STATISTICS_STALE_TTL: float = 120.0
+
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_RETRY_INTERVAL: float = 30.0
+    MAINTENANCE_BATCH_SIZE: int = 5000
+    OUTBOX_RETENTION_DAYS: int = 7
+    AUDIT_VIEWS_RETENTION_DAYS: int = 30
+    ADS_EXPIRY_DAYS: Optional[int] = None
+
+    MESSAGE_STREAM_QUEUE_SIZE: int = 100
+    MESSAGE_STREAM_KEEPALIVE: float = 15.0
+    MESSAGE_STREAM_CATCH_UP_LIMIT: int = 100
+    UNREAD_CACHE_TTL: float = 30.0
+    FAVORITES_SET_CACHE_TTL: float = 300.0
+    FAVORITES_SET_MAX_IDS: int = 5000
+    FAVORITE_CHANGES_RETENTION_DAYS: int = 30
+
+    JOBS_CHANNEL: str = "background_jobs"
+    JOBS_VISIBILITY_TIMEOUT: float = 60.0
+    JOBS_RETRY_BASE_DELAY: float = 5.0
+    JOBS_RETRY_MAX_DELAY: float = 600.0
+    JOBS_RETENTION_DAYS: int = 7
+    WORKER_CONCURRENCY: int = 4
+    WORKER_POLL_INTERVAL: float = 5.0
+    WORKER_SHUTDOWN_GRACE: float = 30.0
 
     API_V1_STR: ClassVar[str] = "/api/v1"
 
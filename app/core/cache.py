@@ -0,0 +1,75 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Локальный кэш воркера с временем жизни записей и ограничением размера (LRU).
+    Первая из entities — сущность, по идентификатору которой хранятся записи:
+    ключ инвалидации "entity:id" удаляет одну запись, "entity:*" — все.
+    Остальные entities — зависимости: любое их изменение сбрасывает кэш целиком.
+    Пока кэш приостановлен (нет подписки на инвалидацию), чтения идут мимо него.
+    generation растёт при каждой инвалидации: значение, прочитанное из базы
+    до инвалидации, в кэш не попадёт (см. set).
+    """
+
+    def __init__(self, name: str, entities: tuple, ttl: float, max_size: int = 1024):
+        self.name = name
+        self.entity = entities[0]
+        self.dependencies = set(entities[1:])
+        self.ttl = ttl
+        self.max_size = max_size
+        self.active = False
+        self.generation = 0
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        if not self.active:
+            self.misses += 1
+            return default
+        entry = self._data.get(str(key))
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return default
+        self._data.move_to_end(str(key))
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, generation: int = None):
+        """generation — значение self.generation до чтения из базы"""
+        if not self.active or (generation is not None and generation != self.generation):
+            return
+        self._data[str(key)] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(str(key))
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: str):
+        entity, _, ident = key.partition(":")
+        if entity != self.entity and entity not in self.dependencies:
+            return
+        self.generation += 1
+        if entity in self.dependencies or (entity == self.entity and ident == "*"):
+            self.invalidations += len(self._data)
+            self._data.clear()
+        elif entity == self.entity and self._data.pop(ident, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "active": self.active,
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,44 @@
+import base64
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+import orjson
+from fastapi import HTTPException, status
+from app.core.serialization import dumps
+
+# Преобразование значений курсора обратно из JSON
+CURSOR_TYPES = {
+    datetime: datetime.fromisoformat,
+    UUID: UUID,
+    int: int,
+    float: float,
+    str: str,
+}
+
+
+def encode_cursor(*values) -> str:
+    """
+    Непрозрачный курсор keyset-пагинации: значения ключа сортировки
+    последней выданной строки (JSON в base64url без выравнивания)
+    """
+    return base64.urlsafe_b64encode(dumps(list(values))).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: Optional[str], *types) -> Optional[tuple]:
+    """
+    Значения курсора, приведённые к types (datetime, UUID, int, float, str);
+    None без курсора, 400 на повреждённый или чужой курсор
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = orjson.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("число значений")
+        return tuple(CURSOR_TYPES[kind](value) for kind, value in zip(types, values))
+    except (ValueError, TypeError, KeyError, orjson.JSONDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор"
+        )
@@ -0,0 +1,198 @@
+import asyncio
+import inspect
+import logging
+import time
+from datetime import datetime, timezone
+from app.config import settings
+from app.db.session import db
+
+FETCH_EVENTS_QUERY = """
+SELECT id, entity_type, entity_id, event_type, payload, created_at, attempts
+FROM outbox_events
+WHERE processed_at IS NULL
+  AND available_at <= NOW()
+  AND attempts < $2
+ORDER BY id
+LIMIT $1
+FOR UPDATE SKIP LOCKED
+"""
+
+MARK_PROCESSED_QUERY = """
+UPDATE outbox_events SET processed_at = NOW() WHERE id = ANY($1::bigint[])
+"""
+
+MARK_FAILED_QUERY = """
+UPDATE outbox_events AS o
+SET attempts = o.attempts + 1,
+    last_error = f.error,
+    available_at = NOW() + make_interval(secs => f.delay)
+FROM unnest($1::bigint[], $2::text[], $3::float8[]) AS f(id, error, delay)
+WHERE o.id = f.id
+"""
+
+BACKLOG_QUERY = """
+SELECT
+    COUNT(*) FILTER (WHERE attempts < $1) AS pending,
+    COUNT(*) FILTER (WHERE attempts >= $1) AS dead,
+    EXTRACT(EPOCH FROM NOW() - MIN(created_at) FILTER (WHERE attempts < $1)) AS oldest_pending_seconds
+FROM outbox_events
+WHERE processed_at IS NULL
+"""
+
+
+class OutboxEvent:
+    """Событие из outbox: тип сущности, идентификатор, тип изменения и снимок строки"""
+
+    __slots__ = ("id", "entity_type", "entity_id", "event_type",
+                 "payload", "created_at", "attempts")
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.entity_type = row["entity_type"]
+        self.entity_id = row["entity_id"]
+        self.event_type = row["event_type"]
+        self.payload = row["payload"]
+        self.created_at = row["created_at"]
+        self.attempts = row["attempts"]
+
+    def __repr__(self):
+        return f"<OutboxEvent {self.id} {self.entity_type}:{self.entity_id} {self.event_type}>"
+
+
+class EventDispatcher:
+    """
+    Доставка событий outbox обработчикам внутри процесса.
+    Пачка выбирается FOR UPDATE SKIP LOCKED, поэтому несколько воркеров
+    делят очередь без пересечений. Событие помечается обработанным в той же
+    транзакции после успешного вызова всех обработчиков (at-least-once):
+    при падении процесса оно будет доставлено повторно, так что обработчики
+    должны быть идемпотентными. Ошибка откладывает событие с экспоненциальной
+    задержкой; после OUTBOX_MAX_ATTEMPTS попыток оно остаётся в таблице
+    с last_error и больше не выбирается.
+    """
+
+    def __init__(self, batch_size: int, poll_interval: float, max_attempts: int,
+                 retry_base_delay: float = 1.0, retry_max_delay: float = 300.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._handlers = {}
+        self.delivered = 0
+        self.failed = 0
+        self.batches = 0
+        self.by_entity = {}
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.last_batch_at = None
+        self.last_error = None
+
+    def subscribe(self, entity_type: str, handler=None):
+        """
+        Регистрация обработчика событий сущности ("*" — все сущности).
+        Можно использовать как декоратор: @dispatcher.subscribe("ad")
+        """
+        if handler is None:
+            def decorator(func):
+                self.subscribe(entity_type, func)
+                return func
+            return decorator
+        self._handlers.setdefault(entity_type, []).append(handler)
+        return handler
+
+    def handlers_for(self, entity_type: str) -> list:
+        return self._handlers.get(entity_type, []) + self._handlers.get("*", [])
+
+    async def deliver(self, event: OutboxEvent):
+        for handler in self.handlers_for(event.entity_type):
+            result = handler(event)
+            if inspect.isawaitable(result):
+                await result
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.retry_base_delay * 2 ** attempts, self.retry_max_delay)
+
+    async def dispatch_batch(self) -> int:
+        """Обработка одной пачки; возвращает число выбранных событий"""
+        async with db.acquire() as connection:
+            async with connection.transaction():
+                rows = await connection.fetch(
+                    FETCH_EVENTS_QUERY, self.batch_size, self.max_attempts)
+                if not rows:
+                    return 0
+
+                processed = []
+                failed_ids, errors, delays = [], [], []
+                for row in rows:
+                    event = OutboxEvent(row)
+                    try:
+                        await self.deliver(event)
+                    except Exception as e:
+                        logging.error(f"Ошибка обработки события {event!r}: {str(e)}")
+                        failed_ids.append(event.id)
+                        errors.append(str(e)[:1000])
+                        delays.append(self.retry_delay(event.attempts))
+                        self.last_error = str(e)
+                        continue
+                    processed.append(event.id)
+                    self._account(event)
+
+                if processed:
+                    await connection.execute(MARK_PROCESSED_QUERY, processed)
+                if failed_ids:
+                    await connection.execute(
+                        MARK_FAILED_QUERY, failed_ids, errors, delays)
+
+        self.batches += 1
+        self.failed += len(failed_ids)
+        self.last_batch_at = time.time()
+        return len(rows)
+
+    def _account(self, event: OutboxEvent):
+        self.delivered += 1
+        self.by_entity[event.entity_type] = self.by_entity.get(event.entity_type, 0) + 1
+        lag = (datetime.now(timezone.utc) - event.created_at).total_seconds()
+        self.last_lag = lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+    async def run(self):
+        """Фоновый цикл: пачки подряд, пока очередь не опустеет, затем опрос"""
+        while True:
+            try:
+                count = await self.dispatch_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка диспетчера outbox: {str(e)}")
+                self.last_error = str(e)
+                count = 0
+            if count < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def stats(self) -> dict:
+        backlog = await db.fetchrow(BACKLOG_QUERY, self.max_attempts)
+        oldest = backlog["oldest_pending_seconds"]
+        return {
+            "pending": backlog["pending"],
+            "dead": backlog["dead"],
+            "oldest_pending_seconds": float(oldest) if oldest is not None else None,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed,
+            "batches": self.batches,
+            "delivered_by_entity": self.by_entity,
+            "last_lag_seconds": self.last_lag,
+            "max_lag_seconds": self.max_lag,
+            "last_batch_at": datetime.fromtimestamp(
+                self.last_batch_at, timezone.utc).isoformat() if self.last_batch_at else None,
+            "last_error": self.last_error,
+            "handlers": {name: len(handlers) for name, handlers in self._handlers.items()},
+        }
+
+
+dispatcher = EventDispatcher(
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS
+)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from app.config import settings
+from app.core.cache import TTLCache
+from app.core.events import dispatcher
+from app.db.listener import listener
+
+# Предел полезной нагрузки NOTIFY — 8000 байт
+MAX_PAYLOAD_BYTES = 7900
+
+
+def invalidation_key(entity: str, ident="*") -> str:
+    """Ключ инвалидации: "category:5" или "ad:*" для всей сущности"""
+    return f"{entity}:{ident}"
+
+
+class InvalidationBus:
+    """
+    Межворкерная инвалидация локальных кэшей через LISTEN/NOTIFY.
+    Писатель вызывает publish: свои кэши чистятся сразу, ключи копятся
+    в окне window и уходят одним NOTIFY, так что массовые операции
+    (batch_create_ads, пачка outbox) дают одно сообщение. Если ключей
+    одной сущности в окне больше max_keys, они сворачиваются в "entity:*".
+    Каждый воркер слушает канал и удаляет записи у себя. Пока соединение
+    LISTEN потеряно, уведомления пропадают, поэтому кэши приостанавливаются,
+    а при восстановлении очищаются целиком.
+    """
+
+    def __init__(self, channel: str, window: float, max_keys: int):
+        self.channel = channel
+        self.window = window
+        self.max_keys = max_keys
+        self._caches = []
+        self._pending = set()
+        self._flush_task = None
+        self.published_keys = 0
+        self.published_messages = 0
+        self.received_keys = 0
+        self.collapsed = 0
+        self.full_flushes = 0
+        self.publish_errors = 0
+
+    def cache(self, name: str, entities: tuple, ttl: float = None,
+              max_size: int = None) -> TTLCache:
+        """Создание кэша, подписанного на инвалидацию"""
+        cache = TTLCache(
+            name, entities,
+            ttl=ttl if ttl is not None else settings.CACHE_TTL,
+            max_size=max_size if max_size is not None else settings.CACHE_MAX_SIZE
+        )
+        cache.active = listener.connected
+        return self.register(cache)
+
+    def register(self, cache):
+        """Подписка кэша с методами invalidate, clear и stats (например, SharedSnapshot)"""
+        self._caches.append(cache)
+        return cache
+
+    def evict(self, keys):
+        for key in keys:
+            for cache in self._caches:
+                cache.invalidate(key)
+
+    def publish(self, *keys: str):
+        """Инвалидация ключей во всех воркерах (вызывать после фиксации записи)"""
+        self.evict(keys)
+        self._pending.update(keys)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def pack(self, keys) -> list:
+        """Сворачивание ключей по сущностям и нарезка на сообщения по пределу NOTIFY"""
+        by_entity = {}
+        for key in keys:
+            entity, _, ident = key.partition(":")
+            by_entity.setdefault(entity, set()).add(ident)
+
+        packed = []
+        for entity, idents in sorted(by_entity.items()):
+            if "*" in idents or len(idents) > self.max_keys:
+                if "*" not in idents:
+                    self.collapsed += len(idents)
+                packed.append(invalidation_key(entity))
+            else:
+                packed.extend(invalidation_key(entity, ident) for ident in sorted(idents))
+
+        payloads, current, size = [], [], 0
+        for key in packed:
+            key_size = len(key.encode()) + 1
+            if current and size + key_size > MAX_PAYLOAD_BYTES:
+                payloads.append(",".join(current))
+                current, size = [], 0
+            current.append(key)
+            size += key_size
+        if current:
+            payloads.append(",".join(current))
+        return payloads
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        keys, self._pending = self._pending, set()
+        for payload in self.pack(keys):
+            try:
+                await listener.notify(self.channel, payload)
+            except Exception as e:
+                # Остальные воркеры увидят изменения по истечении TTL
+                self.publish_errors += 1
+                logging.error(f"Не удалось разослать инвалидацию кэша: {str(e)}")
+                continue
+            self.published_messages += 1
+            self.published_keys += payload.count(",") + 1
+
+    def receive(self, payload: str):
+        keys = payload.split(",")
+        self.received_keys += len(keys)
+        self.evict(keys)
+
+    def on_listener_state(self, connected: bool):
+        """Полный сброс при потере и восстановлении LISTEN: пропущенные ключи неизвестны"""
+        self.full_flushes += 1
+        for cache in self._caches:
+            cache.clear()
+            cache.active = connected
+
+    def stats(self) -> dict:
+        return {
+            "channel": self.channel,
+            "listener": listener.stats(),
+            "published_keys": self.published_keys,
+            "published_messages": self.published_messages,
+            "received_keys": self.received_keys,
+            "collapsed_keys": self.collapsed,
+            "full_flushes": self.full_flushes,
+            "publish_errors": self.publish_errors,
+            "pending": len(self._pending),
+            "caches": [cache.stats() for cache in self._caches],
+        }
+
+
+invalidation_bus = InvalidationBus(
+    settings.CACHE_INVALIDATION_CHANNEL,
+    window=settings.CACHE_INVALIDATION_WINDOW,
+    max_keys=settings.CACHE_INVALIDATION_MAX_KEYS
+)
+listener.listen(invalidation_bus.channel, invalidation_bus.receive)
+listener.on_state_change(invalidation_bus.on_listener_state)
+
+
+@dispatcher.subscribe("*")
+def invalidate_on_event(event):
+    """Изменения сущностей с outbox-триггерами (объявления, пользователи и т.д.)"""
+    invalidation_bus.publish(invalidation_key(event.entity_type, event.entity_id))
@@ -0,0 +1,72 @@
+from typing import List
+import asyncpg
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+from app.api.v1.batch_import import insert_ads, validate_batch
+from app.core.jobs import PermanentJobError, job_queue
+from app.core.maintenance import run_in_batches
+from app.db.session import db
+from app.schemas.ad import AdCreate2
+
+AD_BATCH = TypeAdapter(List[AdCreate2])
+
+# Порядок важен: сначала зависимые строки небольшими пачками,
+# чтобы итоговый DELETE пользователя не каскадил миллионы строк одной транзакцией
+PURGE_USER_STEPS = (
+    ("views", """
+    UPDATE views SET user_id = NULL
+    WHERE id IN (SELECT id FROM views WHERE user_id = $1 LIMIT $2)
+    """),
+    ("favorites", """
+    DELETE FROM favorites
+    WHERE (user_id, ad_id) IN (SELECT user_id, ad_id FROM favorites WHERE user_id = $1 LIMIT $2)
+    """),
+    ("sent_messages", """
+    DELETE FROM messages
+    WHERE id IN (SELECT id FROM messages WHERE sender_id = $1 LIMIT $2)
+    """),
+    ("received_messages", """
+    DELETE FROM messages
+    WHERE id IN (SELECT id FROM messages WHERE recipient_id = $1 LIMIT $2)
+    """),
+    ("ads", """
+    DELETE FROM ads
+    WHERE id IN (SELECT id FROM ads WHERE user_id = $1 LIMIT $2)
+    """),
+)
+
+
+@job_queue.handler("ads.batch_import", concurrency=2, timeout=600, max_attempts=3)
+async def batch_import_ads(payload: dict) -> dict:
+    """Фоновая версия POST /batch-import/ads; пачка вставляется одной транзакцией"""
+    try:
+        ads = AD_BATCH.validate_python(payload.get("ads") or [])
+        await validate_batch(ads)
+    except ValidationError as e:
+        raise PermanentJobError(str(e))
+    except HTTPException as e:
+        raise PermanentJobError(e.detail)
+
+    # Нарушение ограничения повтором не исправить (синхронный эндпоинт отвечает 400)
+    try:
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                ad_ids = await insert_ads(conn, ads)
+    except asyncpg.IntegrityConstraintViolationError as e:
+        raise PermanentJobError(f"Ошибка при массовой вставке: {str(e)}")
+    return {"created_count": len(ad_ids), "ad_ids": [str(ad_id) for ad_id in ad_ids]}
+
+
+@job_queue.handler("users.purge", concurrency=1, timeout=3600)
+async def purge_user(payload: dict) -> dict:
+    """Удаление пользователя со всеми данными; повтор после сбоя продолжает с места остановки"""
+    user_id = payload.get("user_id")
+    if not user_id:
+        raise PermanentJobError("В задании нет user_id")
+
+    affected = {}
+    for name, query in PURGE_USER_STEPS:
+        affected[name] = await run_in_batches(query, user_id)
+    result = await db.execute("DELETE FROM users WHERE id = $1", user_id, pin_reads=False)
+    affected["user"] = int(result.split()[-1])
+    return affected
@@ -0,0 +1,237 @@
+import random
+from typing import Optional
+from app.config import settings
+from app.db.session import db
+
+# Первый ключ пары pg_advisory_xact_lock(int, int): выдача заданий одного типа
+CLAIM_LOCK_NAMESPACE = 4041
+
+JOB_COLUMNS = """
+id, job_type, payload, status, priority, attempts, max_attempts, run_after,
+locked_until, locked_by, result, last_error, created_at, started_at, finished_at
+"""
+
+ENQUEUE_QUERY = f"""
+WITH job AS (
+    INSERT INTO background_jobs (job_type, payload, priority, max_attempts, run_after)
+    VALUES ($1, $2, $3, $4, NOW() + make_interval(secs => $5))
+    RETURNING {JOB_COLUMNS}
+)
+SELECT job.* FROM job, pg_notify($6, job.job_type)
+"""
+
+GET_JOB_QUERY = f"SELECT {JOB_COLUMNS} FROM background_jobs WHERE id = $1"
+
+CLAIM_LOCK_QUERY = "SELECT pg_advisory_xact_lock($1, hashtext($2))"
+
+RUNNING_COUNT_QUERY = """
+SELECT COUNT(*) FROM background_jobs
+WHERE job_type = $1 AND status = 'RUNNING' AND locked_until > NOW()
+"""
+
+# Задание с истёкшей арендой (воркер упал или завис) выдаётся повторно,
+# пока есть попытки; исчерпавшее попытки тем же оператором становится DEAD —
+# fail() до него не доходит, раз обработчик не вернул управление
+CLAIM_QUERY = f"""
+WITH exhausted AS (
+    UPDATE background_jobs
+    SET status = 'DEAD', finished_at = NOW(), locked_until = NULL,
+        last_error = 'Аренда истекла на последней попытке (воркер упал или завис)'
+    WHERE job_type = $1 AND status = 'RUNNING' AND locked_until < NOW()
+      AND attempts >= max_attempts
+)
+UPDATE background_jobs
+SET status = 'RUNNING',
+    attempts = attempts + 1,
+    locked_until = NOW() + make_interval(secs => $3),
+    locked_by = $4,
+    started_at = NOW()
+WHERE id IN (
+    SELECT id FROM background_jobs
+    WHERE job_type = $1
+      AND ((status = 'QUEUED' AND run_after <= NOW())
+           OR (status = 'RUNNING' AND locked_until < NOW() AND attempts < max_attempts))
+    ORDER BY priority DESC, run_after, id
+    LIMIT $2
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING {JOB_COLUMNS}
+"""
+
+HEARTBEAT_QUERY = """
+UPDATE background_jobs
+SET locked_until = NOW() + make_interval(secs => $3)
+WHERE id = $1 AND locked_by = $2 AND status = 'RUNNING'
+"""
+
+COMPLETE_QUERY = """
+UPDATE background_jobs
+SET status = 'DONE', result = $3, finished_at = NOW(),
+    locked_until = NULL, last_error = NULL
+WHERE id = $1 AND locked_by = $2 AND status = 'RUNNING'
+"""
+
+RETRY_QUERY = """
+UPDATE background_jobs
+SET status = 'QUEUED', last_error = $3, locked_until = NULL, locked_by = NULL,
+    run_after = NOW() + make_interval(secs => $4)
+WHERE id = $1 AND locked_by = $2 AND status = 'RUNNING'
+"""
+
+DEAD_QUERY = """
+UPDATE background_jobs
+SET status = 'DEAD', last_error = $3, finished_at = NOW(), locked_until = NULL
+WHERE id = $1 AND locked_by = $2 AND status = 'RUNNING'
+"""
+
+# Остановка воркера: незавершённые задания возвращаются в очередь без потери попытки
+RELEASE_QUERY = """
+UPDATE background_jobs
+SET status = 'QUEUED', attempts = GREATEST(attempts - 1, 0),
+    locked_until = NULL, locked_by = NULL
+WHERE id = ANY($1::bigint[]) AND locked_by = $2 AND status = 'RUNNING'
+"""
+
+STATS_QUERY = """
+SELECT job_type, status, COUNT(*) AS count,
+       EXTRACT(EPOCH FROM NOW() - MIN(run_after) FILTER (
+           WHERE status = 'QUEUED' AND run_after <= NOW())) AS oldest_ready_seconds
+FROM background_jobs
+GROUP BY job_type, status
+ORDER BY job_type, status
+"""
+
+
+class PermanentJobError(Exception):
+    """Ошибка, при которой повтор бессмыслен (неверные данные): задание сразу DEAD"""
+
+
+class JobType:
+    """Тип задания: обработчик и ограничения"""
+
+    def __init__(self, name: str, func, concurrency: int, timeout: float,
+                 max_attempts: int):
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+
+class JobQueue:
+    """
+    Очередь фоновых заданий в таблице background_jobs.
+    Воркеры (python -m app.worker) забирают задания через
+    FOR UPDATE SKIP LOCKED и получают аренду на visibility_timeout секунд,
+    продлевая её, пока задание выполняется; задание упавшего воркера
+    после истечения аренды выдаётся снова. concurrency типа — предел
+    одновременно выполняемых заданий на весь кластер: выдача одного типа
+    сериализуется advisory-блокировкой транзакции. Ошибка возвращает
+    задание в очередь с экспоненциальной задержкой, после max_attempts
+    (или PermanentJobError) оно остаётся со статусом DEAD.
+    """
+
+    def __init__(self, channel: str, visibility_timeout: float,
+                 retry_base_delay: float, retry_max_delay: float):
+        self.channel = channel
+        self.visibility_timeout = visibility_timeout
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.types = {}
+
+    def handler(self, job_type: str, concurrency: int = 1, timeout: float = 300.0,
+                max_attempts: int = 5):
+        """Регистрация обработчика: async def handler(payload: dict) -> результат (JSON)"""
+        def decorator(func):
+            self.types[job_type] = JobType(job_type, func, concurrency, timeout, max_attempts)
+            return func
+        return decorator
+
+    async def enqueue(self, job_type: str, payload: dict, priority: int = 0,
+                      delay: float = 0.0, max_attempts: Optional[int] = None,
+                      conn=None):
+        """
+        Постановка задания; с conn — в транзакции вызывающего
+        (задание появится только вместе с его изменениями)
+        """
+        if job_type not in self.types:
+            raise ValueError(f"Неизвестный тип задания: {job_type}")
+        args = (
+            job_type, payload, priority,
+            max_attempts or self.types[job_type].max_attempts,
+            delay, self.channel
+        )
+        if conn is not None:
+            return await conn.fetchrow(ENQUEUE_QUERY, *args)
+        return await db.fetchrow(ENQUEUE_QUERY, *args, pin_reads=False)
+
+    async def get(self, job_id: int):
+        return await db.fetchrow(GET_JOB_QUERY, job_id, pin_reads=False)
+
+    async def claim(self, job_type: str, limit: int, worker_id: str) -> list:
+        """Выдача до limit заданий типа с учётом предела concurrency на кластер"""
+        jobs = self.types[job_type]
+        async with db.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(CLAIM_LOCK_QUERY, CLAIM_LOCK_NAMESPACE, job_type)
+                running = await connection.fetchval(RUNNING_COUNT_QUERY, job_type)
+                limit = min(limit, jobs.concurrency - running)
+                if limit <= 0:
+                    return []
+                return await connection.fetch(
+                    CLAIM_QUERY, job_type, limit, self.visibility_timeout, worker_id)
+
+    async def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Продление аренды; False, если задание уже выдано другому воркеру"""
+        result = await db.execute(
+            HEARTBEAT_QUERY, job_id, worker_id, self.visibility_timeout, pin_reads=False)
+        return result != "UPDATE 0"
+
+    async def complete(self, job_id: int, worker_id: str, result) -> bool:
+        status = await db.execute(COMPLETE_QUERY, job_id, worker_id, result, pin_reads=False)
+        return status != "UPDATE 0"
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_base_delay * 2 ** max(attempts - 1, 0), self.retry_max_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def fail(self, job, worker_id: str, error: str, permanent: bool = False) -> str:
+        """Повтор с задержкой или DEAD; возвращает новый статус"""
+        if permanent or job["attempts"] >= job["max_attempts"]:
+            await db.execute(DEAD_QUERY, job["id"], worker_id, error, pin_reads=False)
+            return "DEAD"
+        await db.execute(
+            RETRY_QUERY, job["id"], worker_id, error,
+            self.retry_delay(job["attempts"]), pin_reads=False)
+        return "QUEUED"
+
+    async def release(self, job_ids: list, worker_id: str):
+        if job_ids:
+            await db.execute(RELEASE_QUERY, job_ids, worker_id, pin_reads=False)
+
+    async def stats(self) -> dict:
+        rows = await db.fetch(STATS_QUERY, pin_reads=False)
+        by_type = {
+            name: {
+                "concurrency": job_type.concurrency,
+                "timeout": job_type.timeout,
+                "max_attempts": job_type.max_attempts,
+                "statuses": {},
+                "oldest_ready_seconds": None,
+            }
+            for name, job_type in self.types.items()
+        }
+        for row in rows:
+            item = by_type.setdefault(row["job_type"], {"statuses": {}, "oldest_ready_seconds": None})
+            item["statuses"][row["status"]] = row["count"]
+            if row["oldest_ready_seconds"] is not None:
+                item["oldest_ready_seconds"] = float(row["oldest_ready_seconds"])
+        return by_type
+
+
+job_queue = JobQueue(
+    settings.JOBS_CHANNEL,
+    visibility_timeout=settings.JOBS_VISIBILITY_TIMEOUT,
+    retry_base_delay=settings.JOBS_RETRY_BASE_DELAY,
+    retry_max_delay=settings.JOBS_RETRY_MAX_DELAY
+)
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from app.config import settings
+from app.core.scheduler import scheduler
+from app.db.session import db
+from app.db.slow_queries import slow_query_log
+
+# Удаление и обновление пачками: короткие транзакции не держат блокировки
+# и не раздувают WAL одним большим запросом
+OUTBOX_CLEANUP_QUERY = """
+DELETE FROM outbox_events
+WHERE id IN (
+    SELECT id FROM outbox_events
+    WHERE processed_at < NOW() - make_interval(days => $1)
+    LIMIT $2
+)
+"""
+
+AUDIT_VIEWS_CLEANUP_QUERY = """
+DELETE FROM ad_audit_log
+WHERE id IN (
+    SELECT id FROM ad_audit_log
+    WHERE action = 'VIEWS_INCREMENTED'
+      AND changed_at < NOW() - make_interval(days => $1)
+    LIMIT $2
+)
+"""
+
+JOBS_CLEANUP_QUERY = """
+DELETE FROM background_jobs
+WHERE id IN (
+    SELECT id FROM background_jobs
+    WHERE status = 'DONE'
+      AND finished_at < NOW() - make_interval(days => $1)
+    LIMIT $2
+)
+"""
+
+FAVORITE_CHANGES_CLEANUP_QUERY = """
+DELETE FROM favorite_changes
+WHERE id IN (
+    SELECT id FROM favorite_changes
+    WHERE changed_at < NOW() - make_interval(days => $1)
+    LIMIT $2
+)
+"""
+
+EXPIRE_ADS_QUERY = """
+UPDATE ads SET is_active = false
+WHERE id IN (
+    SELECT id FROM ads
+    WHERE is_active = true
+      AND created_at < NOW() - make_interval(days => $1)
+    LIMIT $2
+    FOR UPDATE SKIP LOCKED
+)
+"""
+
+
+async def run_in_batches(query: str, *args) -> int:
+    """Повтор запроса, пока он затрагивает полную пачку; возвращает число строк"""
+    total = 0
+    while True:
+        result = await db.execute(query, *args, settings.MAINTENANCE_BATCH_SIZE, pin_reads=False)
+        affected = int(result.split()[-1])
+        total += affected
+        if affected < settings.MAINTENANCE_BATCH_SIZE:
+            return total
+        await asyncio.sleep(0)
+
+
+@scheduler.job("slow_query_dump", interval=settings.SLOW_QUERY_LOG_INTERVAL, leader=False)
+def dump_slow_queries():
+    """Статистика запросов своя у каждого процесса, поэтому задача без лидера"""
+    slow_query_log.log_top(settings.SLOW_QUERY_LOG_TOP_N)
+
+
+@scheduler.job("outbox_cleanup", cron="15 * * * *", jitter=30)
+async def cleanup_outbox():
+    deleted = await run_in_batches(OUTBOX_CLEANUP_QUERY, settings.OUTBOX_RETENTION_DAYS)
+    if deleted:
+        logging.info(f"Удалено обработанных событий outbox: {deleted}")
+
+
+@scheduler.job("audit_views_retention", cron="30 3 * * *", jitter=60)
+async def cleanup_view_audit():
+    deleted = await run_in_batches(AUDIT_VIEWS_CLEANUP_QUERY, settings.AUDIT_VIEWS_RETENTION_DAYS)
+    if deleted:
+        logging.info(f"Удалено записей аудита о просмотрах: {deleted}")
+
+
+@scheduler.job("background_jobs_cleanup", cron="45 * * * *", jitter=30)
+async def cleanup_background_jobs():
+    """DEAD-задания остаются для разбора, удаляются только успешно завершённые"""
+    deleted = await run_in_batches(JOBS_CLEANUP_QUERY, settings.JOBS_RETENTION_DAYS)
+    if deleted:
+        logging.info(f"Удалено завершённых фоновых заданий: {deleted}")
+
+
+@scheduler.job("favorite_changes_retention", cron="50 3 * * *", jitter=60)
+async def cleanup_favorite_changes():
+    """Клиент с курсором старше срока хранения получает полную синхронизацию"""
+    deleted = await run_in_batches(
+        FAVORITE_CHANGES_CLEANUP_QUERY, settings.FAVORITE_CHANGES_RETENTION_DAYS)
+    if deleted:
+        logging.info(f"Удалено записей журнала избранного: {deleted}")
+
+
+if settings.ADS_EXPIRY_DAYS:
+    @scheduler.job("expire_ads", interval=3600, jitter=60)
+    async def expire_ads():
+        expired = await run_in_batches(EXPIRE_ADS_QUERY, settings.ADS_EXPIRY_DAYS)
+        if expired:
+            logging.info(f"Снято с публикации по сроку: {expired}")
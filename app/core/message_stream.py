@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from datetime import datetime
+from uuid import UUID
+import orjson
+from app.config import settings
+from app.db.listener import listener
+from app.db.session import db
+
+# Канал задан в триггере notify_new_message (init-db/02init_trigers.sql)
+MESSAGES_CHANNEL = "new_messages"
+
+MESSAGE_COLUMNS = "id, conversation_id, sender_id, recipient_id, ad_id, text, sent_at, is_read"
+
+MESSAGE_QUERY = f"SELECT {MESSAGE_COLUMNS} FROM messages WHERE id = $1"
+
+# Сообщения пользователя после позиции (txid, id) в порядке транзакций:
+# по индексу на получателя и на отправителя, затем слияние. horizon —
+# xmin снимка запроса: все транзакции младше него уже завершены
+CATCH_UP_QUERY = f"""
+SELECT {MESSAGE_COLUMNS}, m.txid::text AS txid,
+       pg_snapshot_xmin(pg_current_snapshot())::text AS horizon
+FROM (
+    (SELECT {MESSAGE_COLUMNS}, txid FROM messages
+     WHERE recipient_id = $1 AND (txid, id) > ($2::text::xid8, $3)
+     ORDER BY txid, id
+     LIMIT $4)
+    UNION ALL
+    (SELECT {MESSAGE_COLUMNS}, txid FROM messages
+     WHERE sender_id = $1 AND (txid, id) > ($2::text::xid8, $3)
+     ORDER BY txid, id
+     LIMIT $4)
+) m
+ORDER BY m.txid, m.id
+LIMIT $4
+"""
+
+# Маркер в очереди подписки: уведомления могли потеряться, нужна догрузка из базы
+RESYNC = object()
+
+
+class Subscription:
+    """Одно подключение клиента: ограниченная очередь новых сообщений"""
+
+    def __init__(self, user_id: str, queue_size: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def push(self, item) -> bool:
+        """
+        Неблокирующая доставка. Медленный клиент не задерживает остальных:
+        при переполнении очередь сбрасывается, и поток догружает пропущенное
+        из базы со своей позиции. False — очередь была переполнена
+        """
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self.resync()
+            return False
+
+    def resync(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+
+
+class MessageHub:
+    """
+    Раздача новых сообщений подключённым к воркеру клиентам.
+    Воркер слушает канал new_messages на общем соединении LISTEN
+    и передаёт сообщение подпискам получателя и отправителя (другие
+    устройства). Пока LISTEN недоступен, уведомления теряются,
+    поэтому после переподключения все подписки догружают сообщения из базы.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscriptions = {}
+        self.delivered = 0
+        self.fetched = 0
+        self.overflows = 0
+
+    def subscribe(self, user_id) -> Subscription:
+        subscription = Subscription(str(user_id), self.queue_size)
+        self._subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    async def dispatch(self, payload: str):
+        message = orjson.loads(payload)
+        targets = [
+            subscription
+            for user_id in (message["recipient_id"], message["sender_id"])
+            for subscription in self._subscriptions.get(user_id, ())
+        ]
+        if not targets:
+            return
+        if "text" not in message:
+            # Длинный текст не поместился в уведомление
+            self.fetched += 1
+            try:
+                row = await db.fetchrow(MESSAGE_QUERY, UUID(message["id"]), pin_reads=False)
+            except Exception as e:
+                logging.error(f"Ошибка чтения сообщения {message['id']} для push: {str(e)}")
+                for subscription in targets:
+                    subscription.resync()
+                return
+            if row is None:
+                return
+            message = {**dict(row), "txid": message["txid"], "horizon": message["horizon"]}
+        else:
+            message["sent_at"] = datetime.fromisoformat(message["sent_at"])
+        message["txid"] = int(message["txid"])
+        message["horizon"] = int(message["horizon"])
+        for subscription in targets:
+            if subscription.push(message):
+                self.delivered += 1
+            else:
+                self.overflows += 1
+
+    def on_listener_state(self, connected: bool):
+        if connected:
+            for subscriptions in self._subscriptions.values():
+                for subscription in subscriptions:
+                    subscription.resync()
+
+    async def catch_up(self, user_id, txid: int, message_id, limit: int) -> list:
+        """Сообщения пользователя после (txid, id); с основной базы, реплика может отставать"""
+        rows = await db.fetch(
+            CATCH_UP_QUERY, user_id, str(txid), message_id, limit, pin_reads=False)
+        return [
+            {**dict(row), "txid": int(row["txid"]), "horizon": int(row["horizon"])}
+            for row in rows
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscriptions),
+            "connections": sum(len(s) for s in self._subscriptions.values()),
+            "delivered": self.delivered,
+            "fetched": self.fetched,
+            "overflows": self.overflows,
+        }
+
+
+message_hub = MessageHub(settings.MESSAGE_STREAM_QUEUE_SIZE)
+listener.listen(MESSAGES_CHANNEL, message_hub.dispatch)
+listener.on_state_change(message_hub.on_listener_state)
@@ -0,0 +1,328 @@
+import asyncio
+import inspect
+import logging
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from app.config import settings
+from app.db.session import db
+
+# Первый ключ пары pg_try_advisory_lock(int, int): пространство блокировок планировщика
+ADVISORY_LOCK_NAMESPACE = 4040
+
+REGISTER_JOB_QUERY = """
+INSERT INTO scheduled_jobs (name, schedule, next_run_at)
+VALUES ($1, $2, $3)
+ON CONFLICT (name) DO UPDATE
+SET schedule = EXCLUDED.schedule,
+    next_run_at = CASE
+        WHEN scheduled_jobs.schedule = EXCLUDED.schedule THEN scheduled_jobs.next_run_at
+        ELSE EXCLUDED.next_run_at
+    END
+"""
+
+NEXT_RUN_QUERY = "SELECT next_run_at FROM scheduled_jobs WHERE name = $1"
+
+TRY_LOCK_QUERY = "SELECT pg_try_advisory_lock($1, hashtext($2))"
+UNLOCK_QUERY = "SELECT pg_advisory_unlock($1, hashtext($2))"
+
+START_RUN_QUERY = """
+UPDATE scheduled_jobs
+SET last_started_at = NOW(), last_runner = $2
+WHERE name = $1
+"""
+
+FINISH_RUN_QUERY = """
+UPDATE scheduled_jobs
+SET last_finished_at = NOW(),
+    last_duration_ms = $2,
+    last_status = $3,
+    last_error = $4,
+    next_run_at = $5,
+    run_count = run_count + 1,
+    failure_count = failure_count + CASE WHEN $3 = 'FAILED' THEN 1 ELSE 0 END
+WHERE name = $1
+"""
+
+JOBS_STATUS_QUERY = """
+SELECT name, schedule, next_run_at, last_started_at, last_finished_at,
+       last_duration_ms, last_status, last_error, last_runner, run_count, failure_count
+FROM scheduled_jobs
+WHERE name = ANY($1::text[])
+"""
+
+CRON_FIELDS = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+)
+
+
+class CronSchedule:
+    """
+    Расписание в формате cron из пяти полей (минута, час, день, месяц,
+    день недели; 0 и 7 — воскресенье), время UTC. Поддерживаются *, списки,
+    диапазоны и шаг: "*/15 * * * *", "30 3 * * 1-5".
+    """
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Ожидается 5 полей cron: {expression!r}")
+        self.expression = expression
+        self.fields = {}
+        for part, (name, low, high) in zip(parts, CRON_FIELDS):
+            self.fields[name] = self._parse(part, low, high)
+        # Воскресенье — и 0, и 7; заменяются разобранные значения, а не текст поля
+        self.fields["weekday"] = {0 if v == 7 else v for v in self.fields["weekday"]}
+        # Как в cron: если ограничены и день месяца, и день недели, достаточно любого
+        self.day_or_weekday = parts[2] != "*" and parts[4] != "*"
+
+    @staticmethod
+    def _parse(part: str, low: int, high: int) -> set:
+        values = set()
+        for item in part.split(","):
+            value_range, _, step = item.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(v) for v in value_range.split("-"))
+            else:
+                start = int(value_range)
+                end = high if step else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Значение вне диапазона {low}-{high}: {item!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.fields["day"]
+        weekday = (moment.isoweekday() % 7) in self.fields["weekday"]
+        return (day or weekday) if self.day_or_weekday else (day and weekday)
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайший момент строго после moment"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.fields["month"]:
+                month = moment.month % 12 + 1
+                moment = moment.replace(
+                    year=moment.year + (month == 1), month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if moment.hour not in self.fields["hour"]:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+                continue
+            if moment.minute not in self.fields["minute"]:
+                moment += timedelta(minutes=1)
+                continue
+            return moment
+        raise ValueError(f"Расписание {self.expression!r} не срабатывает")
+
+    def __str__(self):
+        return self.expression
+
+
+class IntervalSchedule:
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Интервал должен быть положительным")
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+    def __str__(self):
+        return f"every {self.seconds:g}s"
+
+
+class Job:
+    """Периодическая задача и её состояние в текущем процессе"""
+
+    def __init__(self, name: str, func, schedule, jitter: float = 0.0,
+                 timeout: float = None, leader: bool = True):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter = jitter
+        self.timeout = timeout
+        self.leader = leader
+        self.running = False
+        self.next_run_at = None
+        self.last_started_at = None
+        self.last_duration_ms = None
+        self.last_status = None
+        self.last_error = None
+        self.runs = 0
+        self.skipped = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "schedule": str(self.schedule),
+            "leader": self.leader,
+            "running": self.running,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "last_started_at": self.last_started_at.isoformat() if self.last_started_at else None,
+            "last_duration_ms": self.last_duration_ms,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "skipped": self.skipped,
+        }
+
+
+class Scheduler:
+    """
+    Планировщик периодических задач внутри процесса (интервал или cron, UTC).
+    Задачи с leader=True выполняет один воркер на всю базу: перед запуском
+    берётся pg_try_advisory_lock, а срок следующего запуска хранится
+    в scheduled_jobs, поэтому остальные воркеры, проснувшись, видят, что
+    запуск уже сделан, и пропускают его. jitter разносит пробуждение
+    воркеров. Задачи с leader=False (например, выгрузка статистики
+    процесса) выполняются в каждом воркере. Один запуск задачи не
+    пересекается с другим ни в процессе, ни между процессами.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._tasks = []
+        self.runner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def job(self, name: str, interval: float = None, cron: str = None,
+            jitter: float = 0.0, timeout: float = None, leader: bool = True):
+        """Регистрация задачи декоратором: @scheduler.job("name", interval=300)"""
+        if (interval is None) == (cron is None):
+            raise ValueError("Нужно указать ровно одно из interval и cron")
+        schedule = IntervalSchedule(interval) if interval is not None else CronSchedule(cron)
+
+        def decorator(func):
+            if name in self.jobs:
+                raise ValueError(f"Задача {name} уже зарегистрирована")
+            self.jobs[name] = Job(name, func, schedule, jitter, timeout, leader)
+            return func
+        return decorator
+
+    async def _call(self, job: Job):
+        result = job.func()
+        if inspect.isawaitable(result):
+            if job.timeout:
+                await asyncio.wait_for(result, timeout=job.timeout)
+            else:
+                await result
+
+    async def _execute(self, job: Job) -> str:
+        job.running = True
+        job.last_started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        error = None
+        try:
+            await self._call(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            logging.error(f"Ошибка задачи {job.name}: {error}")
+        finally:
+            job.running = False
+            job.runs += 1
+            job.last_duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            job.last_status = "FAILED" if error else "SUCCESS"
+            job.last_error = error
+        return job.last_status
+
+    async def _run_local(self, job: Job):
+        job.next_run_at = job.schedule.next_after(datetime.now(timezone.utc))
+        while True:
+            delay = (job.next_run_at - datetime.now(timezone.utc)).total_seconds()
+            await asyncio.sleep(max(delay, 0) + random.uniform(0, job.jitter))
+            await self._execute(job)
+            job.next_run_at = job.schedule.next_after(datetime.now(timezone.utc))
+
+    async def _run_leader(self, job: Job):
+        await db.execute(
+            REGISTER_JOB_QUERY, job.name, str(job.schedule),
+            job.schedule.next_after(datetime.now(timezone.utc)), pin_reads=False)
+        while True:
+            job.next_run_at = await db.fetchval(NEXT_RUN_QUERY, job.name, pin_reads=False)
+            delay = (job.next_run_at - datetime.now(timezone.utc)).total_seconds()
+            await asyncio.sleep(max(delay, 0) + random.uniform(0, job.jitter))
+            await self._run_if_due(job)
+
+    async def _run_if_due(self, job: Job):
+        """Запуск под advisory lock, если срок в scheduled_jobs наступил"""
+        async with db.acquire() as connection:
+            locked = await connection.fetchval(
+                TRY_LOCK_QUERY, ADVISORY_LOCK_NAMESPACE, job.name)
+            if not locked:
+                job.skipped += 1
+                return
+            try:
+                next_run_at = await connection.fetchval(NEXT_RUN_QUERY, job.name)
+                if next_run_at > datetime.now(timezone.utc):
+                    # Запуск уже выполнил другой воркер
+                    job.skipped += 1
+                    return
+                await connection.execute(START_RUN_QUERY, job.name, self.runner)
+                status = await self._execute(job)
+                await connection.execute(
+                    FINISH_RUN_QUERY, job.name, job.last_duration_ms, status,
+                    job.last_error, job.schedule.next_after(datetime.now(timezone.utc)))
+            finally:
+                await connection.fetchval(UNLOCK_QUERY, ADVISORY_LOCK_NAMESPACE, job.name)
+
+    async def _supervise(self, job: Job):
+        """Цикл задачи; ошибки планировщика (например, недоступная база) не останавливают его"""
+        runner = self._run_leader if job.leader else self._run_local
+        while True:
+            try:
+                await runner(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка планировщика для задачи {job.name}: {str(e)}")
+                await asyncio.sleep(settings.SCHEDULER_RETRY_INTERVAL)
+
+    def start(self) -> list:
+        """Запуск циклов всех задач; возвращает задачи asyncio для остановки"""
+        self._tasks = [
+            asyncio.create_task(self._supervise(job)) for job in self.jobs.values()
+        ]
+        return self._tasks
+
+    async def status(self) -> list:
+        """Состояние задач: локальное плюс последний запуск в базе для задач с лидером"""
+        leader_jobs = [job.name for job in self.jobs.values() if job.leader]
+        shared = {}
+        if leader_jobs:
+            rows = await db.fetch(JOBS_STATUS_QUERY, leader_jobs, pin_reads=False)
+            shared = {row["name"]: row for row in rows}
+
+        jobs = []
+        for job in self.jobs.values():
+            item = job.as_dict()
+            row = shared.get(job.name)
+            if row is not None:
+                item["cluster"] = {
+                    "next_run_at": row["next_run_at"].isoformat(),
+                    "last_started_at": row["last_started_at"].isoformat() if row["last_started_at"] else None,
+                    "last_finished_at": row["last_finished_at"].isoformat() if row["last_finished_at"] else None,
+                    "last_duration_ms": row["last_duration_ms"],
+                    "last_status": row["last_status"],
+                    "last_error": row["last_error"],
+                    "last_runner": row["last_runner"],
+                    "run_count": row["run_count"],
+                    "failure_count": row["failure_count"],
+                }
+            jobs.append(item)
+        return jobs
+
+
+scheduler = Scheduler()
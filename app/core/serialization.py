@@ -0,0 +1,40 @@
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+import orjson
+from fastapi.responses import Response
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    """Типы, которые orjson не сериализует сам"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, UUID):
+        # asyncpg возвращает собственный подкласс UUID, orjson знает только uuid.UUID
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def dumps(content: Any) -> bytes:
+    """Сериализация в JSON-байты (UUID, datetime и Decimal поддерживаются)"""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(Response):
+    """
+    Ответ для больших списков: содержимое уже приведено к форме схемы
+    ответа, поэтому повторная валидация pydantic не выполняется,
+    а сериализация идёт сразу в байты через orjson.
+    Готовые байты (например, JSON, собранный в базе) отдаются как есть.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return dumps(content)
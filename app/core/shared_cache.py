@@ -0,0 +1,240 @@
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+import orjson
+from app.config import settings
+from app.core.serialization import dumps
+
+# seq, generation, slot, length, refreshed_at, invalidations, loaded_invalidations
+HEADER = struct.Struct("<QQQQdQQ")
+HEADER_SIZE = 64
+SEQ = struct.Struct("<Q")
+SNAPSHOT = struct.Struct("<QQQd")
+SNAPSHOT_OFFSET = 8
+INVALIDATIONS_OFFSET = 40
+LOADED_INVALIDATIONS_OFFSET = 48
+READ_RETRIES = 100
+# Сколько ждать первый снимок, который загружает другой процесс
+FIRST_LOAD_WAIT = 5.0
+FIRST_LOAD_POLL = 0.05
+
+
+def shared_directory() -> str:
+    """/dev/shm (память, без записи на диск), если есть"""
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class SharedSnapshot:
+    """
+    Снимок данных, общий для всех процессов uvicorn на хосте.
+    Файл в /dev/shm, отображённый через mmap: заголовок и два буфера.
+    Обновляет один процесс (неблокирующий flock на соседнем файле): пишет
+    сериализованный снимок в неактивный буфер и переключает заголовок
+    под seqlock (нечётный seq — идёт запись). Остальные читают без блокировок:
+    если seq изменился за время чтения, чтение повторяется. Разобранное
+    значение хранится в процессе до смены generation, поэтому повторные
+    чтения не разбирают JSON заново.
+    Снимок устаревает по ttl или по ключу инвалидации своих entities;
+    при недоступном файле работает как обычный кэш процесса.
+    """
+
+    def __init__(self, name: str, loader, ttl: float, entities: tuple = (),
+                 capacity: int = None):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.entities = set(entities)
+        self.capacity = capacity or settings.SHARED_CACHE_CAPACITY
+        self.path = os.path.join(
+            shared_directory(),
+            f"{settings.SHARED_CACHE_NAMESPACE}_{settings.POSTGRES_DB}_{name}_v1")
+        self.lock_path = f"{self.path}.lock"
+        self.active = True
+        self._buf = None
+        self._opened = False
+        self._generation = 0
+        self._value = None
+        self._local_refreshed_at = 0.0
+        self._local_invalidations = 0
+        self.reads = 0
+        self.decodes = 0
+        self.refreshes = 0
+        self.read_retries = 0
+        self.last_refresh_ms = None
+        self.last_error = None
+
+    def _open(self):
+        self._opened = True
+        size = HEADER_SIZE + 2 * self.capacity
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                # Новый файл заполняется нулями: generation 0 — снимка ещё нет
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self._buf = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logging.warning(f"Общий кэш {self.name} недоступен, используется кэш процесса: {str(e)}")
+            self.last_error = str(e)
+
+    def _header(self) -> tuple:
+        return HEADER.unpack_from(self._buf, 0)
+
+    def _is_stale(self, refreshed_at: float, invalidations: int, loaded_invalidations: int) -> bool:
+        return (refreshed_at + self.ttl < time.time()
+                or invalidations != loaded_invalidations)
+
+    def _read(self):
+        """Чтение под seqlock; None, если снимка ещё нет или запись не завершилась"""
+        buf = self._buf
+        for _ in range(READ_RETRIES):
+            seq, generation, slot, length, _, _, _ = self._header()
+            if seq % 2:
+                self.read_retries += 1
+                continue
+            if generation == 0:
+                return None
+            if generation != self._generation:
+                offset = HEADER_SIZE + slot * self.capacity
+                try:
+                    value = orjson.loads(buf[offset:offset + length])
+                except orjson.JSONDecodeError:
+                    # Буфер перезаписывается прямо сейчас: проверка seq ниже
+                    if SEQ.unpack_from(buf, 0)[0] == seq:
+                        raise
+                    self.read_retries += 1
+                    continue
+            else:
+                value = self._value
+            if SEQ.unpack_from(buf, 0)[0] != seq:
+                self.read_retries += 1
+                continue
+            if generation != self._generation:
+                self.decodes += 1
+                self._generation = generation
+                self._value = value
+            return value
+        return None
+
+    def _write(self, data: bytes, loaded_invalidations: int):
+        """
+        Запись под seqlock. Счётчик invalidations не перезаписывается:
+        его в это время могут увеличивать другие процессы
+        """
+        buf = self._buf
+        seq, generation, slot, _, _, _, _ = self._header()
+        if seq % 2:
+            # Предыдущий писатель завершился посреди записи
+            seq += 1
+        target = 1 - slot if generation else 0
+        SEQ.pack_into(buf, 0, seq + 1)
+        offset = HEADER_SIZE + target * self.capacity
+        buf[offset:offset + len(data)] = data
+        SNAPSHOT.pack_into(buf, SNAPSHOT_OFFSET, generation + 1, target, len(data), time.time())
+        SEQ.pack_into(buf, LOADED_INVALIDATIONS_OFFSET, loaded_invalidations)
+        SEQ.pack_into(buf, 0, seq + 2)
+
+    async def _load(self):
+        started = time.perf_counter()
+        value = await self.loader()
+        self.refreshes += 1
+        self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 3)
+        return value
+
+    async def _refresh_shared(self):
+        """Обновление снимка, если блокировка свободна; иначе None"""
+        with open(self.lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            seq, generation, _, _, refreshed_at, invalidations, loaded = self._header()
+            if (generation and not seq % 2
+                    and not self._is_stale(refreshed_at, invalidations, loaded)):
+                return self._read()
+            value = await self._load()
+            data = dumps(value)
+            if len(data) > self.capacity:
+                self.last_error = f"снимок {len(data)} байт больше буфера {self.capacity}"
+                logging.error(f"Общий кэш {self.name}: {self.last_error}")
+                return value
+            self._write(data, invalidations)
+            self._generation = 0
+            return self._read()
+
+    async def get(self):
+        """Текущий снимок; устаревший обновляет один процесс, остальные отдают прежний"""
+        self.reads += 1
+        if not self._opened:
+            self._open()
+        if self._buf is None:
+            return await self._get_local()
+
+        _, generation, _, _, refreshed_at, invalidations, loaded = self._header()
+        if generation and not self._is_stale(refreshed_at, invalidations, loaded):
+            value = self._read()
+            if value is not None:
+                return value
+
+        value = await self._refresh_shared()
+        if value is None:
+            value = self._read()
+        waited = 0.0
+        while value is None and waited < FIRST_LOAD_WAIT:
+            # Снимка ещё нет, его загружает другой процесс
+            await asyncio.sleep(FIRST_LOAD_POLL)
+            waited += FIRST_LOAD_POLL
+            value = self._read()
+        if value is None:
+            value = await self._load()
+        return value
+
+    async def _get_local(self):
+        if (self._value is None
+                or self._is_stale(self._local_refreshed_at, self._local_invalidations, 0)):
+            self._value = await self._load()
+            self._local_refreshed_at = time.time()
+            self._local_invalidations = 0
+        return self._value
+
+    def invalidate(self, key: str):
+        entity = key.partition(":")[0]
+        if entity in self.entities:
+            self.clear()
+
+    def clear(self):
+        """Пометка снимка устаревшим для всех процессов"""
+        if self._buf is None:
+            self._local_invalidations += 1
+            return
+        invalidations = SEQ.unpack_from(self._buf, INVALIDATIONS_OFFSET)[0]
+        SEQ.pack_into(self._buf, INVALIDATIONS_OFFSET, invalidations + 1)
+
+    def stats(self) -> dict:
+        stats = {
+            "name": self.name,
+            "shared": self._buf is not None,
+            "reads": self.reads,
+            "decodes": self.decodes,
+            "refreshes": self.refreshes,
+            "read_retries": self.read_retries,
+            "last_refresh_ms": self.last_refresh_ms,
+            "last_error": self.last_error,
+        }
+        if self._buf is not None:
+            _, generation, _, length, refreshed_at, invalidations, loaded = self._header()
+            stats.update({
+                "path": self.path,
+                "generation": generation,
+                "size_bytes": length,
+                "age_seconds": round(time.time() - refreshed_at, 3) if generation else None,
+                "stale": bool(generation) and self._is_stale(refreshed_at, invalidations, loaded),
+            })
+        return stats
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from functools import partial
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых конкурентных вызовов: пока вычисление по ключу
+    не завершилось, остальные вызовы с тем же ключом ждут его результат
+    (или исключение), а не запускают свой запрос. Вычисление идёт отдельной
+    задачей, поэтому отмена одного ожидающего не отменяет его для остальных.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def __contains__(self, key) -> bool:
+        return key in self._calls
+
+    async def do(self, key, func):
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(partial(self._done, key))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def _done(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Ошибка считается полученной, даже если все ожидающие отменены
+            future.exception()
+
+
+class SWRCache:
+    """
+    Кэш дорогих вычислений со stale-while-revalidate: до fresh_ttl значение
+    отдаётся как есть, до stale_ttl — отдаётся прежнее, а обновление
+    запускается в фоне (одно на ключ). Промахи и фоновые обновления идут
+    через SingleFlight, так что истечение популярного ключа даёт один запрос
+    к базе. None (например, «не найдено») не кэшируется.
+    entity — сущность, идентификаторы которой служат ключами: ключ
+    инвалидации "entity:id" удаляет запись, "entity:*" — все.
+    """
+
+    def __init__(self, name: str, fresh_ttl: float, stale_ttl: float,
+                 max_size: int = 10000, entity: str = None):
+        self.name = name
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = max(stale_ttl, fresh_ttl)
+        self.max_size = max_size
+        self.entity = entity
+        self.active = True
+        self.generation = 0
+        self.flight = SingleFlight()
+        self._data = OrderedDict()
+        self._refreshing = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    async def get(self, key, loader):
+        """Значение по ключу; loader — корутинная функция без аргументов"""
+        entry = self._data.get(key)
+        if entry is not None:
+            value, fresh_until, stale_until = entry
+            now = time.monotonic()
+            if now < fresh_until:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            if now < stale_until:
+                self.stale_hits += 1
+                self._revalidate(key, loader)
+                return value
+        self.misses += 1
+        return await self._load(key, loader)
+
+    async def _load(self, key, loader):
+        async def load():
+            generation = self.generation
+            value = await loader()
+            if value is not None and generation == self.generation:
+                self._store(key, value)
+            return value
+
+        return await self.flight.do(key, load)
+
+    def _store(self, key, value):
+        now = time.monotonic()
+        self._data[key] = (value, now + self.fresh_ttl, now + self.stale_ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def _revalidate(self, key, loader):
+        if key in self._refreshing or key in self.flight:
+            return
+        task = asyncio.create_task(self._background(key, loader))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def _background(self, key, loader):
+        try:
+            await self._load(key, loader)
+        except Exception as e:
+            # Прежнее значение отдаётся до stale_ttl, следующий запрос повторит обновление
+            self.refresh_errors += 1
+            logging.error(f"Ошибка фонового обновления {self.name} {key!r}: {str(e)}")
+
+    def invalidate(self, key: str):
+        entity, _, ident = key.partition(":")
+        if self.entity is None or entity != self.entity:
+            return
+        self.generation += 1
+        if ident == "*":
+            self._data.clear()
+        else:
+            self._data.pop(ident, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "loads": self.flight.executed,
+            "coalesced": self.flight.coalesced,
+            "refreshing": len(self._refreshing),
+            "refresh_errors": self.refresh_errors,
+        }
@@ -0,0 +1,64 @@
+import math
+import time
+from contextvars import ContextVar
+from fastapi import Request
+from app.config import settings
+
+RYW_COOKIE = "rw_until"
+RYW_HEADER = "X-Read-Your-Writes-Until"
+
+# Состояние текущего запроса: была ли запись и закреплены ли чтения за мастером
+_request_state: ContextVar = ContextVar("read_your_writes", default=None)
+
+
+def is_write_query(query: str) -> bool:
+    """Грубая классификация: всё, что не начинается с SELECT, считается записью"""
+    return query.lstrip()[:6].upper() != "SELECT"
+
+
+def mark_write():
+    """Отметка о записи в рамках текущего запроса"""
+    state = _request_state.get()
+    if state is not None:
+        state["wrote"] = True
+
+
+def reads_pinned_to_primary() -> bool:
+    """Нужно ли читать с мастера, чтобы клиент увидел свои записи"""
+    state = _request_state.get()
+    return state is not None and (state["wrote"] or state["pinned"])
+
+
+def _parse_deadline(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+async def read_your_writes_middleware(request: Request, call_next):
+    """
+    Закрепляет чтения за мастером на окно READ_YOUR_WRITES_WINDOW секунд
+    после любой записи клиента. Окно передаётся в cookie и заголовке,
+    поэтому работает между воркерами и контейнерами.
+    """
+    deadline = max(
+        _parse_deadline(request.cookies.get(RYW_COOKIE)),
+        _parse_deadline(request.headers.get(RYW_HEADER))
+    )
+    state = {"wrote": False, "pinned": deadline > time.time()}
+    token = _request_state.set(state)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_state.reset(token)
+
+    if state["wrote"]:
+        window = settings.READ_YOUR_WRITES_WINDOW
+        until = f"{time.time() + window:.3f}"
+        response.set_cookie(
+            RYW_COOKIE, until,
+            max_age=math.ceil(window), httponly=True, samesite="lax"
+        )
+        response.headers[RYW_HEADER] = until
+    return response
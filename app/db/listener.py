@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import inspect
+import time
+import asyncpg
+from app.config import settings
+from app.db.session import db
+
+NOTIFY_QUERY = "SELECT pg_notify($1, $2)"
+
+
+class PgListener:
+    """
+    LISTEN на отдельном соединении (не из пула: соединение пула после
+    возврата сбрасывается и теряет подписки). При обрыве соединение
+    переподключается с экспоненциальной задержкой; подписчики узнают
+    о потере и восстановлении через on_state_change, так как уведомления,
+    отправленные в разрыве, потеряны безвозвратно.
+    Через это же соединение отправляются NOTIFY, чтобы публикация
+    не занимала соединения пула.
+    """
+
+    def __init__(self, dsn: str, keepalive_interval: float,
+                 reconnect_base_delay: float = 0.5, reconnect_max_delay: float = 30.0):
+        self.dsn = dsn
+        self.keepalive_interval = keepalive_interval
+        self.reconnect_base_delay = reconnect_base_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.connection = None
+        self._channels = {}
+        self._state_callbacks = []
+        self._lock = asyncio.Lock()
+        self._lost = asyncio.Event()
+        self.connects = 0
+        self.notifications = 0
+        self.sent = 0
+        self.connected_since = None
+        self.last_error = None
+
+    @property
+    def connected(self) -> bool:
+        return self.connection is not None and not self.connection.is_closed()
+
+    def listen(self, channel: str, callback):
+        """Подписка на канал; callback(payload) вызывается для каждого уведомления"""
+        self._channels.setdefault(channel, []).append(callback)
+
+    def on_state_change(self, callback):
+        """callback(connected: bool) при установке и потере соединения"""
+        self._state_callbacks.append(callback)
+
+    def _dispatch(self, connection, pid, channel, payload):
+        self.notifications += 1
+        for callback in self._channels.get(channel, []):
+            try:
+                result = callback(payload)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                logging.error(f"Ошибка обработки уведомления {channel}: {str(e)}")
+
+    def _notify_state(self, connected: bool):
+        for callback in self._state_callbacks:
+            try:
+                callback(connected)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика состояния LISTEN: {str(e)}")
+
+    def _terminated(self, connection):
+        self._lost.set()
+
+    async def _connect(self):
+        connection = await asyncpg.connect(
+            self.dsn,
+            server_settings={"application_name": f"{settings.DB_APPLICATION_NAME}-listener"}
+        )
+        try:
+            for channel in self._channels:
+                await connection.add_listener(channel, self._dispatch)
+        except Exception:
+            await connection.close()
+            raise
+        connection.add_termination_listener(self._terminated)
+        self._lost.clear()
+        self.connection = connection
+        self.connects += 1
+        self.connected_since = time.time()
+        if self.connects > 1:
+            logging.warning("Соединение LISTEN восстановлено")
+        self._notify_state(True)
+
+    async def _watch(self):
+        """Ожидание обрыва; раз в keepalive_interval проверка полуоткрытого соединения"""
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=self.keepalive_interval)
+            except asyncio.TimeoutError:
+                async with self._lock:
+                    await self.connection.fetchval("SELECT 1", timeout=self.keepalive_interval)
+                continue
+            raise ConnectionError("соединение закрыто сервером")
+
+    async def _close(self):
+        connection, self.connection = self.connection, None
+        self.connected_since = None
+        if connection is None:
+            return
+        self._notify_state(False)
+        if not connection.is_closed():
+            try:
+                await asyncio.wait_for(connection.close(), timeout=5)
+            except Exception:
+                connection.terminate()
+
+    async def run(self):
+        """Фоновый цикл: подключение, ожидание обрыва, переподключение"""
+        delay = self.reconnect_base_delay
+        while True:
+            try:
+                await self._connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logging.warning(f"Не удалось подключиться для LISTEN, повтор через {delay:.1f} с: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max_delay)
+                continue
+
+            delay = self.reconnect_base_delay
+            try:
+                await self._watch()
+            except asyncio.CancelledError:
+                await self._close()
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logging.warning(f"Соединение LISTEN потеряно: {str(e)}")
+            await self._close()
+
+    async def notify(self, channel: str, payload: str):
+        """NOTIFY через соединение слушателя; без него — через пул"""
+        if self.connected:
+            try:
+                async with self._lock:
+                    await self.connection.execute(NOTIFY_QUERY, channel, payload)
+                self.sent += 1
+                return
+            except (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, OSError) as e:
+                logging.warning(f"NOTIFY через соединение LISTEN не отправлен: {str(e)}")
+        await db.execute(NOTIFY_QUERY, channel, payload, pin_reads=False)
+        self.sent += 1
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "connected_seconds": round(time.time() - self.connected_since, 1) if self.connected_since else None,
+            "connects": self.connects,
+            "channels": sorted(self._channels),
+            "notifications_received": self.notifications,
+            "notifications_sent": self.sent,
+            "last_error": self.last_error,
+        }
+
+
+listener = PgListener(
+    settings.DATABASE_URL,
+    keepalive_interval=settings.LISTENER_KEEPALIVE_INTERVAL,
+    reconnect_max_delay=settings.LISTENER_RECONNECT_MAX_DELAY
+)
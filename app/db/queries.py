@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from app.config import settings
+
+
+class QueryRegistry:
+    """
+    Реестр канонических текстов запросов. Для каждой «формы» запроса
+    (набора включённых фильтров и полей) текст собирается один раз и
+    дальше переиспользуется, поэтому одинаковые формы всегда дают один и
+    тот же текст и попадают в кэш подготовленных выражений asyncpg.
+    """
+
+    def __init__(self, max_shapes: int = 2048):
+        self.max_shapes = max_shapes
+        self._texts = OrderedDict()
+        self._executions = {}
+
+    def text(self, key: tuple, render) -> str:
+        query = self._texts.get(key)
+        if query is None:
+            query = render()
+            self._texts[key] = query
+            if len(self._texts) > self.max_shapes:
+                self._texts.popitem(last=False)
+        else:
+            self._texts.move_to_end(key)
+        name = key[0]
+        self._executions[name] = self._executions.get(name, 0) + 1
+        return query
+
+    def stats(self) -> list:
+        shapes = {}
+        for key in self._texts:
+            shapes[key[0]] = shapes.get(key[0], 0) + 1
+        return [
+            {"name": name, "shapes": shapes.get(name, 0), "builds": builds}
+            for name, builds in sorted(self._executions.items())
+        ]
+
+
+class StatementCacheTracker:
+    """
+    Оценка попаданий в кэш подготовленных выражений asyncpg.
+    Повторяет его поведение: LRU на каждое соединение (по PID бэкенда)
+    размером DB_STATEMENT_CACHE_SIZE, слишком длинные тексты не кэшируются.
+    """
+
+    def __init__(self, capacity: int, max_statement_size: int, max_connections: int = 256):
+        self.capacity = capacity
+        self.max_statement_size = max_statement_size
+        self.max_connections = max_connections
+        self._seen = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+    def track(self, connection, query: str):
+        if self.capacity <= 0 or len(query) > self.max_statement_size:
+            self.uncacheable += 1
+            return
+        pid = connection.get_server_pid()
+        seen = self._seen.get(pid)
+        if seen is None:
+            seen = self._seen[pid] = OrderedDict()
+            if len(self._seen) > self.max_connections:
+                self._seen.popitem(last=False)
+        if query in seen:
+            self.hits += 1
+            seen.move_to_end(query)
+        else:
+            self.misses += 1
+            seen[query] = None
+            if len(seen) > self.capacity:
+                seen.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "cache_size": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "tracked_connections": len(self._seen),
+        }
+
+
+query_registry = QueryRegistry()
+statement_cache = StatementCacheTracker(
+    capacity=settings.DB_STATEMENT_CACHE_SIZE,
+    max_statement_size=settings.DB_MAX_CACHEABLE_STATEMENT_SIZE
+)
+
+
+class QueryBuilder:
+    """
+    Сборка параметризованного запроса без ручного подсчёта $n.
+    Шаблоны условий используют {} (или {0}, {1}) вместо номеров параметров:
+
+        qb = QueryBuilder("ads.list", "SELECT ... FROM ads a")
+        qb.where("a.price >= {}::numeric", min_price)
+        query, params = qb.select("ORDER BY a.created_at DESC LIMIT {} OFFSET {}", limit, skip)
+    """
+
+    def __init__(self, name: str, base: str = ""):
+        self.name = name
+        self.base = base
+        self.params = []
+        self._conditions = []
+        self._assignments = []
+
+    def _placeholders(self, values) -> list:
+        placeholders = []
+        for value in values:
+            self.params.append(value)
+            placeholders.append(f"${len(self.params)}")
+        return placeholders
+
+    def where(self, template: str, *values) -> "QueryBuilder":
+        """Добавление условия WHERE (условия объединяются через AND)"""
+        self._conditions.append(
+            (template, template.format(*self._placeholders(values))))
+        return self
+
+    def set(self, column: str, value) -> "QueryBuilder":
+        """Добавление присваивания для UPDATE"""
+        placeholder, = self._placeholders([value])
+        self._assignments.append((column, f"{column} = {placeholder}"))
+        return self
+
+    @property
+    def has_conditions(self) -> bool:
+        return bool(self._conditions)
+
+    @property
+    def has_assignments(self) -> bool:
+        return bool(self._assignments)
+
+    def _shape(self, *parts) -> tuple:
+        return (
+            self.name,
+            self.base,
+            tuple(template for template, _ in self._conditions),
+            tuple(column for column, _ in self._assignments),
+            *parts
+        )
+
+    def _where_clause(self) -> str:
+        if not self._conditions:
+            return ""
+        return "\nWHERE " + " AND ".join(sql for _, sql in self._conditions)
+
+    def select(self, tail: str = "", *values) -> tuple:
+        """Текст SELECT-запроса и параметры; tail — GROUP BY/ORDER BY/LIMIT"""
+        tail_placeholders = self._placeholders(values)
+        shape = self._shape("select", tail)
+
+        def render():
+            query = self.base + self._where_clause()
+            if tail:
+                query += "\n" + tail.format(*tail_placeholders)
+            return query
+
+        return query_registry.text(shape, render), list(self.params)
+
+    def update(self, table: str, key_column: str, key_value, returning: str) -> tuple:
+        """Текст UPDATE ... SET ... WHERE key = $n RETURNING ... и параметры"""
+        key_placeholder, = self._placeholders([key_value])
+        shape = self._shape("update", table, key_column, returning)
+
+        def render():
+            assignments = ", ".join(sql for _, sql in self._assignments)
+            return (
+                f"UPDATE {table}\nSET {assignments}"
+                f"\nWHERE {key_column} = {key_placeholder}"
+                f"\nRETURNING {returning}"
+            )
+
+        return query_registry.text(shape, render), list(self.params)
+
+
+def json_array_query(query: str, document: str) -> str:
+    """
+    Оборачивает запрос так, чтобы база сама собрала JSON-массив ответа
+    и вернула его байтами (bytea): asyncpg отдаёт их без декодирования,
+    а эндпоинт — без разбора и повторной сериализации.
+    document — выражение json_build_object(...) над колонками q.*;
+    порядок элементов совпадает с порядком строк исходного запроса.
+    """
+    return (
+        "SELECT convert_to(COALESCE(json_agg(" + document + " ORDER BY q.rn), "
+        "'[]'::json)::text, 'UTF8')\n"
+        "FROM (SELECT row_number() OVER () AS rn, page.* FROM (\n"
+        + query +
+        "\n) page) q"
+    )
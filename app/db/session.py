@@ -1,33 +1,403 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+import asyncpg
+import orjson
 from asyncpg import create_pool
+from fastapi import HTTPException, status
 from app.config import settings
+from app.core.serialization import dumps
+from app.db.consistency import is_write_query, mark_write, reads_pinned_to_primary
+from app.db.queries import statement_cache
+from app.db.slow_queries import slow_query_log
+
+# Отставание реплики в секундах; на мастере (или отдельном инстансе) всегда 0
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+# Ошибки соединения, при которых чтение повторяется на мастере
+REPLICA_CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.InterfaceError,
+)
+
+
+class PoolExhaustedError(HTTPException):
+    """Пул соединений исчерпан: запрос отклоняется сразу, а не ждёт в очереди"""
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="База данных перегружена, повторите запрос позже",
+            headers={"Retry-After": "1"}
+        )
+
+
+class PoolMetrics:
+    """Счётчики ожидания соединений из пула"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "waiting": self.waiting,
+            "avg_wait_ms": round(self.total_wait / self.acquired * 1000, 3) if self.acquired else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+def _encode_json(value) -> str:
+    return dumps(value).decode()
+
+
+async def init_connection(connection):
+    """
+    Настройка каждого нового соединения пула: json/jsonb приходят уже
+    разобранными (orjson), параметры сериализуются тем же кодировщиком.
+    UUID asyncpg кодирует сам (бинарный формат), поэтому в запросы
+    передаются объекты UUID без преобразования в строку.
+    """
+    for type_name in ("json", "jsonb"):
+        await connection.set_type_codec(
+            type_name,
+            encoder=_encode_json,
+            decoder=orjson.loads,
+            schema="pg_catalog"
+        )
+
+
+def pool_options() -> dict:
+    """Параметры пула из настроек, общие для мастера и реплики"""
+    server_settings = {"application_name": settings.DB_APPLICATION_NAME}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    return {
+        "min_size": settings.DB_POOL_MIN_SIZE,
+        "max_size": settings.DB_POOL_MAX_SIZE,
+        "max_queries": settings.DB_POOL_MAX_QUERIES,
+        "max_inactive_connection_lifetime": settings.DB_POOL_MAX_INACTIVE_LIFETIME,
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "max_cached_statement_lifetime": settings.DB_MAX_CACHED_STATEMENT_LIFETIME,
+        "max_cacheable_statement_size": settings.DB_MAX_CACHEABLE_STATEMENT_SIZE,
+        "command_timeout": settings.DB_COMMAND_TIMEOUT,
+        "server_settings": server_settings,
+        "init": init_connection,
+    }
 
 
 class Database:
     def __init__(self):
         self.pool = None
+        self.replica_pool = None
+        self.replica_healthy = False
+        self.replica_lag = None
+        self.replica_fallbacks = 0
+        self.metrics = {"primary": PoolMetrics(), "replica": PoolMetrics()}
 
     async def connect(self):
         self.pool = await create_pool(
             dsn=settings.DATABASE_URL,
-            min_size=1,
-            max_size=10
+            **pool_options()
         )
+        if settings.DATABASE_REPLICA_URL:
+            await self.connect_replica()
+
+    async def connect_replica(self):
+        try:
+            self.replica_pool = await create_pool(
+                dsn=settings.DATABASE_REPLICA_URL,
+                **pool_options()
+            )
+        except REPLICA_CONNECTION_ERRORS as e:
+            logging.error(f"Реплика недоступна, чтение идёт с мастера: {str(e)}")
+            self.replica_pool = None
+            return
+        await self.check_replica()
 
     async def disconnect(self):
+        if self.replica_pool:
+            await self.replica_pool.close()
         if self.pool:
             await self.pool.close()
 
+    async def check_replica(self):
+        """Проверка доступности и отставания реплики"""
+        try:
+            async with self.replica_pool.acquire(timeout=settings.REPLICA_HEALTHCHECK_TIMEOUT) as connection:
+                lag = await connection.fetchval(
+                    REPLICA_LAG_QUERY, timeout=settings.REPLICA_HEALTHCHECK_TIMEOUT)
+        except REPLICA_CONNECTION_ERRORS as e:
+            if self.replica_healthy:
+                logging.warning(f"Реплика исключена из чтения: {str(e)}")
+            self.replica_healthy = False
+            self.replica_lag = None
+            return
+
+        self.replica_lag = float(lag)
+        healthy = self.replica_lag <= settings.REPLICA_MAX_LAG_SECONDS
+        if healthy != self.replica_healthy:
+            logging.warning(
+                f"Реплика {'возвращена в' if healthy else 'исключена из'} чтение, "
+                f"отставание {self.replica_lag:.2f} с")
+        self.replica_healthy = healthy
+
+    async def run_replica_health_checks(self):
+        """Периодическая проверка реплики с переподключением"""
+        while True:
+            await asyncio.sleep(settings.REPLICA_HEALTHCHECK_INTERVAL)
+            try:
+                if self.replica_pool is None:
+                    await self.connect_replica()
+                else:
+                    await self.check_replica()
+            except Exception as e:
+                logging.error(f"Ошибка проверки реплики: {str(e)}")
+
+    @asynccontextmanager
+    async def _acquire(self, pool, name: str):
+        """Получение соединения с таймаутом; при исчерпании пула — 503"""
+        metrics = self.metrics[name]
+        metrics.waiting += 1
+        started = time.perf_counter()
+        try:
+            connection = await pool.acquire(timeout=settings.DB_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            logging.warning(f"Пул соединений ({name}) исчерпан")
+            raise PoolExhaustedError()
+        finally:
+            metrics.waiting -= 1
+        waited = time.perf_counter() - started
+        metrics.acquired += 1
+        metrics.total_wait += waited
+        if waited > metrics.max_wait:
+            metrics.max_wait = waited
+        try:
+            yield connection
+        finally:
+            await pool.release(connection)
+
+    def acquire(self):
+        """Соединение с мастером для транзакций и пакетных операций"""
+        return self._acquire(self.pool, "primary")
+
+    def pool_stats(self) -> dict:
+        """Состояние пулов соединений"""
+        stats = {}
+        for name, pool in (("primary", self.pool), ("replica", self.replica_pool)):
+            if pool is None:
+                continue
+            size = pool.get_size()
+            idle = pool.get_idle_size()
+            stats[name] = {
+                "min_size": pool.get_min_size(),
+                "max_size": pool.get_max_size(),
+                "size": size,
+                "idle": idle,
+                "in_use": size - idle,
+                **self.metrics[name].as_dict(),
+            }
+        return stats
+
+    def replica_status(self) -> dict:
+        return {
+            "configured": bool(settings.DATABASE_REPLICA_URL),
+            "connected": self.replica_pool is not None,
+            "healthy": self.replica_healthy,
+            "lag_seconds": self.replica_lag,
+            "max_lag_seconds": settings.REPLICA_MAX_LAG_SECONDS,
+            "fallbacks": self.replica_fallbacks,
+        }
+
+    async def _timed(self, method, query: str, args):
+        """Выполнение запроса с учётом времени в журнале медленных запросов"""
+        statement_cache.track(method.__self__, query)
+        started = time.perf_counter()
+        try:
+            return await method(query, *args)
+        finally:
+            slow_query_log.record(query, args, time.perf_counter() - started)
+
+    async def _primary(self, method_name: str, query: str, args, pin_reads: bool):
+        if pin_reads and is_write_query(query):
+            mark_write()
+        async with self.acquire() as connection:
+            return await self._timed(getattr(connection, method_name), query, args)
+
+    def replica_usable(self) -> bool:
+        """Можно ли читать с реплики: она здорова и клиент не писал недавно"""
+        return (self.replica_pool is not None and self.replica_healthy
+                and not reads_pinned_to_primary())
+
+    async def _read(self, method_name: str, query: str, args):
+        """Чтение с реплики с откатом на мастер"""
+        if self.replica_usable():
+            try:
+                async with self._acquire(self.replica_pool, "replica") as connection:
+                    return await self._timed(getattr(connection, method_name), query, args)
+            except PoolExhaustedError:
+                self.replica_fallbacks += 1
+            except REPLICA_CONNECTION_ERRORS as e:
+                logging.warning(f"Чтение с реплики не удалось, повтор на мастере: {str(e)}")
+                self.replica_healthy = False
+                self.replica_fallbacks += 1
+        async with self.acquire() as connection:
+            return await self._timed(getattr(connection, method_name), query, args)
+
+    async def execute(self, query: str, *args, pin_reads: bool = True):
+        return await self._primary("execute", query, args, pin_reads)
+
+    async def fetch(self, query: str, *args, pin_reads: bool = True):
+        return await self._primary("fetch", query, args, pin_reads)
+
+    async def fetchrow(self, query: str, *args, pin_reads: bool = True):
+        return await self._primary("fetchrow", query, args, pin_reads)
+
+    async def fetchval(self, query: str, *args, pin_reads: bool = True):
+        return await self._primary("fetchval", query, args, pin_reads)
+
+    async def fetch_read(self, query: str, *args):
+        return await self._read("fetch", query, args)
+
+    async def fetchrow_read(self, query: str, *args):
+        return await self._read("fetchrow", query, args)
+
+    async def fetchval_read(self, query: str, *args):
+        return await self._read("fetchval", query, args)
+
+
+class RequestConnection:
+    """
+    Одно соединение на HTTP-запрос. Соединение берётся из пула лениво,
+    при первом запросе к БД, поэтому обработчики, ответившие из кэша,
+    пул не трогают. При transaction=True все запросы идут в одной транзакции.
+    """
+
+    def __init__(self, database: Database, transaction: bool = False, read_only: bool = False):
+        self._db = database
+        self._use_transaction = transaction
+        self._read_only = read_only
+        self._context = None
+        self._connection = None
+        self._transaction = None
+
+    async def _enter(self, pool, name: str):
+        context = self._db._acquire(pool, name)
+        connection = await context.__aenter__()
+        self._context = context
+        self._connection = connection
+        if self._use_transaction:
+            self._transaction = connection.transaction(readonly=self._read_only)
+            await self._transaction.start()
+
+    async def _get(self):
+        if self._connection is None:
+            if self._read_only and self._db.replica_usable():
+                try:
+                    await self._enter(self._db.replica_pool, "replica")
+                    return self._connection
+                except (PoolExhaustedError, *REPLICA_CONNECTION_ERRORS) as e:
+                    logging.warning(f"Соединение с репликой не получено, используется мастер: {str(e)}")
+                    await self._release()
+                    self._db.replica_fallbacks += 1
+            await self._enter(self._db.pool, "primary")
+        return self._connection
+
+    async def _run(self, method_name: str, query: str, args):
+        connection = await self._get()
+        if not self._read_only and is_write_query(query):
+            mark_write()
+        return await self._db._timed(getattr(connection, method_name), query, args)
+
     async def execute(self, query: str, *args):
-        async with self.pool.acquire() as connection:
-            return await connection.execute(query, *args)
+        return await self._run("execute", query, args)
 
     async def fetch(self, query: str, *args):
-        async with self.pool.acquire() as connection:
-            return await connection.fetch(query, *args)
+        return await self._run("fetch", query, args)
 
     async def fetchrow(self, query: str, *args):
-        async with self.pool.acquire() as connection:
-            return await connection.fetchrow(query, *args)
+        return await self._run("fetchrow", query, args)
+
+    async def fetchval(self, query: str, *args):
+        return await self._run("fetchval", query, args)
+
+    async def iterate(self, query: str, *args, prefetch: int = None):
+        """
+        Построчное чтение через серверный курсор: в памяти держится не больше
+        prefetch строк. Курсор работает только внутри транзакции.
+        """
+        connection = await self._get()
+        statement_cache.track(connection, query)
+        started = time.perf_counter()
+        try:
+            async for row in connection.cursor(query, *args, prefetch=prefetch):
+                yield row
+        finally:
+            slow_query_log.record(query, args, time.perf_counter() - started)
+
+    async def _release(self):
+        context, self._context = self._context, None
+        self._connection = None
+        self._transaction = None
+        if context is not None:
+            await context.__aexit__(None, None, None)
+
+    async def close(self, failed: bool = False):
+        """Фиксация или откат транзакции и возврат соединения в пул"""
+        try:
+            if self._transaction is not None:
+                if failed:
+                    await self._transaction.rollback()
+                else:
+                    await self._transaction.commit()
+        finally:
+            await self._release()
 
 
 db = Database()
+
+
+@asynccontextmanager
+async def connection_scope(transaction: bool = False, read_only: bool = False):
+    """Одно соединение (и при необходимости транзакция) на блок кода"""
+    connection = RequestConnection(db, transaction=transaction, read_only=read_only)
+    try:
+        yield connection
+    except BaseException:
+        await connection.close(failed=True)
+        raise
+    await connection.close()
+
+
+async def get_connection():
+    """Зависимость: одно соединение с мастером на запрос, без транзакции"""
+    async with connection_scope() as connection:
+        yield connection
+
+
+async def get_transaction():
+    """Зависимость: все запросы обработчика в одной транзакции на мастере"""
+    async with connection_scope(transaction=True) as connection:
+        yield connection
+
+
+async def get_read_connection():
+    """Зависимость: одно соединение для чтения (реплика, если доступна)"""
+    async with connection_scope(read_only=True) as connection:
+        yield connection
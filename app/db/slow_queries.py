@@ -0,0 +1,189 @@
+import heapq
+import logging
+import re
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import count
+from app.config import settings
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_PARAM_RE = re.compile(r"\$\d+")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+ORDER_FIELDS = ("total", "max", "p95", "avg", "count")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(query: str) -> str:
+    """Нормализация SQL в отпечаток: литералы и параметры заменяются на ?"""
+    text = _COMMENT_RE.sub(" ", query)
+    text = _STRING_RE.sub("?", text)
+    text = _PARAM_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _LIST_RE.sub("(?)", text)
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+def _sample_params(args, max_params: int = 20, max_length: int = 100):
+    """Компактное представление параметров запроса для выборки"""
+    sample = []
+    for value in args[:max_params]:
+        if isinstance(value, (list, tuple, set)):
+            sample.append(f"{type(value).__name__}[len={len(value)}]")
+            continue
+        text = repr(value)
+        if len(text) > max_length:
+            text = text[:max_length] + "..."
+        sample.append(text)
+    if len(args) > max_params:
+        sample.append(f"... ещё {len(args) - max_params}")
+    return sample
+
+
+class QueryStats:
+    """Агрегированная статистика по одному отпечатку запроса"""
+
+    __slots__ = ("fingerprint", "count", "total", "max", "slow_count",
+                 "durations", "worst", "last_seen")
+
+    def __init__(self, fingerprint: str, window: int):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow_count = 0
+        self.durations = deque(maxlen=window)
+        self.worst = []
+        self.last_seen = None
+
+    def add(self, duration: float, args, is_slow: bool, worst_size: int, seq: int):
+        self.count += 1
+        self.total += duration
+        self.durations.append(duration)
+        self.last_seen = time.time()
+        if duration > self.max:
+            self.max = duration
+        if is_slow:
+            self.slow_count += 1
+
+        # Параметры сохраняем только для худших выполнений
+        if len(self.worst) < worst_size or duration > self.worst[0][0]:
+            entry = (duration, seq, {
+                "duration_ms": round(duration * 1000, 3),
+                "params": _sample_params(args),
+                "at": datetime.now(timezone.utc).isoformat(),
+            })
+            if len(self.worst) < worst_size:
+                heapq.heappush(self.worst, entry)
+            else:
+                heapq.heapreplace(self.worst, entry)
+
+    @property
+    def p95(self) -> float:
+        if not self.durations:
+            return 0.0
+        ordered = sorted(self.durations)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "slow_count": self.slow_count,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.avg * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "p95_ms": round(self.p95 * 1000, 3),
+            "last_seen": datetime.fromtimestamp(
+                self.last_seen, timezone.utc).isoformat() if self.last_seen else None,
+            "worst_executions": [
+                entry for _, _, entry in sorted(self.worst, reverse=True)
+            ],
+        }
+
+
+class SlowQueryLog:
+    """Ограниченный по размеру журнал статистики запросов по отпечаткам"""
+
+    def __init__(self, threshold_ms: float, max_fingerprints: int,
+                 window: int = 256, worst_size: int = 3):
+        self.threshold = threshold_ms / 1000
+        self.max_fingerprints = max_fingerprints
+        self.window = window
+        self.worst_size = worst_size
+        self._stats = OrderedDict()
+        self._seq = count()
+        self.evicted = 0
+        self.started_at = time.time()
+
+    def record(self, query: str, args, duration: float):
+        """Учёт одного выполнения запроса"""
+        key = fingerprint(query)
+        stats = self._stats.get(key)
+        if stats is None:
+            # Вытесняем отпечаток, который дольше всех не встречался
+            if len(self._stats) >= self.max_fingerprints:
+                self._stats.popitem(last=False)
+                self.evicted += 1
+            stats = self._stats[key] = QueryStats(key, self.window)
+        else:
+            self._stats.move_to_end(key)
+
+        is_slow = duration >= self.threshold
+        stats.add(duration, args, is_slow, self.worst_size, next(self._seq))
+        if is_slow:
+            logging.warning(
+                f"Медленный запрос ({duration * 1000:.1f} мс): {key[:300]}")
+
+    def top(self, limit: int = 10, order_by: str = "total") -> list:
+        """Топ-N отпечатков по выбранной метрике"""
+        if order_by not in ORDER_FIELDS:
+            raise ValueError(f"Неизвестная метрика сортировки: {order_by}")
+        ordered = sorted(
+            self._stats.values(),
+            key=lambda stats: getattr(stats, order_by),
+            reverse=True
+        )
+        return [stats.as_dict() for stats in ordered[:limit]]
+
+    def summary(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "tracked_fingerprints": len(self._stats),
+            "max_fingerprints": self.max_fingerprints,
+            "evicted_fingerprints": self.evicted,
+            "since": datetime.fromtimestamp(
+                self.started_at, timezone.utc).isoformat(),
+        }
+
+    def reset(self):
+        self._stats.clear()
+        self.evicted = 0
+        self.started_at = time.time()
+
+    def log_top(self, limit: int = 10):
+        """Запись топа медленных запросов в лог"""
+        top = [stats for stats in self.top(limit, "total") if stats["slow_count"]]
+        if not top:
+            return
+        lines = [
+            f"{i}. total={s['total_ms']}мс count={s['count']} "
+            f"p95={s['p95_ms']}мс max={s['max_ms']}мс :: {s['fingerprint'][:300]}"
+            for i, s in enumerate(top, start=1)
+        ]
+        logging.warning("Топ медленных запросов:\n" + "\n".join(lines))
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.SLOW_QUERY_THRESHOLD_MS,
+    max_fingerprints=settings.SLOW_QUERY_MAX_FINGERPRINTS
+)
@@ -1,9 +1,16 @@
+import asyncio
 from fastapi import FastAPI
 from app.db.session import db
+from app.db.consistency import read_your_writes_middleware
+from app.core.events import dispatcher
+from app.core.scheduler import scheduler
+from app.core import maintenance  # noqa: F401 (регистрация периодических задач)
+from app.db.listener import listener
 from app.config import settings
 from app.api.v1 import (users, ads, categories, locations,
                         tags, favorites, views, messages,
-                        reports, analitics, batch_import)
+                        reports, analitics, batch_import,
+                        admin, jobs)
 
 app = FastAPI(
     title="Advertisements API",
@@ -12,15 +19,30 @@ app = FastAPI(
     docs_url=f"{settings.API_V1_STR}/docs",
     openapi_url=f"{settings.API_V1_STR}/openapi.json"
 )
+app.middleware("http")(read_your_writes_middleware)
+
+background_tasks = []
 
 
 @app.on_event("startup")
 async def startup():
     await db.connect()
+    background_tasks.append(asyncio.create_task(listener.run()))
+    if settings.DATABASE_REPLICA_URL:
+        background_tasks.append(asyncio.create_task(
+            db.run_replica_health_checks()
+        ))
+    background_tasks.append(asyncio.create_task(dispatcher.run()))
+    if settings.SCHEDULER_ENABLED:
+        background_tasks.extend(scheduler.start())
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
     await db.disconnect()
 
 app.include_router(users.router, prefix=settings.API_V1_STR)
@@ -34,6 +56,8 @@ app.include_router(messages.router, prefix=settings.API_V1_STR)
 app.include_router(reports.router, prefix=settings.API_V1_STR)
 app.include_router(analitics.router, prefix=settings.API_V1_STR)
 app.include_router(batch_import.router, prefix=settings.API_V1_STR)
+app.include_router(admin.router, prefix=settings.API_V1_STR)
+app.include_router(jobs.router, prefix=settings.API_V1_STR)
 
 
 @app.get("/")
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from uuid import UUID
 from datetime import datetime
@@ -30,3 +30,24 @@ class FavoriteAdOut(BaseModel):
     category: CategoryInfo
     location: LocationInfo
     owner: OwnerInfo
+
+
+class FavoritesContains(BaseModel):
+    user_id: UUID
+    ad_ids: List[UUID] = Field(..., min_length=1, max_length=500)
+
+
+class FavoritesContainsOut(BaseModel):
+    user_id: UUID
+    ad_ids: List[UUID]
+    in_favorites: List[bool]
+
+
+class FavoriteOperation(BaseModel):
+    ad_id: UUID
+    op: str = Field(..., pattern="^(add|remove)$")
+
+
+class FavoritesBulk(BaseModel):
+    user_id: UUID
+    operations: List[FavoriteOperation] = Field(..., min_length=1, max_length=200)
@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field
+from typing import Any, Optional
+from datetime import datetime
+
+
+class JobCreate(BaseModel):
+    job_type: str
+    payload: dict = Field(default_factory=dict)
+    priority: int = Field(0, ge=-100, le=100)
+    delay_seconds: float = Field(0, ge=0)
+    max_attempts: Optional[int] = Field(None, ge=1, le=100)
+
+
+class JobOut(BaseModel):
+    id: int
+    job_type: str
+    payload: dict
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    locked_until: Optional[datetime] = None
+    locked_by: Optional[str] = None
+    result: Optional[Any] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
 
@@ -19,8 +19,13 @@ class MessageUpdate(BaseModel):
     is_read: Optional[bool] = None
 
 
+class MessagesMarkRead(BaseModel):
+    message_ids: List[UUID] = Field(..., min_length=1, max_length=500)
+
+
 class MessageOut(MessageBase):
     id: UUID
+    conversation_id: Optional[int] = None
     sender_id: UUID
     sent_at: datetime
     is_read: bool
@@ -30,3 +35,19 @@ class MessageOut(MessageBase):
 
     class Config:
         from_attributes = True
+
+
+class ConversationOut(BaseModel):
+    id: int
+    ad_id: UUID
+    ad_title: str
+    other_user: dict
+    last_message: Optional[dict] = None
+    last_message_at: datetime
+    unread_count: int
+
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationOut]
+    next_cursor: Optional[str] = None
+    has_more: bool
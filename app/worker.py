@@ -0,0 +1,151 @@
+"""
+Воркер фоновых заданий: python -m app.worker [--types ads.batch_import ...] [--concurrency N]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from app.config import settings
+from app.core import job_handlers  # noqa: F401 (регистрация типов заданий)
+from app.core.jobs import PermanentJobError, job_queue
+from app.db.listener import listener
+from app.db.session import db
+
+
+class Worker:
+    """
+    Цикл выдачи и выполнения заданий. Новые задания будят воркер через
+    NOTIFY (канал JOBS_CHANNEL), а раз в poll_interval он опрашивает
+    очередь сам: уведомления теряются при обрыве LISTEN, а отложенные
+    задания и задания с истёкшей арендой уведомлений не присылают.
+    """
+
+    def __init__(self, types: list, concurrency: int, poll_interval: float,
+                 shutdown_grace: float):
+        self.types = types
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.shutdown_grace = shutdown_grace
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+
+    def wake(self, payload: str = None):
+        if payload is None or payload in self.types:
+            self._wakeup.set()
+
+    def stop(self):
+        logging.info("Остановка воркера: новые задания не выдаются")
+        self._stopping.set()
+        self._wakeup.set()
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(job_queue.visibility_timeout / 3)
+            if not await job_queue.heartbeat(job_id, self.worker_id):
+                logging.warning(f"Аренда задания {job_id} потеряна")
+                return
+
+    async def _execute(self, job):
+        job_type = job_queue.types[job["job_type"]]
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await asyncio.wait_for(job_type.func(job["payload"]), job_type.timeout)
+        except asyncio.CancelledError:
+            raise
+        except PermanentJobError as e:
+            await job_queue.fail(job, self.worker_id, str(e), permanent=True)
+            logging.error(f"Задание {job['id']} ({job['job_type']}) отклонено: {str(e)}")
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                error = f"Превышено время выполнения ({job_type.timeout:g} с)"
+            else:
+                error = f"{type(e).__name__}: {str(e)}"
+            status = await job_queue.fail(job, self.worker_id, error)
+            logging.error(f"Ошибка задания {job['id']} ({job['job_type']}), статус {status}: {error}")
+        else:
+            await job_queue.complete(job["id"], self.worker_id, result)
+        finally:
+            heartbeat.cancel()
+            self.running.pop(job["id"], None)
+            self._wakeup.set()
+
+    def _count(self, job_type: str) -> int:
+        return sum(1 for name, _ in self.running.values() if name == job_type)
+
+    async def _claim(self):
+        for job_type in self.types:
+            free = min(
+                self.concurrency - len(self.running),
+                job_queue.types[job_type].concurrency - self._count(job_type)
+            )
+            if free <= 0:
+                continue
+            for job in await job_queue.claim(job_type, free, self.worker_id):
+                self.running[job["id"]] = (job_type, asyncio.create_task(self._execute(job)))
+
+    async def run(self):
+        logging.info(f"Воркер {self.worker_id}: {', '.join(self.types)}")
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                await self._claim()
+            except Exception as e:
+                logging.error(f"Ошибка выдачи заданий: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        await self._drain()
+
+    async def _drain(self):
+        """Ожидание текущих заданий; не успевшие за shutdown_grace возвращаются в очередь"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.shutdown_grace
+        while self.running and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.running:
+            unfinished = list(self.running)
+            tasks = [task for _, task in self.running.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await job_queue.release(unfinished, self.worker_id)
+            logging.warning(f"Возвращены в очередь незавершённые задания: {unfinished}")
+
+
+async def main(types: list, concurrency: int):
+    worker = Worker(
+        types, concurrency,
+        poll_interval=settings.WORKER_POLL_INTERVAL,
+        shutdown_grace=settings.WORKER_SHUTDOWN_GRACE
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    await db.connect()
+    listener.listen(settings.JOBS_CHANNEL, worker.wake)
+    # После переподключения LISTEN пропущенные уведомления заменяет внеочередной опрос
+    listener.on_state_change(lambda connected: connected and worker.wake())
+    listener_task = asyncio.create_task(listener.run())
+    try:
+        await worker.run()
+    finally:
+        listener_task.cancel()
+        await asyncio.gather(listener_task, return_exceptions=True)
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воркер фоновых заданий")
+    parser.add_argument("--types", nargs="+", choices=sorted(job_queue.types),
+                        default=sorted(job_queue.types), help="Типы заданий")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY,
+                        help="Предел одновременно выполняемых заданий в процессе")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.types, args.concurrency))
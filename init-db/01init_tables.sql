@@ -49,6 +49,7 @@ CREATE TABLE ads (
     moderation_status VARCHAR(20) DEFAULT 'PENDING' NOT NULL CHECK (moderation_status IN ('PENDING', 'APPROVED', 'REJECTED')),
     is_active BOOLEAN DEFAULT true NOT NULL,
     views_count INTEGER DEFAULT 0 NOT NULL CHECK (views_count >= 0),
+    favorites_count INTEGER DEFAULT 0 NOT NULL CHECK (favorites_count >= 0),
     image_urls VARCHAR(512)
 );
 
@@ -72,6 +73,18 @@ CREATE TABLE favorites (
     PRIMARY KEY (user_id, ad_id)
 );
 
+-- Журнал добавлений и удалений избранного для дельта-синхронизации клиентов.
+-- Без внешнего ключа на users: записи об удалении пишутся и при каскадном удалении пользователя
+CREATE TABLE favorite_changes (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL,
+    ad_id UUID NOT NULL,
+    action VARCHAR(10) NOT NULL CHECK (action IN ('ADDED', 'REMOVED')),
+    changed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    -- Курсор идёт по (txid, id), как лента изменений объявлений
+    txid XID8 DEFAULT pg_current_xact_id() NOT NULL
+);
+
 CREATE TABLE views (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     ad_id UUID NOT NULL REFERENCES ads(id) ON DELETE CASCADE,
@@ -80,23 +93,50 @@ CREATE TABLE views (
     device VARCHAR(20) DEFAULT 'MOBILE' NOT NULL CHECK (device IN ('MOBILE', 'PC'))
 );
 
+-- Диалоги: объявление и пара участников (user_a_id < user_b_id).
+-- Последнее сообщение и непрочитанные каждого участника ведут триггеры на messages
+CREATE TABLE conversations (
+    id BIGSERIAL PRIMARY KEY,
+    ad_id UUID NOT NULL REFERENCES ads(id) ON DELETE CASCADE,
+    user_a_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    user_b_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    last_message_id UUID,
+    last_message_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    unread_a INTEGER DEFAULT 0 NOT NULL CHECK (unread_a >= 0),
+    unread_b INTEGER DEFAULT 0 NOT NULL CHECK (unread_b >= 0),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    UNIQUE (ad_id, user_a_id, user_b_id),
+    CHECK (user_a_id < user_b_id)
+);
+
 CREATE TABLE messages (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    conversation_id BIGINT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
     sender_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     recipient_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     ad_id UUID NOT NULL REFERENCES ads(id) ON DELETE CASCADE,
     text TEXT NOT NULL CHECK (LENGTH(text) BETWEEN 1 AND 2000),
     sent_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
     is_read BOOLEAN DEFAULT false NOT NULL,
+    txid XID8 DEFAULT pg_current_xact_id() NOT NULL,
+    search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('russian', text)) STORED,
     CHECK (sender_id <> recipient_id)
 );
 
+-- Непрочитанные входящие пользователя; ведут триггеры на messages
+CREATE TABLE user_unread_counts (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    unread INTEGER DEFAULT 0 NOT NULL CHECK (unread >= 0)
+);
+
 CREATE TABLE ad_audit_log (
     id SERIAL PRIMARY KEY,
     ad_id UUID NOT NULL,
     user_id UUID,
-    action VARCHAR(30) NOT NULL CHECK (action IN ('CREATED', 'UPDATED', 'DEACTIVATED', 'DELETED', 'MODERATION_APPROVED', 'MODERATION_REJECTED', 'VIEWS_INCREMENTED')),
-    changed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+    action VARCHAR(30) NOT NULL CHECK (action IN ('CREATED', 'UPDATED', 'DEACTIVATED', 'ACTIVATED', 'DELETED', 'MODERATION_APPROVED', 'MODERATION_REJECTED', 'VIEWS_INCREMENTED')),
+    changed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    -- Транзакция, сделавшая запись: курсор ленты изменений идёт по (txid, id)
+    txid XID8 DEFAULT pg_current_xact_id() NOT NULL
 );
 
 CREATE TABLE user_audit_log (
@@ -115,4 +155,52 @@ CREATE TABLE reports (
     description TEXT NOT NULL CHECK (LENGTH(description) >= 10),
     status VARCHAR(20) DEFAULT 'PENDING' NOT NULL CHECK (status IN ('PENDING', 'RESOLVED', 'REJECTED')),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
-);
\ No newline at end of file
+);
+
+-- Транзакционный outbox: события пишутся триггерами в той же транзакции, что и изменение
+CREATE TABLE outbox_events (
+    id BIGSERIAL PRIMARY KEY,
+    entity_type VARCHAR(30) NOT NULL,
+    entity_id TEXT NOT NULL,
+    event_type VARCHAR(20) NOT NULL CHECK (event_type IN ('CREATED', 'UPDATED', 'DELETED')),
+    payload JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    available_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    attempts INTEGER DEFAULT 0 NOT NULL,
+    last_error TEXT,
+    processed_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Периодические задачи: срок следующего запуска и итог последнего (общие для всех воркеров)
+CREATE TABLE scheduled_jobs (
+    name VARCHAR(100) PRIMARY KEY,
+    schedule VARCHAR(100) NOT NULL,
+    next_run_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_started_at TIMESTAMP WITH TIME ZONE,
+    last_finished_at TIMESTAMP WITH TIME ZONE,
+    last_duration_ms DOUBLE PRECISION,
+    last_status VARCHAR(20) CHECK (last_status IN ('SUCCESS', 'FAILED')),
+    last_error TEXT,
+    last_runner VARCHAR(255),
+    run_count BIGINT DEFAULT 0 NOT NULL,
+    failure_count BIGINT DEFAULT 0 NOT NULL
+);
+
+-- Очередь фоновых заданий: воркеры забирают строки через FOR UPDATE SKIP LOCKED
+CREATE TABLE background_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    payload JSONB DEFAULT '{}' NOT NULL,
+    status VARCHAR(20) DEFAULT 'QUEUED' NOT NULL CHECK (status IN ('QUEUED', 'RUNNING', 'DONE', 'DEAD')),
+    priority SMALLINT DEFAULT 0 NOT NULL,
+    attempts INTEGER DEFAULT 0 NOT NULL,
+    max_attempts INTEGER DEFAULT 5 NOT NULL,
+    run_after TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    locked_by VARCHAR(255),
+    result JSONB,
+    last_error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
@@ -62,6 +62,9 @@ BEGIN
             ELSIF NEW.moderation_status = 'REJECTED' THEN
                 INSERT INTO ad_audit_log (ad_id, user_id, action)
                 VALUES (NEW.id, NEW.user_id, 'MODERATION_REJECTED');
+            ELSE
+                INSERT INTO ad_audit_log (ad_id, user_id, action)
+                VALUES (NEW.id, NEW.user_id, 'UPDATED');
             END IF;
         END IF;
         
@@ -75,10 +78,13 @@ BEGIN
             END IF;
         END IF;
         
+        -- Счётчики (views_count, favorites_count) не считаются изменением содержимого
         IF OLD.moderation_status = NEW.moderation_status AND 
            OLD.is_active = NEW.is_active AND
-           (OLD.title <> NEW.title OR OLD.description <> NEW.description OR 
-            OLD.price <> NEW.price OR OLD.category_id <> NEW.category_id) THEN
+           (OLD.title, OLD.description, OLD.price, OLD.currency, OLD.category_id,
+            OLD.location_id, OLD.image_urls) IS DISTINCT FROM
+           (NEW.title, NEW.description, NEW.price, NEW.currency, NEW.category_id,
+            NEW.location_id, NEW.image_urls) THEN
             
             INSERT INTO ad_audit_log (ad_id, user_id, action)
             VALUES (NEW.id, NEW.user_id, 'UPDATED');
@@ -101,6 +107,29 @@ AFTER INSERT OR UPDATE OR DELETE ON ads
 FOR EACH ROW EXECUTE FUNCTION log_ad_changes();
 
 
+-- Изменение тегов объявления тоже попадает в журнал (одна запись на объявление за оператор)
+CREATE OR REPLACE FUNCTION log_ad_tag_changes()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO ad_audit_log (ad_id, user_id, action)
+    SELECT a.id, a.user_id, 'UPDATED'
+    FROM ads a
+    WHERE a.id IN (SELECT DISTINCT ad_id FROM changed_tags);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ad_tags_insert_audit_trigger
+AFTER INSERT ON ad_tags
+REFERENCING NEW TABLE AS changed_tags
+FOR EACH STATEMENT EXECUTE FUNCTION log_ad_tag_changes();
+
+CREATE TRIGGER ad_tags_delete_audit_trigger
+AFTER DELETE ON ad_tags
+REFERENCING OLD TABLE AS changed_tags
+FOR EACH STATEMENT EXECUTE FUNCTION log_ad_tag_changes();
+
+
 -- Автоматическое обновление счетчика просмотров
 CREATE OR REPLACE FUNCTION increment_ad_views()
 RETURNS TRIGGER AS $$
@@ -142,18 +171,26 @@ CREATE TRIGGER prevent_duplicate_reports
 BEFORE INSERT ON reports
 FOR EACH ROW EXECUTE FUNCTION check_duplicate_report();
 
--- Запрет создания сообщения к неактивному объявлению
+-- Запрет создания сообщения к неактивному объявлению.
+-- Ошибки несут имя ограничения: API отправки сообщения сопоставляет
+-- их с HTTP-ответами без предварительных проверок
 CREATE OR REPLACE FUNCTION prevent_message_to_inactive_ad()
 RETURNS TRIGGER AS $$
 DECLARE
     ad_active BOOLEAN;
 BEGIN
     SELECT is_active INTO ad_active FROM ads WHERE id = NEW.ad_id;
-    
+
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Ad % does not exist', NEW.ad_id
+            USING ERRCODE = 'foreign_key_violation', CONSTRAINT = 'messages_ad_id_fkey';
+    END IF;
+
     IF NOT ad_active THEN
-        RAISE EXCEPTION 'Cannot send message to inactive ad';
+        RAISE EXCEPTION 'Cannot send message to inactive ad'
+            USING ERRCODE = 'check_violation', CONSTRAINT = 'messages_ad_active';
     END IF;
-    
+
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
@@ -162,6 +199,194 @@ CREATE TRIGGER check_ad_active_before_message
 BEFORE INSERT ON messages
 FOR EACH ROW EXECUTE FUNCTION prevent_message_to_inactive_ad();
 
+-- Диалог сообщения: создание или обновление строки conversations
+-- (последнее сообщение, непрочитанные получателя) и привязка сообщения к ней;
+-- счётчик непрочитанных получателя в user_unread_counts.
+-- Срабатывает после check_ad_active_before_message (триггеры идут по имени)
+CREATE OR REPLACE FUNCTION set_message_conversation()
+RETURNS TRIGGER AS $$
+DECLARE
+    recipient_is_a BOOLEAN := NEW.recipient_id < NEW.sender_id;
+    unread INTEGER := CASE WHEN NEW.is_read THEN 0 ELSE 1 END;
+BEGIN
+    IF NEW.sender_id = NEW.recipient_id THEN
+        RAISE EXCEPTION 'Sender and recipient must differ'
+            USING ERRCODE = 'check_violation', CONSTRAINT = 'messages_check';
+    END IF;
+
+    INSERT INTO conversations AS c (
+        ad_id, user_a_id, user_b_id, last_message_id, last_message_at, unread_a, unread_b
+    )
+    VALUES (
+        NEW.ad_id,
+        LEAST(NEW.sender_id, NEW.recipient_id),
+        GREATEST(NEW.sender_id, NEW.recipient_id),
+        NEW.id,
+        NEW.sent_at,
+        CASE WHEN recipient_is_a THEN unread ELSE 0 END,
+        CASE WHEN recipient_is_a THEN 0 ELSE unread END
+    )
+    ON CONFLICT (ad_id, user_a_id, user_b_id) DO UPDATE
+    SET last_message_id = CASE
+            WHEN EXCLUDED.last_message_at >= c.last_message_at THEN EXCLUDED.last_message_id
+            ELSE c.last_message_id
+        END,
+        last_message_at = GREATEST(c.last_message_at, EXCLUDED.last_message_at),
+        unread_a = c.unread_a + EXCLUDED.unread_a,
+        unread_b = c.unread_b + EXCLUDED.unread_b
+    RETURNING c.id INTO NEW.conversation_id;
+
+    IF unread > 0 THEN
+        INSERT INTO user_unread_counts AS u (user_id, unread)
+        VALUES (NEW.recipient_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET unread = u.unread + 1;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER set_message_conversation_trigger
+BEFORE INSERT ON messages
+FOR EACH ROW EXECUTE FUNCTION set_message_conversation();
+
+-- Непрочитанные в диалогах и у получателей при смене is_read: по запросу на оператор,
+-- поэтому массовая отметка прочтения не пересчитывает диалог построчно
+CREATE OR REPLACE FUNCTION update_conversation_unread()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE conversations c
+    SET unread_a = c.unread_a + d.delta_a,
+        unread_b = c.unread_b + d.delta_b
+    FROM (
+        SELECT n.conversation_id,
+               COALESCE(SUM(CASE WHEN n.is_read THEN -1 ELSE 1 END)
+                        FILTER (WHERE n.recipient_id < n.sender_id), 0) AS delta_a,
+               COALESCE(SUM(CASE WHEN n.is_read THEN -1 ELSE 1 END)
+                        FILTER (WHERE n.recipient_id > n.sender_id), 0) AS delta_b
+        FROM new_messages n
+        JOIN old_messages o ON o.id = n.id
+        WHERE o.is_read <> n.is_read
+        GROUP BY n.conversation_id
+    ) d
+    WHERE c.id = d.conversation_id;
+
+    -- Уменьшение только через UPDATE: в INSERT ... ON CONFLICT ограничение
+    -- CHECK (unread >= 0) проверяется на предлагаемой строке ещё до конфликта
+    UPDATE user_unread_counts u
+    SET unread = GREATEST(u.unread + d.delta, 0)
+    FROM (
+        SELECT n.recipient_id, SUM(CASE WHEN n.is_read THEN -1 ELSE 1 END) AS delta
+        FROM new_messages n
+        JOIN old_messages o ON o.id = n.id
+        WHERE o.is_read <> n.is_read
+        GROUP BY n.recipient_id
+    ) d
+    WHERE u.user_id = d.recipient_id AND d.delta < 0;
+
+    INSERT INTO user_unread_counts AS u (user_id, unread)
+    SELECT n.recipient_id, SUM(CASE WHEN n.is_read THEN -1 ELSE 1 END)
+    FROM new_messages n
+    JOIN old_messages o ON o.id = n.id
+    WHERE o.is_read <> n.is_read
+    GROUP BY n.recipient_id
+    HAVING SUM(CASE WHEN n.is_read THEN -1 ELSE 1 END) > 0
+    ON CONFLICT (user_id) DO UPDATE SET unread = u.unread + EXCLUDED.unread;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER messages_read_conversation_trigger
+AFTER UPDATE ON messages
+REFERENCING OLD TABLE AS old_messages NEW TABLE AS new_messages
+FOR EACH STATEMENT EXECUTE FUNCTION update_conversation_unread();
+
+-- Удаление сообщений: диалог без сообщений удаляется, у остальных
+-- вычитаются непрочитанные и пересчитывается последнее сообщение;
+-- непрочитанные удалённые вычитаются и из счётчиков получателей
+CREATE OR REPLACE FUNCTION cleanup_conversation_on_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM conversations c
+    WHERE c.id IN (SELECT DISTINCT conversation_id FROM old_messages)
+      AND NOT EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = c.id);
+
+    UPDATE conversations c
+    SET unread_a = c.unread_a - d.unread_a,
+        unread_b = c.unread_b - d.unread_b
+    FROM (
+        SELECT conversation_id,
+               COUNT(*) FILTER (WHERE recipient_id < sender_id) AS unread_a,
+               COUNT(*) FILTER (WHERE recipient_id > sender_id) AS unread_b
+        FROM old_messages
+        WHERE NOT is_read
+        GROUP BY conversation_id
+    ) d
+    WHERE c.id = d.conversation_id;
+
+    UPDATE conversations c
+    SET (last_message_id, last_message_at) = (
+        SELECT m.id, m.sent_at
+        FROM messages m
+        WHERE m.conversation_id = c.id
+        ORDER BY m.sent_at DESC, m.id DESC
+        LIMIT 1
+    )
+    WHERE c.last_message_id IN (SELECT id FROM old_messages);
+
+    UPDATE user_unread_counts u
+    SET unread = GREATEST(u.unread - d.unread, 0)
+    FROM (
+        SELECT recipient_id, COUNT(*) AS unread
+        FROM old_messages
+        WHERE NOT is_read
+        GROUP BY recipient_id
+    ) d
+    WHERE u.user_id = d.recipient_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER messages_delete_conversation_trigger
+AFTER DELETE ON messages
+REFERENCING OLD TABLE AS old_messages
+FOR EACH STATEMENT EXECUTE FUNCTION cleanup_conversation_on_delete();
+
+-- Уведомление о новом сообщении для push-доставки (канал new_messages).
+-- NOTIFY уходит при фиксации транзакции; текст, не помещающийся
+-- в предел полезной нагрузки, воркер дочитывает из таблицы
+CREATE OR REPLACE FUNCTION notify_new_message()
+RETURNS TRIGGER AS $$
+DECLARE
+    payload JSONB;
+BEGIN
+    payload := jsonb_build_object(
+        'id', NEW.id,
+        'conversation_id', NEW.conversation_id,
+        'sender_id', NEW.sender_id,
+        'recipient_id', NEW.recipient_id,
+        'ad_id', NEW.ad_id,
+        'sent_at', NEW.sent_at,
+        'is_read', NEW.is_read,
+        'txid', NEW.txid::text,
+        -- Все транзакции младше горизонта уже завершены: их уведомления пришли раньше
+        'horizon', pg_snapshot_xmin(pg_current_snapshot())::text,
+        'text', NEW.text
+    );
+    IF octet_length(payload::text) > 7000 THEN
+        payload := payload - 'text';
+    END IF;
+    PERFORM pg_notify('new_messages', payload::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER messages_notify_trigger
+AFTER INSERT ON messages
+FOR EACH ROW EXECUTE FUNCTION notify_new_message();
+
 
 -- Автоматическое установления reported_user_id в жалобах
 CREATE OR REPLACE FUNCTION set_reported_user_from_ad()
@@ -174,4 +399,120 @@ $$ LANGUAGE plpgsql;
 
 CREATE TRIGGER set_reported_user_from_ad_trigger
 BEFORE INSERT ON reports
-FOR EACH ROW EXECUTE FUNCTION set_reported_user_from_ad();
\ No newline at end of file
+FOR EACH ROW EXECUTE FUNCTION set_reported_user_from_ad();
+
+-- Журнал изменений избранного: одна вставка на оператор,
+-- массовые добавления и удаления не пишут журнал построчно
+CREATE OR REPLACE FUNCTION log_favorites_added()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO favorite_changes (user_id, ad_id, action, changed_at)
+    SELECT user_id, ad_id, 'ADDED', added_at FROM added_favorites;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION log_favorites_removed()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO favorite_changes (user_id, ad_id, action)
+    SELECT user_id, ad_id, 'REMOVED' FROM removed_favorites;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER favorites_added_trigger
+AFTER INSERT ON favorites
+REFERENCING NEW TABLE AS added_favorites
+FOR EACH STATEMENT EXECUTE FUNCTION log_favorites_added();
+
+CREATE TRIGGER favorites_removed_trigger
+AFTER DELETE ON favorites
+REFERENCING OLD TABLE AS removed_favorites
+FOR EACH STATEMENT EXECUTE FUNCTION log_favorites_removed();
+
+-- Счётчик избранного в объявлении: одно обновление на объявление за оператор,
+-- а не на каждую строку массового добавления или удаления
+CREATE OR REPLACE FUNCTION update_ads_favorites_count()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF (TG_OP = 'INSERT') THEN
+        UPDATE ads a
+        SET favorites_count = a.favorites_count + d.delta
+        FROM (SELECT ad_id, COUNT(*) AS delta FROM added_favorites GROUP BY ad_id) d
+        WHERE a.id = d.ad_id;
+    ELSE
+        UPDATE ads a
+        SET favorites_count = GREATEST(a.favorites_count - d.delta, 0)
+        FROM (SELECT ad_id, COUNT(*) AS delta FROM removed_favorites GROUP BY ad_id) d
+        WHERE a.id = d.ad_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER favorites_count_added_trigger
+AFTER INSERT ON favorites
+REFERENCING NEW TABLE AS added_favorites
+FOR EACH STATEMENT EXECUTE FUNCTION update_ads_favorites_count();
+
+CREATE TRIGGER favorites_count_removed_trigger
+AFTER DELETE ON favorites
+REFERENCING OLD TABLE AS removed_favorites
+FOR EACH STATEMENT EXECUTE FUNCTION update_ads_favorites_count();
+
+-- Запись событий в outbox.
+-- Аргументы: тип сущности, колонка с идентификатором, колонки-счётчики,
+-- изменение которых само по себе событием не считается
+CREATE OR REPLACE FUNCTION enqueue_outbox_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    entity_name TEXT := TG_ARGV[0];
+    id_column TEXT := TG_ARGV[1];
+    ignored_columns TEXT[] := COALESCE(TG_ARGV[2:TG_NARGS - 1], '{}');
+    row_data JSONB;
+    event_name TEXT;
+BEGIN
+    IF (TG_OP = 'INSERT') THEN
+        row_data := to_jsonb(NEW);
+        event_name := 'CREATED';
+    ELSIF (TG_OP = 'UPDATE') THEN
+        IF (to_jsonb(OLD) - ignored_columns) = (to_jsonb(NEW) - ignored_columns) THEN
+            RETURN NULL;
+        END IF;
+        row_data := to_jsonb(NEW);
+        event_name := 'UPDATED';
+    ELSE
+        row_data := to_jsonb(OLD);
+        event_name := 'DELETED';
+    END IF;
+
+    -- Служебные и производные колонки в событие не попадают
+    row_data := row_data - 'password_hash' - 'search_vector';
+
+    INSERT INTO outbox_events (entity_type, entity_id, event_type, payload)
+    VALUES (entity_name, row_data ->> id_column, event_name, row_data);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER ads_outbox_trigger
+AFTER INSERT OR UPDATE OR DELETE ON ads
+FOR EACH ROW EXECUTE FUNCTION enqueue_outbox_event('ad', 'id', 'views_count', 'favorites_count');
+
+CREATE TRIGGER users_outbox_trigger
+AFTER INSERT OR UPDATE OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION enqueue_outbox_event('user', 'id');
+
+CREATE TRIGGER favorites_outbox_trigger
+AFTER INSERT OR UPDATE OR DELETE ON favorites
+FOR EACH ROW EXECUTE FUNCTION enqueue_outbox_event('favorite', 'user_id');
+
+CREATE TRIGGER messages_outbox_trigger
+AFTER INSERT OR UPDATE OR DELETE ON messages
+FOR EACH ROW EXECUTE FUNCTION enqueue_outbox_event('message', 'id');
+
+CREATE TRIGGER reports_outbox_trigger
+AFTER INSERT OR UPDATE OR DELETE ON reports
+FOR EACH ROW EXECUTE FUNCTION enqueue_outbox_event('report', 'id');
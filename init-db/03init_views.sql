@@ -12,6 +12,7 @@ SELECT
     a.moderation_status,
     a.is_active,
     a.views_count,
+    a.favorites_count,
     a.image_urls,
     
     -- Статистика по просмотрам
@@ -25,9 +26,6 @@ SELECT
     (SELECT COUNT(DISTINCT m.sender_id) FROM messages m WHERE m.ad_id = a.id) AS unique_senders,
     (SELECT COUNT(*) FROM messages m WHERE m.ad_id = a.id AND m.is_read = false) AS unread_messages,
     
-    -- Статистика по избранному
-    (SELECT COUNT(*) FROM favorites f WHERE f.ad_id = a.id) AS favorites_count,
-    
     -- Статистика по жалобам
     (SELECT COUNT(*) FROM reports r WHERE r.ad_id = a.id) AS total_reports,
     (SELECT COUNT(*) FROM reports r WHERE r.ad_id = a.id AND r.status = 'PENDING') AS pending_reports,
@@ -71,7 +69,7 @@ SELECT
     COALESCE(AVG(m.total_messages), 0) AS avg_messages_per_ad,
     
     -- Избранное
-    COALESCE(SUM(f.favorites_count), 0) AS total_favorites,
+    COALESCE(SUM(a.favorites_count), 0) AS total_favorites,
     
     -- Жалобы
     COALESCE(r.total_reports, 0) AS total_reports_received,
@@ -88,11 +86,6 @@ LEFT JOIN (
     FROM messages
     GROUP BY ad_id
 ) m ON m.ad_id = a.id
-LEFT JOIN (
-    SELECT ad_id, COUNT(*) AS favorites_count
-    FROM favorites
-    GROUP BY ad_id
-) f ON f.ad_id = a.id
 LEFT JOIN (
     SELECT 
         reported_user_id,
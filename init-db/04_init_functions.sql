@@ -54,11 +54,13 @@ BEGIN
         WHERE messages.ad_id = a.id
           AND messages.sent_at >= NOW() - INTERVAL '1 day' * p_days
     ) m ON true
-    -- Избранное за период
+    -- Избранное за период; объявления без добавлений в избранное
+    -- отсекаются по счётчику, без обращения к favorites
     LEFT JOIN LATERAL (
         SELECT COUNT(*) AS favorites_count
         FROM favorites
-        WHERE favorites.ad_id = a.id
+        WHERE a.favorites_count > 0
+          AND favorites.ad_id = a.id
           AND favorites.added_at >= NOW() - INTERVAL '1 day' * p_days
     ) f ON true
     WHERE 
@@ -90,4 +92,91 @@ BEGIN
     
     RETURN suggested_price;
 END;
-$$ LANGUAGE plpgsql STABLE;
\ No newline at end of file
+$$ LANGUAGE plpgsql STABLE;
+
+
+-- Время в формате ответов API: UTC с суффиксом Z, микросекунды только если они есть
+CREATE OR REPLACE FUNCTION api_timestamp(ts TIMESTAMPTZ)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN ts IS NULL THEN NULL
+        WHEN date_part('microseconds', ts)::BIGINT % 1000000 = 0
+            THEN to_char(ts AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS"Z"')
+        ELSE to_char(ts AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"')
+    END
+$$ LANGUAGE sql STABLE;
+
+
+-- Число в формате ответов API, как float в Python: целое значение с «.0»
+-- (float8 в JSON даёт 1500, а orjson для float — 1500.0)
+CREATE OR REPLACE FUNCTION api_float(value DOUBLE PRECISION)
+RETURNS JSON AS $$
+    SELECT CASE
+        WHEN value IS NULL THEN NULL
+        WHEN value = trunc(value) AND abs(value) < 1e16
+            THEN (value::NUMERIC::TEXT || '.0')::JSON
+        ELSE to_json(value)
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Короткое описание для карточек избранного (как build_favorite_from_row в Python):
+-- до max_length символов, обрезка по последнему пробелу, но не раньше min_cut символов, и «...»
+CREATE OR REPLACE FUNCTION truncate_description(
+    description TEXT,
+    max_length INT DEFAULT 150,
+    min_cut INT DEFAULT 100
+)
+RETURNS TEXT AS $$
+DECLARE
+    head TEXT;
+    space_pos INT;
+    cut_pos INT;
+BEGIN
+    IF description IS NULL THEN
+        RETURN '';
+    END IF;
+    IF char_length(description) <= max_length THEN
+        RETURN description;
+    END IF;
+
+    head := left(description, max_length);
+    space_pos := strpos(reverse(head), ' ');
+    cut_pos := char_length(head) - space_pos;
+    IF space_pos = 0 OR cut_pos < min_cut THEN
+        cut_pos := max_length;
+    END IF;
+
+    RETURN btrim(left(description, cut_pos), E' \t\n\r') || '...';
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+
+-- Список ссылок на изображения из текстового поля image_urls (JSON-массив), иначе []:
+-- null пропускаются, остальные элементы — строки; невалидный JSON даёт [], как в Python
+CREATE OR REPLACE FUNCTION image_urls_json(image_urls TEXT)
+RETURNS JSON AS $$
+DECLARE
+    parsed JSONB;
+BEGIN
+    IF image_urls IS NULL OR image_urls = '' THEN
+        RETURN '[]'::json;
+    END IF;
+
+    parsed := image_urls::jsonb;
+    IF jsonb_typeof(parsed) <> 'array' THEN
+        RETURN '[]'::json;
+    END IF;
+
+    RETURN COALESCE((
+        SELECT json_agg(
+            CASE WHEN jsonb_typeof(e.value) = 'string' THEN e.value #>> '{}' ELSE e.value::text END
+            ORDER BY e.ordinality
+        )
+        FROM jsonb_array_elements(parsed) WITH ORDINALITY AS e(value, ordinality)
+        WHERE jsonb_typeof(e.value) <> 'null'
+    ), '[]'::json);
+EXCEPTION
+    WHEN invalid_text_representation THEN
+        RETURN '[]'::json;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
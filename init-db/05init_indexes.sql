@@ -25,6 +25,8 @@ CREATE INDEX idx_ads_location_id ON ads(location_id);
 CREATE INDEX idx_ads_user_id ON ads(user_id);
 CREATE INDEX idx_ads_price ON ads(price);
 CREATE INDEX idx_ads_views_count ON ads(views_count DESC);
+CREATE INDEX idx_ads_favorites_count ON ads(favorites_count DESC, created_at DESC)
+    WHERE is_active = true AND moderation_status = 'APPROVED';
 CREATE INDEX idx_ads_description_trgm ON ads USING GIN (description gin_trgm_ops);
 CREATE INDEX idx_ads_title_trgm ON ads USING GIN (title gin_trgm_ops);
 
@@ -41,6 +43,9 @@ CREATE INDEX idx_ad_tags_composite ON ad_tags(ad_id, tag_id);
 CREATE INDEX idx_favorites_user_id ON favorites(user_id);
 CREATE INDEX idx_favorites_ad_id ON favorites(ad_id);
 CREATE INDEX idx_favorites_added_at ON favorites(added_at DESC);
+-- дельта-синхронизация избранного: изменения пользователя после курсора (txid, id)
+CREATE INDEX idx_favorite_changes_user ON favorite_changes(user_id, txid, id);
+CREATE INDEX idx_favorite_changes_changed_at ON favorite_changes USING BRIN (changed_at);
 
 -- просмотры
 CREATE INDEX idx_views_ad_id ON views(ad_id);
@@ -50,12 +55,24 @@ CREATE INDEX idx_views_viewed_at_brin ON views USING BRIN (viewed_at);
 CREATE INDEX idx_views_user_ad ON views(user_id, ad_id);
 
 -- сообщения
-CREATE INDEX idx_messages_sender_id ON messages(sender_id);
-CREATE INDEX idx_messages_recipient_id ON messages(recipient_id);
+-- сообщения пользователя по времени: догрузка пропущенного в push-канале и лента сообщений
+CREATE INDEX idx_messages_sender_id ON messages(sender_id, sent_at, id);
+CREATE INDEX idx_messages_recipient_id ON messages(recipient_id, sent_at, id);
+-- Догрузка потока сообщений в порядке транзакций (txid, id)
+CREATE INDEX idx_messages_sender_txid ON messages(sender_id, txid, id);
+CREATE INDEX idx_messages_recipient_txid ON messages(recipient_id, txid, id);
 CREATE INDEX idx_messages_ad_id ON messages(ad_id);
 CREATE INDEX idx_messages_is_read ON messages(is_read);
 CREATE INDEX idx_messages_text_trgm ON messages USING GIN (text gin_trgm_ops);
+-- полнотекстовый поиск в сообщениях пользователя: участник (btree_gin) и документ в одном индексе
+CREATE INDEX idx_messages_recipient_fts ON messages USING GIN (recipient_id, search_vector);
+CREATE INDEX idx_messages_sender_fts ON messages USING GIN (sender_id, search_vector);
 CREATE INDEX idx_messages_sent_at_brin ON messages USING BRIN (sent_at);
+-- сообщения диалога по времени (лента диалога, пересчёт последнего сообщения)
+CREATE INDEX idx_messages_conversation ON messages(conversation_id, sent_at, id);
+-- диалоги пользователя по последней активности: по индексу на каждую сторону пары
+CREATE INDEX idx_conversations_user_a ON conversations(user_a_id, last_message_at DESC, id DESC);
+CREATE INDEX idx_conversations_user_b ON conversations(user_b_id, last_message_at DESC, id DESC);
 
 -- жалобы
 CREATE INDEX idx_reports_ad_id ON reports(ad_id);
@@ -68,7 +85,19 @@ CREATE INDEX idx_reports_created_at ON reports USING BRIN(created_at);
 CREATE INDEX idx_ad_audit_log_ad_id ON ad_audit_log(ad_id);
 CREATE INDEX idx_ad_audit_log_action ON ad_audit_log(action);
 CREATE INDEX idx_ad_audit_log_changed_at_brin ON ad_audit_log USING BRIN (changed_at);
+-- лента изменений: курсор (txid, id) без записей о просмотрах
+CREATE INDEX idx_ad_audit_log_changes ON ad_audit_log(txid, id) WHERE action <> 'VIEWS_INCREMENTED';
 
 CREATE INDEX idx_user_audit_log_target_user_id ON user_audit_log(target_user_id);
 CREATE INDEX idx_user_audit_log_action ON user_audit_log(action);
-CREATE INDEX idx_user_audit_log_changed_at_brin ON user_audit_log USING BRIN (changed_at);
\ No newline at end of file
+CREATE INDEX idx_user_audit_log_changed_at_brin ON user_audit_log USING BRIN (changed_at);
+
+-- outbox: выборка необработанных событий
+CREATE INDEX idx_outbox_events_pending ON outbox_events(available_at, id) WHERE processed_at IS NULL;
+-- outbox: очистка обработанных событий по сроку хранения
+CREATE INDEX idx_outbox_events_processed ON outbox_events(processed_at) WHERE processed_at IS NOT NULL;
+-- фоновые задания: выдача готовых по приоритету и поиск заданий с истёкшей арендой
+CREATE INDEX idx_background_jobs_queued ON background_jobs(job_type, priority DESC, run_after, id) WHERE status = 'QUEUED';
+CREATE INDEX idx_background_jobs_running ON background_jobs(job_type, locked_until) WHERE status = 'RUNNING';
+-- фоновые задания: очистка завершённых по сроку хранения
+CREATE INDEX idx_background_jobs_finished ON background_jobs(finished_at) WHERE status = 'DONE';
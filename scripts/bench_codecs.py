@@ -0,0 +1,107 @@
+"""
+Замер CPU клиента на страницах списков объявлений и сообщений:
+соединение без кодеков (json приходит строкой и разбирается json.loads,
+UUID передаются строками) против соединения с кодеками из init_connection.
+
+    python -m scripts.bench_codecs --pages 200 --page-size 100
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.api.v1.ads import ADS_LIST_QUERY, build_ad_from_row  # noqa: E402
+from app.api.v1.messages import build_message_from_row  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.db.session import init_connection  # noqa: E402
+
+ADS_PAGE_QUERY = ADS_LIST_QUERY + """
+WHERE a.is_active = true
+GROUP BY a.id, c.id, l.id, u.id
+ORDER BY a.created_at DESC
+LIMIT $1"""
+
+MESSAGES_PAGE_QUERY = """
+SELECT
+    m.id, m.conversation_id, m.sender_id, m.recipient_id, m.ad_id, m.text,
+    m.sent_at, m.is_read, s.username as sender_username, r.username as recipient_username,
+    a.title as ad_title
+FROM messages m
+JOIN users s ON s.id = m.sender_id
+JOIN users r ON r.id = m.recipient_id
+JOIN ads a ON a.id = m.ad_id
+WHERE (m.sender_id = $1 OR m.recipient_id = $1)
+ORDER BY m.sent_at DESC
+LIMIT $2"""
+
+
+def legacy_ad(row) -> dict:
+    ad_data = build_ad_from_row(row)
+    try:
+        ad_data["tags"] = json.loads(row["tags"]) or []
+    except (json.JSONDecodeError, TypeError):
+        ad_data["tags"] = []
+    return ad_data
+
+
+async def measure(pages: int, fetch) -> float:
+    """CPU-время процесса на одну страницу, мс (ожидание базы не учитывается)"""
+    started = time.process_time()
+    for _ in range(pages):
+        await fetch()
+    return (time.process_time() - started) * 1000 / pages
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    plain = await asyncpg.connect(settings.DATABASE_URL)
+    native = await asyncpg.connect(settings.DATABASE_URL)
+    await init_connection(native)
+    try:
+        user_id = await native.fetchval(
+            "SELECT sender_id FROM messages GROUP BY sender_id ORDER BY COUNT(*) DESC LIMIT 1")
+        if user_id is None:
+            raise SystemExit("Нет сообщений: сначала запустите scripts/generate_data.py")
+
+        async def ads_before():
+            rows = await plain.fetch(ADS_PAGE_QUERY, args.page_size)
+            return [legacy_ad(row) for row in rows]
+
+        async def ads_after():
+            rows = await native.fetch(ADS_PAGE_QUERY, args.page_size)
+            return [build_ad_from_row(row) for row in rows]
+
+        async def messages_before():
+            rows = await plain.fetch(MESSAGES_PAGE_QUERY, str(user_id), args.page_size)
+            return [build_message_from_row(row) for row in rows]
+
+        async def messages_after():
+            rows = await native.fetch(MESSAGES_PAGE_QUERY, user_id, args.page_size)
+            return [build_message_from_row(row) for row in rows]
+
+        print(f"Страница: до {args.page_size} строк, страниц: {args.pages}")
+        print(f"{'эндпоинт':<12}{'было, мс':>12}{'стало, мс':>12}{'экономия':>12}")
+        for name, before, after in (("ads", ads_before, ads_after),
+                                    ("messages", messages_before, messages_after)):
+            await before()
+            await after()
+            old_ms = await measure(args.pages, before)
+            new_ms = await measure(args.pages, after)
+            saved = (1 - new_ms / old_ms) * 100 if old_ms else 0.0
+            print(f"{name:<12}{old_ms:>12.3f}{new_ms:>12.3f}{saved:>11.1f}%")
+    finally:
+        await plain.close()
+        await native.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+"""
+Сравнение затрат CPU на сериализацию страницы списка:
+старый путь (dict -> валидация схемы pydantic -> json.dumps) против
+быстрого (готовый dict нужной формы -> orjson).
+Перед замером проверяется, что оба пути дают одинаковый JSON.
+
+    python -m scripts.bench_serialization --page-size 100 --pages 200
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List
+
+from asyncpg.pgproto.pgproto import UUID
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+
+load_dotenv()
+
+from app.api.v1.ads import build_ad_from_row  # noqa: E402
+from app.api.v1.analitics import build_trending_from_row  # noqa: E402
+from app.api.v1.favorites import build_favorite_from_row  # noqa: E402
+from app.api.v1.messages import build_message_from_row  # noqa: E402
+from app.core.serialization import FastJSONResponse  # noqa: E402
+from app.schemas.ad import AdOut  # noqa: E402
+from app.schemas.analitics import TrendingAdResponse  # noqa: E402
+from app.schemas.favorites import FavoriteAdOut  # noqa: E402
+from app.schemas.message import MessageOut  # noqa: E402
+
+WORDS = ("продам", "срочно", "новый", "отличное", "состояние", "торг",
+         "доставка", "гарантия", "оригинал", "комплект", "недорого")
+
+
+def _uuid() -> UUID:
+    """UUID в том виде, в котором его возвращает asyncpg"""
+    return UUID(str(uuid.uuid4()))
+
+
+def _text(words: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(words))
+
+
+def _created_at() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=random.randint(0, 10 ** 7))
+
+
+def ad_row() -> dict:
+    tags = [
+        {"id": i, "name": f"тег {i}", "slug": f"tag-{i}"}
+        for i in random.sample(range(1, 50), random.randint(0, 5))
+    ]
+    return {
+        "id": _uuid(), "user_id": _uuid(),
+        "category_id": random.randint(1, 20), "location_id": random.randint(1, 500),
+        "title": _text(4), "description": _text(40),
+        "price": Decimal(random.randint(100, 10 ** 6)) / 100, "currency": "RUB",
+        "created_at": _created_at(), "moderation_status": "APPROVED",
+        "is_active": True, "views_count": random.randint(0, 10 ** 5),
+        "image_urls": '["/img/1.jpg", "/img/2.jpg"]',
+        "category_name": "Электроника", "category_slug": "elektronika",
+        "city": "Москва", "district": "Тверской", "street": "Тверская", "building": "1",
+        "owner_username": "user_" + uuid.uuid4().hex[:8], "owner_avatar": None,
+        "tags": tags,
+    }
+
+
+def favorite_row() -> dict:
+    row = ad_row()
+    return {key: row[key] for key in (
+        "id", "title", "description", "price", "currency", "created_at",
+        "views_count", "image_urls", "category_name", "city", "district",
+        "owner_username", "owner_avatar")}
+
+
+def message_row() -> dict:
+    return {
+        "id": _uuid(), "conversation_id": random.randint(1, 10 ** 6),
+        "sender_id": _uuid(), "recipient_id": _uuid(),
+        "ad_id": _uuid(), "text": _text(15), "sent_at": _created_at(),
+        "is_read": random.random() < 0.5, "sender_username": "sender",
+        "recipient_username": "recipient", "ad_title": _text(4),
+    }
+
+
+def trending_row() -> dict:
+    return {
+        "ad_id": _uuid(), "title": _text(4),
+        "price": Decimal(random.randint(100, 10 ** 6)) / 100, "currency": "RUB",
+        "city": "Москва", "category_name": "Электроника",
+        "views_last_period": random.randint(0, 1000),
+        "messages_last_period": random.randint(0, 100),
+        "favorites_last_period": random.randint(0, 100),
+        "trending_score": Decimal(random.randint(0, 10 ** 6)) / 1000,
+        "created_at": _created_at(),
+    }
+
+
+def legacy_ad(row) -> dict:
+    """Прежнее преобразование: все колонки строки плюс вложенные объекты"""
+    ad_data = dict(row)
+    ad_data["category"] = {"id": row["category_id"], "name": row["category_name"],
+                           "slug": row["category_slug"]}
+    ad_data["location"] = {"id": row["location_id"], "city": row["city"],
+                           "district": row["district"], "street": row["street"],
+                           "building": row["building"]}
+    ad_data["owner"] = {"id": row["user_id"], "username": row["owner_username"],
+                        "avatar_url": row["owner_avatar"]}
+    ad_data["tags"] = row["tags"] or []
+    return ad_data
+
+
+def legacy_trending(row) -> TrendingAdResponse:
+    return TrendingAdResponse(**build_trending_from_row(row))
+
+
+CASES = {
+    "ads": (ad_row, legacy_ad, build_ad_from_row, List[AdOut]),
+    "favorites": (favorite_row, build_favorite_from_row, build_favorite_from_row,
+                  List[FavoriteAdOut]),
+    "messages": (message_row, build_message_from_row, build_message_from_row,
+                 List[MessageOut]),
+    "trending": (trending_row, legacy_trending, build_trending_from_row,
+                 List[TrendingAdResponse]),
+}
+
+
+def legacy_render(adapter: TypeAdapter, items) -> bytes:
+    """Путь FastAPI с response_model: валидация, dump в JSON-режиме, json.dumps"""
+    content = adapter.dump_python(adapter.validate_python(items), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def measure(func, pages) -> float:
+    """CPU-время на одну страницу, мс"""
+    started = time.process_time()
+    for page in pages:
+        func(page)
+    return (time.process_time() - started) * 1000 / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+
+    response = FastJSONResponse(content=None)
+    print(f"Страница: {args.page_size} строк, страниц: {args.pages}")
+    print(f"{'эндпоинт':<12}{'было, мс':>12}{'стало, мс':>12}{'ускорение':>12}")
+    for name, (make_row, legacy, fast, model) in CASES.items():
+        adapter = TypeAdapter(model)
+        pages = [[make_row() for _ in range(args.page_size)]
+                 for _ in range(args.pages)]
+
+        def before(page):
+            return legacy_render(adapter, [legacy(row) for row in page])
+
+        def after(page):
+            return response.render([fast(row) for row in page])
+
+        # Дробные числа сравниваются как текст: 1500 и 1500.0 — разная форма ответа
+        if (json.loads(before(pages[0]), parse_float=str)
+                != json.loads(after(pages[0]), parse_float=str)):
+            raise SystemExit(f"{name}: форма ответа отличается")
+
+        old_ms = measure(before, pages)
+        new_ms = measure(after, pages)
+        print(f"{name:<12}{old_ms:>12.3f}{new_ms:>12.3f}{old_ms / new_ms:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
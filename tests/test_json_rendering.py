@@ -0,0 +1,43 @@
+import json
+import pytest
+from tests.conftest import run_sql
+
+
+@pytest.fixture
+def render_both(client, monkeypatch):
+    """
+    Ответ эндпоинта при рендеринге в базе и при сериализации в Python.
+    Дробные числа остаются строками: 1500 и 1500.0 должны различаться
+    """
+    from app.config import settings
+
+    def render(path: str, params: dict) -> tuple:
+        bodies = []
+        for enabled in (True, False):
+            monkeypatch.setattr(settings, "DB_JSON_RENDERING", enabled)
+            response = client.get(path, params=params)
+            assert response.status_code == 200, response.text
+            bodies.append(json.loads(response.content, parse_float=str))
+        return tuple(bodies)
+    return render
+
+
+def test_ads_list_renders_identically(render_both, market):
+    in_db, in_python = render_both("/api/v1/ads/", {"category_id": market["category_id"]})
+    assert in_python[0]["price"] == "1500.0"
+    assert in_db == in_python
+
+
+def test_favorites_list_renders_identically(client, render_both, market):
+    run_sql(
+        "UPDATE ads SET description = $2, image_urls = $3 WHERE id = $1",
+        market["ad_id"], "Велосипед в хорошем состоянии, " * 10, '["a.jpg", null, "b.jpg"]')
+    response = client.post("/api/v1/favorites/", params={
+        "ad_id": str(market["ad_id"]), "user_id": str(market["buyer"])})
+    assert response.status_code == 201, response.text
+
+    in_db, in_python = render_both("/api/v1/favorites/", {"user_id": str(market["buyer"])})
+    assert in_python[0]["price"] == "1500.0"
+    assert in_python[0]["description"].endswith("...")
+    assert in_python[0]["image_urls"] == ["a.jpg", "b.jpg"]
+    assert in_db == in_python
@@ -0,0 +1,72 @@
+import asyncio
+import asyncpg
+from tests.conftest import TEST_DATABASE_URL, run_sql
+
+INSERT_MESSAGE = """
+INSERT INTO messages (sender_id, recipient_id, ad_id, text)
+VALUES ($1, $2, $3, $4) RETURNING id
+"""
+
+
+class ConnectedRequest:
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+async def next_message(events) -> tuple:
+    """(id события, id сообщения) следующего сообщения потока"""
+    while True:
+        chunk = await asyncio.wait_for(events.__anext__(), 5)
+        if chunk.startswith(b"id: "):
+            lines = dict(line.split(": ", 1) for line in chunk.decode().strip().split("\n"))
+            return lines["id"], lines["data"]
+
+
+async def reconnect_after_late_commit(market) -> tuple:
+    from app.api.v1.messages import message_events
+    from app.core.cursors import decode_cursor
+    from datetime import datetime
+    from uuid import UUID
+
+    slow = await asyncpg.connect(TEST_DATABASE_URL)
+    fast = await asyncpg.connect(TEST_DATABASE_URL)
+    try:
+        events = message_events(ConnectedRequest(), market["seller"], None)
+        await events.__anext__()
+
+        # Транзакция начата раньше (sent_at меньше), а фиксируется позже. Сообщения
+        # в разных диалогах и разным получателям: блокировки строк их не упорядочивают
+        transaction = slow.transaction()
+        await transaction.start()
+        late_id = await slow.fetchval(
+            INSERT_MESSAGE, market["seller"], market["buyer"], market["ad_id"], "Начато первым")
+        early_id = await fast.fetchval(
+            INSERT_MESSAGE, market["buyer"], market["seller"], market["other_ad_id"],
+            "Зафиксировано первым")
+
+        event_id, data = await next_message(events)
+        assert str(early_id) in data
+        await events.aclose()
+        await transaction.commit()
+
+        position = decode_cursor(event_id, int, datetime, UUID)
+        events = message_events(ConnectedRequest(), market["seller"], position)
+        await events.__anext__()
+        _, data = await next_message(events)
+        await events.aclose()
+        return str(late_id), data
+    finally:
+        await slow.close()
+        await fast.close()
+
+
+def test_reconnect_delivers_message_committed_after_cursor(client, market):
+    market["other_ad_id"] = run_sql(
+        "INSERT INTO ads (user_id, category_id, location_id, title, description, price, "
+        "moderation_status) SELECT user_id, category_id, location_id, title || ' 2', "
+        "description, price, moderation_status FROM ads WHERE id = $1 RETURNING id",
+        market["ad_id"])[0]["id"]
+
+    late_id, data = client.portal.call(
+        asyncio.wait_for, reconnect_after_late_commit(market), 30)
+    assert late_id in data
@@ -0,0 +1,104 @@
+from tests.conftest import run_sql
+
+API = "/api/v1/messages"
+
+
+def send(client, market, count: int) -> list:
+    ids = []
+    for i in range(count):
+        response = client.post(
+            f"{API}/",
+            params={"sender_id": str(market["buyer"])},
+            json={"recipient_id": str(market["seller"]), "ad_id": str(market["ad_id"]),
+                  "text": f"Ещё продаёте? {i}"}
+        )
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+    return ids
+
+
+def unread_count(client, user_id) -> int:
+    response = client.get(f"{API}/unread-count", params={"user_id": str(user_id)})
+    assert response.status_code == 200, response.text
+    return response.json()["unread_count"]
+
+
+def test_mark_message_read_decrements_unread_count(client, market):
+    ids = send(client, market, 3)
+    assert unread_count(client, market["seller"]) == 3
+
+    response = client.put(f"{API}/{ids[0]}/read", params={"user_id": str(market["seller"])})
+    assert response.status_code == 200, response.text
+    assert unread_count(client, market["seller"]) == 2
+
+    response = client.put(f"{API}/{ids[0]}/read", params={"user_id": str(market["seller"])})
+    assert response.json() == {"message": "Сообщение уже прочитано"}
+    assert unread_count(client, market["seller"]) == 2
+
+
+def read_flags(ids) -> dict:
+    rows = run_sql("SELECT id, is_read FROM messages WHERE id = ANY($1::uuid[])", ids)
+    return {str(row["id"]): row["is_read"] for row in rows}
+
+
+def test_mark_messages_read_by_ids(client, market):
+    ids = send(client, market, 4)
+
+    response = client.put(
+        f"{API}/read",
+        params={"user_id": str(market["seller"])},
+        json={"message_ids": ids[:2] + ids[:1]}
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["marked"] == 2
+    assert sorted(response.json()["ids"]) == sorted(ids[:2])
+    assert read_flags(ids) == {ids[0]: True, ids[1]: True, ids[2]: False, ids[3]: False}
+    assert unread_count(client, market["seller"]) == 2
+
+    # Отправитель не получатель: его отметка ничего не меняет
+    response = client.put(
+        f"{API}/read", params={"user_id": str(market["buyer"])}, json={"message_ids": ids})
+    assert response.json()["marked"] == 0
+    assert unread_count(client, market["seller"]) == 2
+
+
+def test_mark_conversation_read(client, market):
+    ids = send(client, market, 4)
+    conversation_id = run_sql(
+        "SELECT conversation_id FROM messages WHERE id = $1", ids[0])[0]["conversation_id"]
+    path = f"{API}/conversations/{conversation_id}/read"
+
+    response = client.put(
+        path, params={"user_id": str(market["seller"]), "up_to_message_id": ids[1]})
+    assert response.status_code == 200, response.text
+    assert response.json() == {"marked": 2}
+    assert read_flags(ids) == {ids[0]: True, ids[1]: True, ids[2]: False, ids[3]: False}
+    assert unread_count(client, market["seller"]) == 2
+    assert run_sql(
+        "SELECT unread_a + unread_b AS unread FROM conversations WHERE id = $1",
+        conversation_id)[0]["unread"] == 2
+
+    response = client.put(path, params={"user_id": str(market["seller"])})
+    assert response.json() == {"marked": 2}
+    assert all(read_flags(ids).values())
+    assert unread_count(client, market["seller"]) == 0
+
+    response = client.put(
+        path, params={"user_id": str(market["seller"]), "up_to_message_id": ids[1]})
+    assert response.json() == {"marked": 0}
+
+    response = client.put(
+        path, params={"user_id": str(market["seller"]),
+                      "up_to_message_id": "00000000-0000-0000-0000-000000000000"})
+    assert response.status_code == 404, response.text
+
+
+def test_user_messages_match_message_schema(client, market):
+    ids = send(client, market, 1)
+    single = client.get(f"{API}/{ids[0]}").json()
+
+    response = client.get(f"{API}/user/{market['seller']}")
+    assert response.status_code == 200, response.text
+    [listed] = response.json()
+    assert listed["conversation_id"] == single["conversation_id"] is not None
+    assert set(listed) == set(single)